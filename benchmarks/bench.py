@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Scrape benchmark of the exporter against the fake VRage Remote API.
+
+For every world size a fake server is started, then every client mode is measured
+in a separate process: scrape latency percentiles, CPU time per scrape and peak RSS.
+A scrape is a full render of the registry with SpaceEngineersCollector, as on /metrics.
+
+Usage:
+    python3 -m benchmarks.bench --sizes small,medium --iterations 20 --save baseline.json
+    python3 -m benchmarks.bench --compare baseline.json
+"""
+
+import argparse
+import json
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+TOKEN = "dGVzdA=="
+
+SIZES = {
+    "small": dict(players=10, grids=100, asteroids=100, floating_objects=100),
+    "medium": dict(players=50, grids=2000, asteroids=500, floating_objects=2000),
+    "large": dict(players=200, grids=20000, asteroids=2000, floating_objects=20000)
+}
+
+MODES = {
+    "sync": dict(run_async=False, persistent=False),
+    "async": dict(run_async=True, persistent=False),
+    "persistent-sync": dict(run_async=False, persistent=True),
+    "persistent-async": dict(run_async=True, persistent=True)
+}
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Fake VRage server didn't start on port {port}")
+
+
+def start_fake_server(port: int, size: dict, latency: float = 0.0) -> subprocess.Popen:
+    args = [sys.executable, "-m", "benchmarks.fake_vrage", "--port", str(port), "--token", TOKEN]
+    args += ["--latency", str(latency)]
+    for key, value in size.items():
+        args += [f"--{key.replace('_', '-')}", str(value)]
+
+    process = subprocess.Popen(args)
+    wait_port(port)
+    return process
+
+
+def worker(port: int, mode: str, iterations: int) -> dict:
+    """Measure scrapes of one client mode in the current process."""
+    from prometheus_client import CollectorRegistry, generate_latest
+    from se_exporter.client.prometheus import SpaceEngineersCollector
+    from se_exporter.client.vrage import VRageAPI
+
+    client = VRageAPI(
+        host="127.0.0.1",
+        port=port,
+        token=TOKEN,
+        resource_intervals={res: 0 for res in VRageAPI.__RESOURCE_INTERVALS__},
+        **MODES[mode]
+    )
+    registry = CollectorRegistry()
+    registry.register(SpaceEngineersCollector(vrage_client=client))
+    generate_latest(registry)  # the first scrape is a warm up, it isn't measured
+
+    latencies = []
+    cpu_started = time.process_time()
+    for _ in range(iterations):
+        started = time.perf_counter()
+        generate_latest(registry)
+        latencies.append(time.perf_counter() - started)
+    cpu = time.process_time() - cpu_started
+    client.close()
+
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "cpu_ms": cpu / iterations * 1000,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def run_worker(port: int, mode: str, iterations: int) -> dict:
+    output = subprocess.check_output([
+        sys.executable, "-m", "benchmarks.bench", "--worker",
+        "--port", str(port), "--modes", mode, "--iterations", str(iterations)
+    ])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    columns = ("p50_ms", "p90_ms", "p99_ms", "cpu_ms", "max_rss_mb")
+    print(f"{'case':<28}" + "".join(f"{c:>18}" for c in columns))
+
+    for case, values in results.items():
+        row = f"{case:<28}"
+        for column in columns:
+            cell = f"{values[column]:.2f}"
+            if baseline and case in baseline and baseline[case][column]:
+                change = (values[column] - baseline[case][column]) / baseline[case][column] * 100
+                cell += f" ({change:+.0f}%)"
+            row += f"{cell:>18}"
+        print(row)
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Scrape benchmark of the SE exporter")
+    parser.add_argument("--sizes", default="small,medium", help=f"Comma separated, from: {','.join(SIZES)}")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma separated, from: {','.join(MODES)}")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake server response delay, seconds")
+    parser.add_argument("--save", metavar="file", help="Save results as JSON")
+    parser.add_argument("--compare", metavar="file", help="Compare results with saved JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    args = parse_args(argv)
+    if args.worker:
+        print(json.dumps(worker(args.port, args.modes, args.iterations)))
+        return
+
+    results = {}
+    for size in args.sizes.split(","):
+        port = free_port()
+        server = start_fake_server(port, SIZES[size], latency=args.latency)
+        try:
+            for mode in args.modes.split(","):
+                results[f"{size}/{mode}"] = run_worker(port, mode, args.iterations)
+        finally:
+            server.terminate()
+            server.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
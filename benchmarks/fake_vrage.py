@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Local stand-in for the VRage Remote API of Space Engineers Dedicated Server.
+
+Requests are authorized with the same HMAC scheme as the real server (and VRageAPI client):
+Authorization is "<nonce>:<base64 HMAC-SHA1 of 'uri\\r\\nnonce\\r\\ndate\\r\\n'>" signed by the base64 decoded key,
+reused nonces are rejected. Payloads are synthetic, world size, latency and errors are configurable.
+
+Usage:
+    python3 -m benchmarks.fake_vrage --port 8080 --token dGVzdA== --grids 5000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+from collections import deque
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BASEPATH = "/vrageremote/v1"
+
+
+class World:
+    """Synthetic game world. Session payloads are rendered once, only the server resource changes,
+    and floating objects too with churn: that many of the oldest ones despawn and new ones spawn on every request.
+    """
+    def __init__(
+        self,
+        players: int = 10,
+        grids: int = 100,
+        asteroids: int = 100,
+        floating_objects: int = 100,
+        characters: int = None,
+        planets: int = 8,
+        banned: int = 5,
+        kicked: int = 5,
+        seed: int = 42,
+        sim_speed: float = None,
+        cpu_load: float = None,
+        churn: int = 0
+    ):
+        self.random = random.Random(seed)
+        self.sim_speed = sim_speed
+        self.cpu_load = cpu_load
+        self.players = players
+        self.churn = churn
+        self.spawned = floating_objects
+        self.started = 0.0
+        self.payloads = {
+            "session/players": {"Players": [self.player(i) for i in range(players)]},
+            "session/planets": {"Planets": [self.entity(i, f"Planet {i}") for i in range(planets)]},
+            "session/characters": {"Characters": [self.character(i) for i in range(
+                players if characters is None else characters
+            )]},
+            "session/grids": {"Grids": [self.grid(i, players) for i in range(grids)]},
+            "session/asteroids": {"Asteroids": [self.entity(i, f"Asteroid {i}") for i in range(asteroids)]},
+            "session/floatingObjects": {"FloatingObjects": [self.floating_object(i) for i in range(floating_objects)]},
+            "admin/bannedPlayers": {"BannedPlayers": [self.banned(i) for i in range(banned)]},
+            "admin/kickedPlayers": {"KickedPlayers": [self.banned(i) for i in range(kicked)]}
+        }
+        self.bodies = {name: self.render(data) for name, data in self.payloads.items()}
+
+    def render(self, data: dict) -> bytes:
+        return json.dumps({"data": data, "meta": {"apiVersion": "1.0", "queryTime": 0.1}}).encode()
+
+    def position(self) -> dict:
+        # half of entities are piled up in a few hotspots, others are spread over the world
+        if self.random.random() < 0.5:
+            center = self.random.choice((-30000.0, 0.0, 45000.0))
+            return {axis: center + self.random.gauss(0, 300) for axis in "XYZ"}
+        return {axis: self.random.uniform(-100000, 100000) for axis in "XYZ"}
+
+    def player(self, i: int) -> dict:
+        return {
+            "SteamID": 76561198000000000 + i,
+            "DisplayName": f"Player {i}",
+            "FactionName": f"Faction {i % 7}",
+            "FactionTag": f"F{i % 7}",
+            "PromoteLevel": 0,
+            "Ping": self.random.randint(10, 250)
+        }
+
+    def entity(self, i: int, name: str) -> dict:
+        return {"DisplayName": name, "EntityId": 100000000 + i, "Position": self.position()}
+
+    def character(self, i: int) -> dict:
+        return {
+            "DisplayName": f"Player {i}",
+            "EntityId": 110000000 + i,
+            "Mass": 100.0,
+            "Position": self.position(),
+            "LinearSpeed": self.random.uniform(0, 10)
+        }
+
+    def grid(self, i: int, owners: int) -> dict:
+        owner = i % max(owners, 1)
+        return {
+            "DisplayName": f"Grid {i}",
+            "EntityId": 120000000 + i,
+            "GridSize": self.random.choice(("Large", "Small")),
+            "BlocksCount": self.random.randint(1, 5000),
+            "Mass": self.random.uniform(100, 1e6),
+            "Position": self.position(),
+            "LinearSpeed": self.random.uniform(0, 100),
+            "DistanceToPlayer": self.random.uniform(0, 50000),
+            "OwnerSteamId": 76561198000000000 + owner,
+            "OwnerDisplayName": f"Player {owner}",
+            "IsPowered": self.random.random() < 0.7,
+            "PCU": self.random.randint(1, 20000)
+        }
+
+    def floating_object(self, i: int) -> dict:
+        return {
+            "DisplayName": self.random.choice(("Iron Ore", "Stone", "Ice", "Steel Plate")),
+            "EntityId": 130000000 + i,
+            "Kind": "FloatingObject",
+            "Mass": self.random.uniform(1, 1000),
+            "Position": self.position(),
+            "LinearSpeed": 0.0,
+            "DistanceToPlayer": self.random.uniform(0, 50000)
+        }
+
+    def banned(self, i: int) -> dict:
+        return {"SteamID": 76561197000000000 + i, "DisplayName": f"Banned {i}"}
+
+    def floating_objects(self) -> bytes:
+        if self.churn:
+            objects = self.payloads["session/floatingObjects"]["FloatingObjects"]
+            del objects[:self.churn]
+            objects.extend(self.floating_object(i) for i in range(self.spawned, self.spawned + self.churn))
+            self.spawned += self.churn
+            self.bodies["session/floatingObjects"] = self.render(self.payloads["session/floatingObjects"])
+        return self.bodies["session/floatingObjects"]
+
+    def server(self) -> bytes:
+        return self.render({
+            "Game": "SpaceEngineers",
+            "IsReady": True,
+            "Players": self.players,
+            "ServerId": 1,
+            "ServerName": "Fake Server",
+            "SimSpeed": self.sim_speed if self.sim_speed is not None else round(self.random.uniform(0.6, 1.0), 2),
+            "SimulationCpuLoad": self.cpu_load if self.cpu_load is not None else round(self.random.uniform(10, 90), 1),
+            "TotalTime": int(asyncio.get_event_loop().time() - self.started),
+            "UsedPCU": 50000,
+            "PirateUsedPCU": 3000,
+            "Version": "1.197.073",
+            "WorldName": "Fake World"
+        })
+
+
+class FakeVRage:
+    """aiohttp application serving the world with the VRage Remote API authorization."""
+    def __init__(self, world: World, token: str, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.world = world
+        self.key = base64.b64decode(token)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._nonces = set()
+        self._nonce_order = deque(maxlen=100000)
+
+    def authorized(self, request: web.Request) -> bool:
+        date = request.headers.get("Date")
+        nonce, _, signature = request.headers.get("Authorization", "").partition(":")
+        if not date or not nonce or not signature or nonce in self._nonces:
+            return False
+
+        salt = f"{request.path}\r\n{nonce}\r\n{date}\r\n"
+        expected = base64.b64encode(hmac.new(self.key, salt.encode("utf-8"), hashlib.sha1).digest()).decode()
+        if not hmac.compare_digest(expected, signature):
+            return False
+
+        if len(self._nonce_order) == self._nonce_order.maxlen:
+            self._nonces.discard(self._nonce_order[0])
+        self._nonce_order.append(nonce)
+        self._nonces.add(nonce)
+        return True
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if not self.authorized(request):
+            return web.Response(status=403, text="Forbidden")
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            return web.Response(status=500, text="Internal Server Error")
+
+        resource = request.match_info["resource"]
+        if resource == "server":
+            body = self.world.server()
+        elif resource == "session/floatingObjects":
+            body = self.world.floating_objects()
+        elif resource in self.world.bodies:
+            body = self.world.bodies[resource]
+        else:
+            return web.Response(status=404, text="Not Found")
+
+        return web.Response(body=body, content_type="application/json")
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(BASEPATH + "/{resource:.+}", self.handle)
+        return app
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake VRage Remote API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--token", default="dGVzdA==", help="Base64 Remote API key")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--grids", type=int, default=100)
+    parser.add_argument("--asteroids", type=int, default=100)
+    parser.add_argument("--floating-objects", type=int, default=100)
+    parser.add_argument("--characters", type=int, default=None, help="Default: number of players")
+    parser.add_argument("--churn", type=int, default=0, help="Floating objects respawned on every request")
+    parser.add_argument("--latency", type=float, default=0.0, help="Response delay, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Max random extra delay, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--sim-speed", type=float, default=None, help="Fixed simulation speed. Default: random")
+    parser.add_argument("--cpu-load", type=float, default=None, help="Fixed simulation CPU load. Default: random")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    args = parse_args(argv)
+    world = World(
+        players=args.players,
+        grids=args.grids,
+        asteroids=args.asteroids,
+        floating_objects=args.floating_objects,
+        characters=args.characters,
+        sim_speed=args.sim_speed,
+        cpu_load=args.cpu_load,
+        churn=args.churn
+    )
+    server = FakeVRage(world, args.token, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    web.run_app(server.app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
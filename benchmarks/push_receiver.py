@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Local stub of a push receiver: Prometheus remote write and Pushgateway.
+
+Remote write requests (POST /api/v1/write) are snappy-decompressed and decoded, Pushgateway pushes
+(PUT or POST /metrics/job/...) are gunzipped and parsed as exposition text. Every request is logged
+with its size and the number of series and samples, GET /stats returns the totals as JSON.
+With --down-for the receiver answers 503 for the first seconds, to exercise the spool of the exporter.
+
+Usage:
+    python3 -m benchmarks.push_receiver --port 9201
+    se-exporter -h localhost -t key --push-url http://localhost:9201/api/v1/write --push-interval 15
+"""
+
+import argparse
+import gzip
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from se_exporter.utils.snappy import decompress
+
+
+def _varint(data: bytes, position: int) -> tuple:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def _fields(data: bytes):
+    position = 0
+    while position < len(data):
+        key, position = _varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = _varint(data, position)
+        elif wire_type == 1:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == 2:
+            size, position = _varint(data, position)
+            value, position = data[position:position + size], position + size
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type}")
+        yield number, value
+
+
+def parse_write_request(data: bytes) -> list:
+    """Returns series of a WriteRequest as (labels, [(value, timestamp ms), ...])."""
+    series = []
+    for _, timeseries in _fields(data):
+        labels, samples = {}, []
+        for number, value in _fields(timeseries):
+            if number == 1:
+                label = dict(_fields(value))
+                labels[label.get(1, b"").decode()] = label.get(2, b"").decode()
+            elif number == 2:
+                sample = dict(_fields(value))
+                samples.append((struct.unpack("<d", sample.get(1, bytes(8)))[0], sample.get(2, 0)))
+        series.append((labels, samples))
+    return series
+
+
+class Receiver:
+    def __init__(self, down_for: float = 0.0, fail_rate: float = 0.0, verbose: bool = False):
+        self.started = time.monotonic()
+        self.down_for = down_for
+        self.fail_rate = fail_rate
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.stats = dict(requests=0, rejected=0, bytes=0, series=0, samples=0, last_timestamp=0)
+
+    def failing(self) -> bool:
+        return time.monotonic() - self.started < self.down_for or random.random() < self.fail_rate
+
+    def remote_write(self, body: bytes, headers) -> str:
+        if headers.get("Content-Encoding") != "snappy":
+            raise ValueError("Content-Encoding must be snappy")
+        series = parse_write_request(decompress(body))
+        samples = sum(len(s) for _, s in series)
+        with self.lock:
+            self.stats["series"] += len(series)
+            self.stats["samples"] += samples
+            self.stats["last_timestamp"] = max((t for _, s in series for _, t in s), default=0)
+        if self.verbose:
+            for labels, values in series[:5]:
+                print(f"  {labels.get('__name__')} {len(values)} sample(s)")
+        return f"remote write {len(body)} bytes, {len(series)} series, {samples} samples"
+
+    def pushgateway(self, body: bytes, headers) -> str:
+        text = gzip.decompress(body) if headers.get("Content-Encoding") == "gzip" else body
+        samples = sum(1 for line in text.decode().splitlines() if line and not line.startswith("#"))
+        with self.lock:
+            self.stats["samples"] += samples
+        return f"pushgateway {len(body)} bytes, {samples} samples"
+
+
+def handler(receiver: Receiver):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def __reply(self, status: int, body: bytes = b"") -> None:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/stats":
+                return self.__reply(404)
+            with receiver.lock:
+                self.__reply(200, json.dumps(receiver.stats).encode())
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with receiver.lock:
+                receiver.stats["requests"] += 1
+            if receiver.failing():
+                with receiver.lock:
+                    receiver.stats["rejected"] += 1
+                print(f"{self.command} {self.path} 503")
+                return self.__reply(503)
+
+            try:
+                if self.path.startswith("/metrics/job/"):
+                    summary = receiver.pushgateway(body, self.headers)
+                else:
+                    summary = receiver.remote_write(body, self.headers)
+            except Exception as e:
+                print(f"{self.command} {self.path} 400 {type(e).__name__} - {e}")
+                return self.__reply(400, str(e).encode())
+
+            with receiver.lock:
+                receiver.stats["bytes"] += len(body)
+            print(f"{self.command} {self.path} 200 {summary}")
+            self.__reply(200)
+
+        do_PUT = do_POST
+
+    return Handler
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Stub push receiver for the SE exporter")
+    parser.add_argument("--port", type=int, default=9201)
+    parser.add_argument("--down-for", type=float, default=0.0, help="Answer 503 for the first seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--verbose", action="store_true", help="Print a few series of every request")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    args = parse_args(argv)
+    receiver = Receiver(down_for=args.down_for, fail_rate=args.fail_rate, verbose=args.verbose)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler(receiver))
+    print(f"Push receiver on 127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Replay benchmark of the collection pipeline on real payloads.
+
+Responses recorded with `se-exporter --record capture.bin` are replayed at max speed
+from memory-mapped reads, so decoding, mapping and rendering are measured without the network.
+A cycle is a full render of the registry with SpaceEngineersCollector, as on /metrics.
+
+Usage:
+    python3 -m benchmarks.replay capture.bin --cycles 1000
+    python3 -m benchmarks.replay capture.bin --cycles 200 --profile replay.pstats
+"""
+
+import argparse
+import cProfile
+import time
+
+from benchmarks.bench import percentile
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay benchmark of the SE exporter")
+    parser.add_argument("capture", help="Capture file recorded with --record")
+    parser.add_argument("--cycles", type=int, default=1000)
+    parser.add_argument("--change-detection", action="store_true", help="Skip decoding of identical responses")
+    parser.add_argument("--profile", metavar="file", help="Save cProfile stats of the cycles")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    args = parse_args(argv)
+
+    from prometheus_client import CollectorRegistry, generate_latest
+    from se_exporter.client.capture import CaptureReader
+    from se_exporter.client.prometheus import SpaceEngineersCollector
+    from se_exporter.client.vrage import VRageAPI
+
+    replay = CaptureReader(args.capture, speed="max")
+    client = VRageAPI(
+        host="localhost",
+        token="",
+        persistent=True,
+        resource_intervals={res: 0 for res in VRageAPI.__RESOURCE_INTERVALS__},
+        change_detection=args.change_detection,
+        replay=replay
+    )
+    registry = CollectorRegistry()
+    registry.register(SpaceEngineersCollector(vrage_client=client))
+    generate_latest(registry)  # the first cycle is a warm up, it isn't measured
+
+    profile = cProfile.Profile() if args.profile else None
+    if profile is not None:
+        profile.enable()
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        cycle_started = time.perf_counter()
+        generate_latest(registry)
+        latencies.append(time.perf_counter() - cycle_started)
+    elapsed = time.perf_counter() - started
+
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(args.profile)
+
+    client.close()
+    replay.close()
+
+    print(f"{args.cycles} cycles in {elapsed:.2f}s, {args.cycles / elapsed:.0f} cycles/s")
+    print(
+        f"p50 {percentile(latencies, 50) * 1000:.2f}ms, "
+        f"p90 {percentile(latencies, 90) * 1000:.2f}ms, "
+        f"p99 {percentile(latencies, 99) * 1000:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Startup benchmark of the exporter against the fake VRage Remote API.
+
+Every mode is started as a separate `se-exporter` process, /metrics is requested until
+it contains data of the world. Time to the first response and time to the first response
+with data are measured from the process start, the median of runs is reported.
+
+With --budget the exit status is 1 if time to data of any mode exceeds the budget, so CI can track it.
+
+Usage:
+    python3 -m benchmarks.startup --runs 5 --save startup.json
+    python3 -m benchmarks.startup --compare startup.json --budget 2.5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.bench import SIZES, TOKEN, free_port, percentile, start_fake_server
+
+MODES = {
+    "scrape": [],
+    "scrape-async": ["--run-async", "--persistent"],
+    "background": ["--background-polling", "--run-async", "--persistent"],
+    "asyncio": ["--server", "asyncio", "--run-async", "--persistent"]
+}
+
+DATA = b"\ntotal_grids{"
+
+
+def measure(port: int, mode: str, timeout: float = 30) -> dict:
+    """Start the exporter and poll /metrics until data is served."""
+    listen_port = free_port()
+    args = [
+        sys.executable, "-m", "se_exporter.main", "-h", "127.0.0.1", "-p", str(port), "-t", TOKEN,
+        "--listen-addr", "127.0.0.1", "--listen-port", str(listen_port), "--loglevel", "ERROR"
+    ]
+    url = f"http://127.0.0.1:{listen_port}/metrics"
+
+    started = time.perf_counter()
+    process = subprocess.Popen(args + MODES[mode])
+    first_response = None
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    body = response.read()
+            except OSError:
+                time.sleep(0.01)
+                continue
+
+            if first_response is None:
+                first_response = time.perf_counter() - started
+            if DATA in body:
+                return {"first_response_s": first_response, "first_data_s": time.perf_counter() - started}
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+
+    raise RuntimeError(f"The exporter didn't serve data in {timeout}s, mode {mode}")
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    columns = ("first_response_s", "first_data_s")
+    print(f"{'mode':<20}" + "".join(f"{c:>24}" for c in columns))
+
+    for mode, values in results.items():
+        row = f"{mode:<20}"
+        for column in columns:
+            cell = f"{values[column]:.3f}"
+            if baseline and mode in baseline and baseline[mode][column]:
+                change = (values[column] - baseline[mode][column]) / baseline[mode][column] * 100
+                cell += f" ({change:+.0f}%)"
+            row += f"{cell:>24}"
+        print(row)
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Startup benchmark of the SE exporter")
+    parser.add_argument("--size", default="medium", help=f"World size, one of: {','.join(SIZES)}")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma separated, from: {','.join(MODES)}")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake server response delay, seconds")
+    parser.add_argument("--budget", type=float, help="Max median time to data, seconds")
+    parser.add_argument("--save", metavar="file", help="Save results as JSON")
+    parser.add_argument("--compare", metavar="file", help="Compare results with saved JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    args = parse_args(argv)
+
+    results = {}
+    port = free_port()
+    server = start_fake_server(port, SIZES[args.size], latency=args.latency)
+    try:
+        for mode in args.modes.split(","):
+            runs = [measure(port, mode) for _ in range(args.runs)]
+            results[mode] = {key: percentile([run[key] for run in runs], 50) for key in runs[0]}
+    finally:
+        server.terminate()
+        server.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.budget is not None:
+        over = [mode for mode, values in results.items() if values["first_data_s"] > args.budget]
+        if over:
+            print(f"Time to data is over the budget of {args.budget}s: {', '.join(over)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""This module contains AsyncioServer class."""
+
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from se_exporter.client.api import SnapshotAPI
+from se_exporter.client.debug import DebugEndpoints
+from se_exporter.client.exposition import ExpositionCache
+from se_exporter.client.poller import VRagePoller
+from se_exporter.models.base import Base
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import REGISTRY, CollectorRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncioServer(Base):
+    """This object represents an HTTP server on one asyncio event loop,
+    which serves /metrics and /healthz and drives the poller on the same loop.
+
+    At most max_requests requests are processed at the same time, others get 503.
+    The exposition is rendered in a thread of the default executor, cached expositions are served from the loop.
+    SIGTERM and SIGINT stop the server gracefully. Debug endpoints are served under /debug/
+    and the snapshot API on /api/snapshot, if given. Long polls of the API count as requests.
+
+    Arguments:
+      :poller: VRagePoller
+      :registry: CollectorRegistry
+      :cache: ExpositionCache
+      :max_requests: int
+      :debug: DebugEndpoints
+      :api: SnapshotAPI
+
+    """
+    def __init__(
+        self,
+        poller: VRagePoller,
+        registry: CollectorRegistry = REGISTRY,
+        cache: ExpositionCache = None,
+        max_requests: int = 64,
+        debug: DebugEndpoints = None,
+        api: SnapshotAPI = None
+    ):
+        self.poller = poller
+        self.registry = registry
+        self.cache = cache
+        self.max_requests = max_requests or 64
+        self.debug = debug
+        self.api = api
+        self._in_flight = 0
+
+    @web.middleware
+    async def limit(self, request: web.Request, handler) -> web.Response:
+        if self._in_flight >= self.max_requests:
+            logger.warning(f"Too many concurrent requests, {request.path} rejected")
+            return web.Response(status=503, text="Too many concurrent requests\n")
+
+        self._in_flight += 1
+        try:
+            return await handler(request)
+        finally:
+            self._in_flight -= 1
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        # rendering runs the collectors, so it's done in a thread and doesn't block polling and other requests
+        loop = asyncio.get_event_loop()
+        if self.cache is None:
+            body = await loop.run_in_executor(None, generate_latest, self.registry)
+            return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+        if self.cache.stale:
+            await loop.run_in_executor(None, self.cache.get)
+        status, headers, body = self.cache.response(
+            if_none_match=request.headers.get("If-None-Match"),
+            accept_encoding=request.headers.get("Accept-Encoding")
+        )
+        return web.Response(status=status, body=body, headers=dict(headers))
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.Response(text="OK\n")
+
+    async def debug_endpoint(self, request: web.Request) -> web.Response:
+        status, headers, body = await self.debug.ahandle(request.path, dict(request.query))
+        return web.Response(status=status, body=body, headers=dict(headers))
+
+    async def snapshot(self, request: web.Request) -> web.Response:
+        status, headers, body = await self.api.ahandle(
+            dict(request.query),
+            if_none_match=request.headers.get("If-None-Match"),
+            accept=request.headers.get("Accept"),
+            accept_encoding=request.headers.get("Accept-Encoding")
+        )
+        return web.Response(status=status, body=body, headers=dict(headers))
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.limit])
+        app.router.add_get("/metrics", self.metrics)
+        app.router.add_get("/healthz", self.healthz)
+        if self.debug is not None:
+            app.router.add_get("/debug/{name}", self.debug_endpoint)
+        if self.api is not None:
+            app.router.add_get("/api/snapshot", self.snapshot)
+        return app
+
+    async def serve(self, addr: str = "0.0.0.0", port: int = 9122) -> None:
+        """Serve until SIGTERM or SIGINT, then stop polling and close the clients."""
+        loop = asyncio.get_event_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, addr, port).start()
+        logger.info(f"Serving the app on {addr}:{port}")
+
+        polling = asyncio.ensure_future(self.poller.run())
+        logger.info(f"Background polling of {len(self.poller.clients)} target(s) started on the server loop")
+
+        await stop.wait()
+        logger.info("Shutting down...")
+
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+        await runner.cleanup()
+        for client in self.poller.clients.values():
+            await client.aclose()
+            client.close()
+
+    def run(self, addr: str = "0.0.0.0", port: int = 9122) -> None:
+        """Run the server on a new event loop in the current thread."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.serve(addr, port))
+        finally:
+            loop.close()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""This module contains SnapshotAPI class."""
+
+import json
+import logging
+from time import monotonic
+from typing import Dict, List, Tuple
+
+from se_exporter.client.exposition import ExpositionCache
+from se_exporter.client.poller import VRagePoller
+from se_exporter.models.base import Base
+from se_exporter.utils.msgpack import packb
+
+logger = logging.getLogger(__name__)
+
+Response = Tuple[int, List[Tuple[str, str]], bytes]
+
+
+class SnapshotAPI(Base):
+    """This object represents a read-only API of the latest decoded snapshots of the poller,
+    so other consumers (dashboards, bots, scripts) don't have to request the VRage Remote API themselves:
+
+      /api/snapshot?format=json|msgpack&wait=30
+        server info, players and counts of entities of every target
+
+    The format is JSON by default, MessagePack if asked by the format parameter or by the Accept header.
+    Bodies are rendered once per new version of the poller and served with gzip and ETag support.
+    With If-None-Match and the wait parameter, the request is a long poll: it's answered as soon as
+    the next snapshot differs from the known one, or with 304 when wait seconds are passed.
+
+    Handlers return (status, headers, body), so they are served by both WSGI and asyncio servers.
+
+    Arguments:
+      :poller: VRagePoller
+
+    """
+    __MAX_WAIT__ = 60
+
+    def __init__(self, poller: VRagePoller):
+        self.poller = poller
+        self.caches = {
+            "json": ExpositionCache(None, self.__version, render=self.__json, content_type="application/json"),
+            "msgpack": ExpositionCache(None, self.__version, render=self.__msgpack, content_type="application/msgpack")
+        }
+
+    def __version(self) -> int:
+        return self.poller.version
+
+    def document(self) -> Dict:
+        """Returns the latest state of every target, taken from snapshots of the poller."""
+        version = self.poller.version
+        view = self.poller.targets
+        targets = []
+        for name in view.clients:
+            target = dict(name=name, up=view.up.get(name), timestamp=None)
+            snapshot = view.snapshots.get(name)
+            if snapshot is not None and snapshot.state is not None:
+                target.update(snapshot.state, timestamp=snapshot.timestamp)
+            targets.append(target)
+        return dict(version=version, targets=targets)
+
+    def __json(self) -> bytes:
+        return json.dumps(self.document(), separators=(",", ":"), default=str).encode("utf-8")
+
+    def __msgpack(self) -> bytes:
+        return packb(self.document())
+
+    def __format(self, query: Dict, accept: str = None) -> str:
+        if "format" in query:
+            return query["format"]
+        return "msgpack" if "msgpack" in (accept or "") else "json"
+
+    def __wait(self, query: Dict) -> float:
+        try:
+            wait = float(query.get("wait", 0))
+        except ValueError:
+            wait = 0
+        return min(max(wait, 0), self.__MAX_WAIT__)
+
+    def __response(self, fmt: str, if_none_match: str, accept_encoding: str) -> Response:
+        status, headers, body = self.caches[fmt].response(if_none_match, accept_encoding)
+        headers = [(key, "Accept, Accept-Encoding" if key == "Vary" else value) for key, value in headers]
+        return status, headers + [("Cache-Control", "no-cache")], body
+
+    def handle(
+        self,
+        query: Dict,
+        if_none_match: str = None,
+        accept: str = None,
+        accept_encoding: str = None
+    ) -> Response:
+        """Serve the snapshot, blocking the calling thread while waiting for the next one."""
+        fmt = self.__format(query, accept)
+        if fmt not in self.caches:
+            return self.__error(fmt)
+
+        deadline = monotonic() + self.__wait(query)
+        exposition = self.caches[fmt].get()
+        while exposition.match(if_none_match) and monotonic() < deadline:
+            self.poller.wait_version(exposition.version, deadline - monotonic())
+            exposition = self.caches[fmt].get()
+        return self.__response(fmt, if_none_match, accept_encoding)
+
+    async def ahandle(
+        self,
+        query: Dict,
+        if_none_match: str = None,
+        accept: str = None,
+        accept_encoding: str = None
+    ) -> Response:
+        """Coroutine version of handle() for a server running on the poller loop."""
+        fmt = self.__format(query, accept)
+        if fmt not in self.caches:
+            return self.__error(fmt)
+
+        deadline = monotonic() + self.__wait(query)
+        exposition = self.caches[fmt].get()
+        while exposition.match(if_none_match) and monotonic() < deadline:
+            await self.poller.await_version(exposition.version, deadline - monotonic())
+            exposition = self.caches[fmt].get()
+        return self.__response(fmt, if_none_match, accept_encoding)
+
+    def __error(self, fmt: str) -> Response:
+        text = f"Unknown format: {fmt}, use {' or '.join(self.caches)}\n"
+        return 400, [("Content-Type", "text/plain; charset=utf-8")], text.encode("utf-8")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""This module contains CircuitBreaker class."""
+
+from time import monotonic
+
+from se_exporter.models.base import Base
+
+
+class CircuitBreaker(Base):
+    """This object represents a circuit breaker of one VRage API resource.
+
+    After threshold consecutive failures the circuit opens and the resource isn't requested
+    for backoff seconds. Every next failure doubles the backoff up to max_backoff,
+    the first success closes the circuit.
+
+    Arguments:
+      :threshold: int
+      :backoff: float
+      :max_backoff: float
+
+    """
+    def __init__(self, threshold: int = 3, backoff: float = 30, max_backoff: float = 600):
+        self.threshold = max(threshold or 3, 1)
+        self.backoff = backoff or 30
+        self.max_backoff = max(max_backoff or 600, self.backoff)
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.open_until = 0.0
+
+    def allow(self, now: float = None) -> bool:
+        """Check whether the resource may be requested now."""
+        return (now or monotonic()) >= self.open_until
+
+    @property
+    def is_open(self) -> bool:
+        return not self.allow()
+
+    def success(self) -> None:
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def failure(self, now: float = None) -> float:
+        """Count the failure. Returns the backoff in seconds if the circuit is opened, 0 otherwise."""
+        self.consecutive_failures += 1
+        self.failures += 1
+
+        if self.consecutive_failures < self.threshold:
+            return 0.0
+
+        exponent = min(self.consecutive_failures - self.threshold, 32)
+        backoff = min(self.backoff * 2 ** exponent, self.max_backoff)
+        self.open_until = (now or monotonic()) + backoff
+        return backoff
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""This module contains CaptureWriter and CaptureReader of recorded VRage API traffic.
+
+A capture is an append-only file of records, each of them is a raw response body of
+one resource of one target:
+
+    magic | record header | target | resource | body | record header | ...
+
+The record header is (timestamp, status, target length, resource length, body length).
+Offsets and timestamps of records are appended to the index file next to the capture,
+so the capture is opened without reading bodies. Without the index, or if it's behind
+the capture after a crash, record headers are scanned instead.
+"""
+
+import logging
+import mmap
+import struct
+import threading
+from bisect import bisect_right
+from time import monotonic, time
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from se_exporter.models.base import Base
+from se_exporter.utils.decoder import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SECAPTURE\x01"
+_RECORD = struct.Struct("<dHHHI")
+_INDEX = struct.Struct("<Qd")
+
+
+class CaptureError(Exception):
+    """The capture is corrupted or doesn't contain the requested resource."""
+
+
+class CaptureWriter(Base):
+    """This object represents a recorder of VRage API responses into a capture file.
+    Records are appended and flushed one by one, so the capture stays readable if the exporter
+    is killed. One writer can be shared by clients of all targets.
+
+    Arguments:
+      :path: str
+
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        self._data = open(path, "ab")
+        if self._data.tell() == 0:
+            self._data.write(MAGIC)
+            self._data.flush()
+        self._index = open(f"{path}.idx", "ab")
+        logger.info(f"Recording VRage API responses to {path}")
+
+    def write(self, target: str, resource: str, status: int, body: bytes) -> None:
+        encoded_target = target.encode("utf-8")
+        encoded_resource = resource.encode("utf-8")
+        timestamp = time()
+
+        with self._lock:
+            offset = self._data.tell()
+            self._data.write(_RECORD.pack(
+                timestamp, status, len(encoded_target), len(encoded_resource), len(body)
+            ))
+            self._data.write(encoded_target)
+            self._data.write(encoded_resource)
+            self._data.write(body)
+            self._data.flush()
+
+            self._index.write(_INDEX.pack(offset, timestamp))
+            self._index.flush()
+            self.records += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._data.close()
+            self._index.close()
+
+
+class Record(NamedTuple):
+    """This object represents a position of one recorded response body in the capture."""
+    timestamp: float
+    status: int
+    start: int
+    size: int
+
+
+class CaptureReader(Base):
+    """This object represents a replay of a capture file through memory-mapped reads.
+
+    At realtime speed, the response of a resource is the last one recorded before the same time
+    since the start of the capture as passed since the start of the replay, the capture is looped.
+    At max speed, recorded responses of a resource are returned one after another, in a loop.
+
+    Responses of a target which isn't in the capture are taken from the only recorded target, if any.
+
+    Arguments:
+      :path: str
+      :speed: str
+
+    """
+    __SPEEDS__ = ("realtime", "max")
+
+    def __init__(self, path: str, speed: str = "realtime"):
+        if speed not in self.__SPEEDS__:
+            raise ValueError(f"Unknown replay speed: {speed}")
+
+        self.path = path
+        self.speed = speed
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise CaptureError(f"Not a capture file: {path}")
+
+        self._records = {}
+        self._timestamps = {}
+        self._cursors = {}
+        self.__load()
+        self.targets = sorted({target for target, _ in self._records})
+
+        timestamps = [t for values in self._timestamps.values() for t in values]
+        self.first = min(timestamps, default=0.0)
+        self.duration = max(timestamps, default=0.0) - self.first
+        self.started = monotonic()
+        logger.info(
+            f"Replaying {sum(len(r) for r in self._records.values())} responses of {len(self.targets)} target(s) "
+            f"from {path}, {self.duration:.0f}s recorded, {speed} speed"
+        )
+
+    def __offsets(self) -> Iterator[int]:
+        """Yield offsets of records from the index, then scan headers of records behind it."""
+        offset = len(MAGIC)
+        try:
+            with open(f"{self.path}.idx", "rb") as fh:
+                index = fh.read()
+        except FileNotFoundError:
+            index = b""
+
+        for i in range(len(index) // _INDEX.size):
+            offset, _ = _INDEX.unpack_from(index, i * _INDEX.size)
+            yield offset
+
+        if index:
+            offset = self.__next(offset)
+        while offset is not None and offset + _RECORD.size <= len(self._mmap):
+            yield offset
+            offset = self.__next(offset)
+
+    def __next(self, offset: int) -> Optional[int]:
+        if offset + _RECORD.size > len(self._mmap):
+            return None
+        _, _, target_size, resource_size, body_size = _RECORD.unpack_from(self._mmap, offset)
+        return offset + _RECORD.size + target_size + resource_size + body_size
+
+    def __load(self) -> None:
+        size = len(self._mmap)
+        for offset in self.__offsets():
+            if offset + _RECORD.size > size:
+                break
+
+            timestamp, status, target_size, resource_size, body_size = _RECORD.unpack_from(self._mmap, offset)
+            start = offset + _RECORD.size
+            if start + target_size + resource_size + body_size > size:
+                logger.warning(f"The last record of {self.path} is truncated, skipped")
+                break
+
+            target = self._mmap[start:start + target_size].decode("utf-8")
+            start += target_size
+            resource = self._mmap[start:start + resource_size].decode("utf-8")
+            start += resource_size
+
+            key = (target, resource)
+            self._records.setdefault(key, []).append(Record(timestamp, status, start, body_size))
+            self._timestamps.setdefault(key, []).append(timestamp)
+
+    def __key(self, target: str, resource: str) -> Tuple[str, str]:
+        if (target, resource) not in self._records and len(self.targets) == 1:
+            return self.targets[0], resource
+        return target, resource
+
+    def __select(self, key: Tuple[str, str]) -> Record:
+        records = self._records[key]
+        if self.speed == "max":
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return records[cursor % len(records)]
+
+        position = self.first + (monotonic() - self.started) % (self.duration or 1)
+        return records[max(bisect_right(self._timestamps[key], position) - 1, 0)]
+
+    def read(self, target: str, resource: str) -> Tuple[int, Iterator[bytes]]:
+        """Returns the status and chunks of the body of the next recorded response of the resource."""
+        key = self.__key(target, resource)
+        if key not in self._records:
+            raise CaptureError(f"{resource} of {target} isn't recorded in {self.path}")
+
+        record = self.__select(key)
+        end = record.start + record.size
+        chunks = (self._mmap[pos:min(pos + CHUNK_SIZE, end)] for pos in range(record.start, end, CHUNK_SIZE))
+        return record.status, chunks
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of recorded responses by resource."""
+        stats = {}
+        for (_, resource), records in self._records.items():
+            stats[resource] = stats.get(resource, 0) + len(records)
+        return stats
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""This module contains Profiler, MemoryTracer and DebugEndpoints for profiling of the running exporter."""
+
+import asyncio
+import cProfile
+import gc
+import io
+import logging
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from se_exporter.client.vrage import Metric, VRageAPI
+from se_exporter.models.base import Base
+
+logger = logging.getLogger(__name__)
+
+Response = Tuple[int, List[Tuple[str, str]], bytes]
+
+
+def _text(status: int, text: str) -> Response:
+    return status, [("Content-Type", "text/plain; charset=utf-8")], text.encode("utf-8")
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, func, timeout: float = 5) -> None:
+    """Call func on the thread of another event loop and wait for it."""
+    done = threading.Event()
+
+    def call():
+        try:
+            func()
+        finally:
+            done.set()
+
+    loop.call_soon_threadsafe(call)
+    done.wait(timeout)
+
+
+class Profiler(Base):
+    """This object represents a time-boxed cProfile of the collection code.
+
+    While profiling is running, collections wrapped with runcall() are profiled in their
+    own threads and event loops of the pollers are profiled as a whole.
+    Only one profiling can run at a time.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = None
+        self._loop_profiles = []
+        self._current = None
+
+    @property
+    def active(self) -> bool:
+        return self._profiles is not None
+
+    def __enable(self, profile: cProfile.Profile) -> bool:
+        try:
+            profile.enable()
+        except ValueError:  # since python 3.12 profiling is process wide and is already active
+            return False
+        return True
+
+    def runcall(self, func, *args):
+        """Call func, under a profile of the current thread if profiling is running."""
+        profiles = self._profiles
+        if profiles is None:
+            return func(*args)
+
+        profile = cProfile.Profile()
+        if not self.__enable(profile):
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            profiles.append(profile)
+
+    def start(self, loops: List[asyncio.AbstractEventLoop] = (), current_thread: bool = False) -> bool:
+        """Start profiling of the event loops and, optionally, of the current thread.
+        Returns False if another profiling is running.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+
+        self._profiles = []
+        self._loop_profiles = []
+        if current_thread:
+            self._current = cProfile.Profile()
+            if not self.__enable(self._current):
+                self._current = None
+
+        for loop in loops:
+            _call_soon(loop, lambda loop=loop: self.__enable_loop(loop))
+        return True
+
+    def __enable_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        profile = cProfile.Profile()
+        if self.__enable(profile):
+            self._loop_profiles.append((loop, profile))
+
+    def stop(self) -> Optional[pstats.Stats]:
+        """Stop profiling. Must be called from the thread which started it.
+        Returns merged stats or None if nothing was profiled.
+        """
+        profiles, self._profiles = self._profiles, None
+        try:
+            if self._current is not None:
+                self._current.disable()
+                profiles.append(self._current)
+                self._current = None
+
+            for loop, profile in self._loop_profiles:
+                _call_soon(loop, profile.disable)
+                profiles.append(profile)
+            self._loop_profiles = []
+        finally:
+            self._lock.release()
+
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+
+PROFILER = Profiler()
+
+
+class MemoryTracer(Base):
+    """This object represents tracemalloc snapshots of the exporter memory.
+    A snapshot marks a point in time, a diff compares the current memory with the last snapshot.
+    """
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def __take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ))
+
+    def handle(self, action: str, limit: int = 30) -> Response:
+        if not self._lock.acquire(blocking=False):
+            return _text(409, "Another tracemalloc action is running\n")
+
+        try:
+            if action == "start":
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.frames)
+                self._snapshot = self.__take()
+                return _text(200, f"Tracing started, {self.frames} frames\n")
+
+            if action == "stop":
+                tracemalloc.stop()
+                self._snapshot = None
+                return _text(200, "Tracing stopped\n")
+
+            if not tracemalloc.is_tracing():
+                return _text(409, "Tracing isn't started, use action=start\n")
+
+            current, peak = tracemalloc.get_traced_memory()
+            header = f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n\n"
+
+            if action == "snapshot":
+                self._snapshot = self.__take()
+                stats = self._snapshot.statistics("lineno")[:limit]
+            elif action == "diff":
+                stats = self.__take().compare_to(self._snapshot, "lineno")[:limit]
+            else:
+                return _text(400, f"Unknown action: {action}, use start, snapshot, diff or stop\n")
+
+            return _text(200, header + "".join(f"{stat}\n" for stat in stats))
+        finally:
+            self._lock.release()
+
+
+class DebugEndpoints(Base):
+    """This object represents opt-in debug endpoints of the exporter:
+
+      /debug/profile?seconds=10&sort=cumulative&limit=50&format=text|pstats
+        cProfile of the collection loop for given seconds
+      /debug/tracemalloc?action=start|snapshot|diff|stop&limit=30
+        tracemalloc snapshots and diffs between them
+      /debug/objects?limit=20
+        counts of live metric objects and decoded payloads
+
+    Handlers return (status, headers, body), so they are served by both WSGI and asyncio servers.
+    Every endpoint allows one request at a time, others get 409.
+
+    Arguments:
+      :clients: List[VRageAPI]
+      :poller: VRagePoller
+
+    """
+    __MAX_SECONDS__ = 60
+    __SORT_KEYS__ = ("cumulative", "tottime", "calls", "ncalls", "time", "filename", "name")
+
+    def __init__(self, clients: List[VRageAPI], poller=None):
+        self.clients = clients
+        self.poller = poller
+        self.profiler = PROFILER
+        self.tracer = MemoryTracer()
+        self._objects_lock = threading.Lock()
+
+    def __clients(self) -> List[VRageAPI]:
+        """Clients of the poller, which can be updated while running, or the given ones."""
+        if self.poller is not None:
+            return list(self.poller.clients.values())
+        return self.clients
+
+    def __loops(self) -> List[asyncio.AbstractEventLoop]:
+        threads = [client.loop for client in self.__clients()]
+        if self.poller is not None:
+            threads.append(self.poller.loop)
+
+        loops = []
+        for thread in threads:
+            if thread is not None and thread.running and thread.loop not in loops:
+                loops.append(thread.loop)
+        return loops
+
+    def __seconds(self, query: Dict) -> float:
+        try:
+            seconds = float(query.get("seconds", 10))
+        except ValueError:
+            seconds = 10
+        return min(max(seconds, 0.1), self.__MAX_SECONDS__)
+
+    def __limit(self, query: Dict, default: int) -> int:
+        try:
+            return max(int(query.get("limit", default)), 1)
+        except ValueError:
+            return default
+
+    def __render_profile(self, stats: Optional[pstats.Stats], seconds: float, query: Dict) -> Response:
+        if stats is None:
+            return _text(200, f"Nothing was collected in {seconds:.1f}s\n")
+
+        if query.get("format") == "pstats":
+            return 200, [("Content-Type", "application/octet-stream")], marshal.dumps(stats.stats)
+
+        sort = query.get("sort", "cumulative")
+        if sort not in self.__SORT_KEYS__:
+            sort = "cumulative"
+
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(self.__limit(query, 50))
+        return _text(200, f"Profile of the collection loop for {seconds:.1f}s\n" + stream.getvalue())
+
+    def profile(self, query: Dict) -> Response:
+        """Profile for given seconds, blocking the calling thread."""
+        seconds = self.__seconds(query)
+        if not self.profiler.start(self.__loops()):
+            return _text(409, "Profiling is already running\n")
+
+        try:
+            time.sleep(seconds)
+        finally:
+            stats = self.profiler.stop()
+        return self.__render_profile(stats, seconds, query)
+
+    async def aprofile(self, query: Dict) -> Response:
+        """Coroutine version of profile() for a server running on the poller loop."""
+        seconds = self.__seconds(query)
+        if not self.profiler.start(self.__loops(), current_thread=True):
+            return _text(409, "Profiling is already running\n")
+
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stats = self.profiler.stop()
+        return self.__render_profile(stats, seconds, query)
+
+    def trace(self, query: Dict) -> Response:
+        return self.tracer.handle(query.get("action", "snapshot"), self.__limit(query, 30))
+
+    def __payload_dicts(self, value) -> int:
+        """Count dicts reachable from a cached result, without recursion."""
+        stack, seen, dicts = [value], set(), 0
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+
+            if isinstance(obj, dict):
+                dicts += 1
+                stack.extend(obj.values())
+            elif isinstance(obj, (list, tuple)):
+                stack.extend(obj)
+            elif isinstance(obj, Metric):
+                stack.extend((obj.value, obj.labels))
+        return dicts
+
+    def objects(self, query: Dict) -> Response:
+        if not self._objects_lock.acquire(blocking=False):
+            return _text(409, "Objects are being counted already\n")
+
+        try:
+            counts = Counter(type(obj).__name__ for obj in gc.get_objects())
+        finally:
+            self._objects_lock.release()
+
+        lines = ["# Live objects"]
+        for name in ("Metric", "GaugeMetricFamily", "CounterMetricFamily", "Snapshot", "dict"):
+            lines.append(f"{name} {counts.get(name, 0)}")
+
+        lines.append("\n# Decoded payloads cached by clients")
+        for client in self.__clients():
+            cache = client.cache
+            dicts = sum(self.__payload_dicts(result) for _, result in cache.values())
+            lines.append(f"{client.name} resources={len(cache)} dicts={dicts}")
+
+        lines.append("\n# Most common types")
+        for name, number in counts.most_common(self.__limit(query, 20)):
+            lines.append(f"{name} {number}")
+        return _text(200, "\n".join(lines) + "\n")
+
+    def handle(self, path: str, query: Dict) -> Response:
+        """Serve the debug endpoint, blocking the calling thread."""
+        if path == "/debug/profile":
+            return self.profile(query)
+        if path == "/debug/tracemalloc":
+            return self.trace(query)
+        if path == "/debug/objects":
+            return self.objects(query)
+        return _text(404, "Not Found\n")
+
+    async def ahandle(self, path: str, query: Dict) -> Response:
+        """Coroutine version of handle()."""
+        if path == "/debug/profile":
+            return await self.aprofile(query)
+        return self.handle(path, query)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""This module contains Exposition and ExpositionCache classes and render_families function."""
+
+import gzip
+import hashlib
+import logging
+import re
+import threading
+from typing import Any, Callable, Iterable, List, NamedTuple, Tuple
+
+from se_exporter.models.base import Base
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+
+logger = logging.getLogger(__name__)
+
+_HEADER = re.compile(rb"^# HELP (\S+) .*\n# TYPE .*\n", re.MULTILINE)
+
+
+class _Families:
+    """Registry-like wrapper of metric families for generate_latest."""
+    def __init__(self, families: Iterable):
+        self.families = families
+
+    def collect(self) -> Iterable:
+        return self.families
+
+
+def render_families(families: Iterable) -> List[Tuple[str, bytes, bytes]]:
+    """Render every metric family separately. Returns (name, header, samples) of each section
+    of the exposition, where the header is HELP and TYPE lines, so families of several sources
+    can be merged by concatenation of their samples under one header.
+    A family can be rendered as several sections, e.g. _created samples of a histogram.
+    """
+    rendered = []
+    for family in families:
+        text = generate_latest(_Families([family]))
+        headers = list(_HEADER.finditer(text))
+        for i, header in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+            rendered.append((header.group(1).decode(), header.group(0), text[header.end():end]))
+    return rendered
+
+
+class Exposition(NamedTuple):
+    """This object represents a rendered exposition: plain and gzip-compressed bodies with their ETag."""
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    version: Any
+
+    def match(self, if_none_match: str = None) -> bool:
+        """Check the If-None-Match header value against the ETag."""
+        if not if_none_match:
+            return False
+
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or tag.lstrip("W/") == self.etag:
+                return True
+        return False
+
+
+class ExpositionCache(Base):
+    """This object represents the exposition text of a registry rendered once per new state.
+
+    The version function returns a value which changes when new data is available
+    (e.g. the snapshot version of a poller). The registry is rendered and compressed only
+    when the version differs from the cached one, all other requests get the cached bytes.
+    The render function, if given, is used instead of rendering the registry,
+    its bodies are served with the content type.
+
+    Arguments:
+      :registry: CollectorRegistry
+      :version: Callable
+      :render: Callable
+      :content_type: str
+
+    """
+    def __init__(
+        self,
+        registry: CollectorRegistry,
+        version: Callable[[], Any],
+        render: Callable[[], bytes] = None,
+        content_type: str = CONTENT_TYPE_LATEST
+    ):
+        self.registry = registry
+        self.version = version
+        self.render = render or (lambda: generate_latest(self.registry))
+        self.content_type = content_type
+        self._exposition = None
+        self._lock = threading.Lock()
+
+    def __render(self, version: Any) -> Exposition:
+        body = self.render()
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        logger.debug(f"Exposition rendered for version {version}, {len(body)} bytes")
+        return Exposition(body=body, gzip_body=gzip.compress(body, compresslevel=6), etag=etag, version=version)
+
+    @property
+    def stale(self) -> bool:
+        """Check whether the next get() has to render the exposition."""
+        exposition = self._exposition
+        return exposition is None or exposition.version != self.version()
+
+    def get(self) -> Exposition:
+        """Returns the exposition of the current version, rendering it if needed."""
+        version = self.version()
+        exposition = self._exposition
+        if exposition is not None and exposition.version == version:
+            return exposition
+
+        with self._lock:
+            if self._exposition is None or self._exposition.version != version:
+                self._exposition = self.__render(version)
+            return self._exposition
+
+    def response(self, if_none_match: str = None, accept_encoding: str = None) -> Tuple[int, List, bytes]:
+        """Returns status, headers and body of the response for the request headers."""
+        exposition = self.get()
+        headers = [("ETag", exposition.etag), ("Vary", "Accept-Encoding")]
+
+        if exposition.match(if_none_match):
+            return 304, headers, b""
+
+        body = exposition.body
+        if "gzip" in (accept_encoding or ""):
+            body = exposition.gzip_body
+            headers.append(("Content-Encoding", "gzip"))
+
+        headers.append(("Content-Type", self.content_type))
+        return 200, headers, body
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""This module contains self-instrumentation metrics of the VRage API collection pipeline."""
+
+from time import perf_counter
+from typing import Dict, Optional
+
+from se_exporter.models.base import Base
+from prometheus_client import Counter, Histogram
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+REQUEST_DURATION = Histogram(
+    "se_vrage_request_duration_seconds",
+    "Time of VRage API request including reading and decoding of the response",
+    ["target", "resource"],
+    buckets=LATENCY_BUCKETS
+)
+RESPONSE_BYTES = Histogram(
+    "se_vrage_response_bytes",
+    "Size of VRage API response body",
+    ["target", "resource"],
+    buckets=BYTES_BUCKETS
+)
+DECODE_DURATION = Histogram(
+    "se_vrage_decode_duration_seconds",
+    "Time spent decoding VRage API response body",
+    ["target", "resource"],
+    buckets=LATENCY_BUCKETS
+)
+MAPPING_DURATION = Histogram(
+    "se_vrage_mapping_duration_seconds",
+    "Time spent mapping decoded VRage API response to metrics",
+    ["target", "resource"],
+    buckets=LATENCY_BUCKETS
+)
+RESPONSES = Counter(
+    "se_vrage_responses",
+    "Number of VRage API responses by HTTP status",
+    ["target", "resource", "status"]
+)
+UNCHANGED_RESPONSES = Counter(
+    "se_vrage_unchanged_responses",
+    "Number of VRage API responses identical to the previous one, whose decoding was skipped",
+    ["target", "resource"]
+)
+ERRORS = Counter(
+    "se_vrage_errors",
+    "Number of failed VRage API requests by error type",
+    ["target", "resource", "error"]
+)
+
+
+class MeteredDecoder(Base):
+    """This object represents a wrapper of a response decoder which measures
+    the size of the body and time spent in decoding, apart from the network time.
+    """
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.size = 0
+        self.duration = 0.0
+        self.started = perf_counter()
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        started = perf_counter()
+        self.decoder.feed(chunk)
+        self.duration += perf_counter() - started
+
+    def result(self) -> Optional[Dict]:
+        started = perf_counter()
+        result = self.decoder.result()
+        self.duration += perf_counter() - started
+        return result
+
+    def observe(self, target: str, resource: str) -> None:
+        """Record request duration, response size and decoding time of the resource."""
+        REQUEST_DURATION.labels(target, resource).observe(perf_counter() - self.started)
+        RESPONSE_BYTES.labels(target, resource).observe(self.size)
+        DECODE_DURATION.labels(target, resource).observe(self.duration)
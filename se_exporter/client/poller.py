@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""This module contains Snapshot, Targets and VRagePoller classes."""
+
+import asyncio
+import logging
+import threading
+from time import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from se_exporter.client.debug import PROFILER
+from se_exporter.client.vrage import VRageAPI
+from se_exporter.models.base import Base
+from se_exporter.utils.loop import EventLoopThread
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(NamedTuple):
+    """This object represents an immutable result of one successful collection cycle.
+    The state is the decoded server info, players and counts of the target, see VRageAPI.snapshot().
+    """
+    metrics: Tuple
+    timestamp: float
+    state: Dict = None
+
+    @property
+    def age(self) -> float:
+        return max(time() - self.timestamp, 0.0)
+
+
+class Targets(NamedTuple):
+    """This object represents a consistent view of polled targets: clients, their snapshots and poll results.
+    The view is replaced as a whole on update of the targets, so a reader never sees a half-applied update.
+    """
+    clients: Dict[str, VRageAPI]
+    snapshots: Dict[str, Snapshot]
+    up: Dict[str, bool]
+
+
+class VRagePoller(Base):
+    """This object represents a background scheduler which polls one or many VRage API targets
+    on its own interval and keeps the latest snapshot of metrics for each of them.
+
+    All targets are polled concurrently from one asyncio event loop, with at most
+    max_concurrency collections in flight. Every target has its own timeout and snapshot,
+    so one hung server doesn't stall the others. The timeout defaults to the collection timeout
+    of the client, derived from its request timeout or deadline.
+
+    Sync collections run in threads, which can't be cancelled: a collection which has timed out
+    keeps its slot of max_concurrency until its thread finishes, and the next poll of the target
+    awaits it instead of starting another one, so a slow server doesn't get more load.
+
+    The version is incremented after every poll, so consumers can detect new state cheaply
+    and wait for the next one with wait_version() or await_version().
+
+    Targets can be added, removed or replaced with update() while polling, others are polled on.
+
+    Arguments:
+      :clients: List[VRageAPI]
+      :interval: float
+      :max_concurrency: int
+      :timeout: float
+      :loop: EventLoopThread
+
+    """
+    def __init__(
+        self,
+        clients: List[VRageAPI],
+        interval: float = 15,
+        max_concurrency: int = 4,
+        timeout: float = None,
+        loop: EventLoopThread = None
+    ):
+        self.interval = float(interval or 15)
+        self.max_concurrency = max_concurrency or 4
+        self.timeout = float(timeout) if timeout else None
+        self.loop = loop
+        self.version = 0
+        self._changed = threading.Condition()
+        self._waiters = set()
+        self._targets = Targets(clients={client.name: client for client in clients}, snapshots={}, up={})
+        self._tasks = {}
+        self._running = None
+        self._semaphore = None
+        self._collections = {}
+        self._future = None
+
+    @property
+    def clients(self) -> Dict[str, VRageAPI]:
+        """Returns polled clients keyed by target name. The dict isn't changed by updates, they replace it."""
+        return self._targets.clients
+
+    @property
+    def snapshots(self) -> Dict[str, Snapshot]:
+        """Returns the latest successful snapshot of each target, keyed by target name."""
+        return dict(self._targets.snapshots)
+
+    @property
+    def targets(self) -> Targets:
+        """Returns a consistent view of clients, snapshots and poll results."""
+        targets = self._targets
+        return Targets(clients=targets.clients, snapshots=dict(targets.snapshots), up=dict(targets.up))
+
+    def up(self, name: str) -> Optional[bool]:
+        """Returns the result of the last poll of the target or None if it wasn't polled yet."""
+        return self._targets.up.get(name)
+
+    def __resolve(self, future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(self.version)
+
+    def __changed(self) -> None:
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+        for future in list(self._waiters):
+            future.get_loop().call_soon_threadsafe(self.__resolve, future)
+
+    def wait_version(self, version: int, timeout: float) -> int:
+        """Block until the version differs from the given one or the timeout expires.
+        Returns the current version.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    async def await_version(self, version: int, timeout: float) -> int:
+        """Coroutine version of wait_version(), it doesn't block the event loop."""
+        if self.version != version:
+            return self.version
+
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.add(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.discard(future)
+        return self.version
+
+    def __timeout(self, client: VRageAPI) -> float:
+        return self.timeout or client.collection_timeout
+
+    def __collected(self, client: VRageAPI, semaphore: asyncio.Semaphore, future: asyncio.Future) -> None:
+        semaphore.release()
+        if self._collections.get(client) is future:
+            del self._collections[client]
+        if not future.cancelled():
+            future.exception()  # retrieved, even if the poll which awaited it has timed out
+
+    async def __collect(self, client: VRageAPI) -> List:
+        if client.persistent and client.run_async:
+            async with self._semaphore:
+                return await asyncio.wait_for(client.acollect(), self.__timeout(client))
+
+        future = self._collections.get(client)
+        if future is None:
+            semaphore = self._semaphore
+            await semaphore.acquire()
+            future = asyncio.get_event_loop().run_in_executor(None, PROFILER.runcall, client.metrics)
+            future.add_done_callback(lambda f: self.__collected(client, semaphore, f))
+            self._collections[client] = future
+        else:
+            logger.warning(f"The previous collection of {client.name} is still running, it's awaited")
+        return await asyncio.wait_for(asyncio.shield(future), self.__timeout(client))
+
+    async def poll(self, client: VRageAPI) -> Optional[Snapshot]:
+        """Run one collection cycle of the target and replace its snapshot on success."""
+        try:
+            metrics = await self.__collect(client)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self.__current(client):
+                self._targets.up[client.name] = False
+                self.__changed()
+            logger.error(f"Background polling of {client.name} failed. {type(e).__name__} - {e}")
+            return
+
+        if not self.__current(client):
+            return  # the target was removed or replaced during the poll
+
+        snapshot = Snapshot(
+            metrics=tuple(m for m in metrics if m is not None),
+            timestamp=time(),
+            state=client.snapshot()
+        )
+        self._targets.snapshots[client.name] = snapshot
+        self._targets.up[client.name] = True
+        self.__changed()
+        logger.debug(f"New snapshot collected from {client.name}, {len(snapshot.metrics)} metrics")
+        return snapshot
+
+    async def __run_target(self, client: VRageAPI) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            started = loop.time()
+            await self.poll(client)
+            await asyncio.sleep(max(self.interval - (loop.time() - started), 0))
+
+    def __current(self, client: VRageAPI) -> bool:
+        return self._targets.clients.get(client.name) is client
+
+    def __schedule(self) -> None:
+        """Start polling of new clients and stop polling of removed or replaced ones."""
+        clients = self._targets.clients
+        for name, (client, task) in list(self._tasks.items()):
+            if clients.get(name) is not client:
+                task.cancel()
+                del self._tasks[name]
+
+        for name, client in clients.items():
+            if name not in self._tasks:
+                self._tasks[name] = (client, asyncio.ensure_future(self.__run_target(client)))
+
+    async def run(self) -> None:
+        """Poll all targets until cancelled."""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._running = asyncio.get_event_loop()
+        self.__schedule()
+        try:
+            await self._running.create_future()  # targets are polled by their own tasks
+        finally:
+            tasks = [task for _, task in self._tasks.values()]
+            self._tasks = {}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._running = None
+
+    async def __update(self, clients: List[VRageAPI]) -> List[VRageAPI]:
+        current = self._targets
+        updated = {client.name: client for client in clients}
+
+        # snapshots of replaced targets are served until their first poll, so there's no gap
+        self._targets = Targets(
+            clients=updated,
+            snapshots={name: s for name, s in current.snapshots.items() if name in updated},
+            up={name: up for name, up in current.up.items() if name in updated}
+        )
+        if self._running is not None:
+            self.__schedule()
+        self.__changed()
+
+        retired = [client for name, client in current.clients.items() if updated.get(name) is not client]
+        for client in retired:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.debug(f"Can't close the session of {client.name}. {type(e).__name__} - {e}")
+        return retired
+
+    def update(self, clients: List[VRageAPI], timeout: float = 10) -> None:
+        """Replace polled targets by the clients, from any thread. Targets with the same client are polled on,
+        removed and replaced clients are closed.
+        """
+        running = self._running
+        if running is not None and running.is_running():
+            retired = asyncio.run_coroutine_threadsafe(self.__update(clients), running).result(timeout)
+        else:
+            loop = asyncio.new_event_loop()
+            try:
+                retired = loop.run_until_complete(self.__update(clients))
+            finally:
+                loop.close()
+
+        for client in retired:
+            client.close()
+
+    def start(self) -> None:
+        """Start polling on the event loop thread."""
+        if self._future is not None and not self._future.done():
+            return
+
+        if self.loop is None:
+            self.loop = EventLoopThread(name="vrage-poller")
+
+        self._future = asyncio.run_coroutine_threadsafe(self.run(), self.loop.loop)
+        logger.info(
+            f"Background polling of {len(self.clients)} target(s) started, "
+            f"interval {self.interval}s, concurrency {self.max_concurrency}"
+        )
+
+    def stop(self) -> None:
+        """Stop polling."""
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
@@ -2,109 +2,237 @@
 """This module contains SpaceEngineersCollector and SpaceEngineersExporter classes."""
 
 import logging
+import signal
+import sys
+import threading
 import time
+from itertools import chain
+from typing import TYPE_CHECKING, Optional
 
+from se_exporter.client.api import SnapshotAPI
+from se_exporter.client.debug import PROFILER, DebugEndpoints
+from se_exporter.client.exposition import ExpositionCache
+from se_exporter.client.poller import Targets, VRagePoller
 from se_exporter.client.vrage import VRageAPI
+from se_exporter.client.wsgi import ExporterApp, start_wsgi_server
 from se_exporter.models.base import Base
-from prometheus_client import Summary, start_wsgi_server
-from prometheus_client.core import REGISTRY, GaugeMetricFamily
+from prometheus_client import Summary
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+
+if TYPE_CHECKING:  # the asyncio server, worker processes and push are imported by the mode which uses them
+    from se_exporter.client.push import Pusher
+    from se_exporter.client.supervisor import Supervisor
 
 logger = logging.getLogger(__name__)
 
 
 class SpaceEngineersCollector(Base):
-    """This object represents a metrics collector for Space Engineers Server."""
-    def __init__(self, vrage_client: VRageAPI = None):
+    """This object represents a metrics collector for Space Engineers Server.
+    If the poller is passed, metrics are taken from its latest snapshot
+    instead of requesting VRage API on every scrape.
+
+    Without the poller, the first collection can be started in the background with warm_up(),
+    so resources with long refresh intervals are already cached by the first scrape.
+    """
+    def __init__(self, vrage_client: VRageAPI = None, poller: VRagePoller = None):
         self.vrage_client = vrage_client
+        self.poller = poller
         self.summary = Summary(
             "se_request_processing",
             "Time spent collecting SE server data"
         )
+        self._warm_up = None
+
+    def describe(self) -> list:
+        """Metrics aren't described in advance, so the registration doesn't run a collection."""
+        return []
+
+    def __run_warm_up(self) -> None:
+        try:
+            self.vrage_client.metrics()
+        except Exception as e:
+            logger.warning(f"The first collection failed. {type(e).__name__} - {e}")
+
+    def warm_up(self) -> None:
+        """Start the first collection in the background."""
+        if self.poller is None and self._warm_up is None:
+            self._warm_up = threading.Thread(target=self.__run_warm_up, name="se-warm-up", daemon=True)
+            self._warm_up.start()
 
     def collect(self) -> GaugeMetricFamily:
         """Collect Space Engineers metrics from VRage API and convert to prometheus format."""
         logger.debug(f"Starting collect SE metrics...")
 
+        # one view of the targets per scrape, so an update of targets is never half-applied in it
+        targets = self.poller.targets if self.poller is not None else None
         with self.summary.time():
+            common = self.__common_labels(targets)
+            group = ["faction", "owner_id", "owner_name"]
+            extra_labels = {
+                "grids_pcu_used": common + group,
+                "grids_blocks": common + group,
+                "grids_count": common + group + ["powered"],
+                "entity_density_cells": common + ["entity"],
+                "entity_density_top": common + ["entity", "rank"],
+                "entity_density_top_x": common + ["entity", "rank"],
+                "entity_density_top_y": common + ["entity", "rank"],
+                "entity_density_top_z": common + ["entity", "rank"],
+                "entity_density_quantile": common + ["entity", "quantile"],
+                "entity_created": common + ["entity"],
+                "entity_removed": common + ["entity"],
+                "sim_speed_window": common + ["window", "stat"],
+                "simulation_cpu_load_window": common + ["window", "stat"]
+            }
             prometheus_metrics = {
                 "players": GaugeMetricFamily(
                     "players_count",
                     "Number of online players on the server",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "is_ready": GaugeMetricFamily(
                     "server_is_ready",
                     "The server is ready to connect players",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "player_ping": GaugeMetricFamily(
                     "player_ping",
                     "Just players ping",
-                    labels=["server", "world", "player_name", "player_id", "faction"]
+                    labels=common + ["player_name", "player_id", "faction"]
+                ),
+                "player_ping_distribution": HistogramMetricFamily(
+                    "player_ping_distribution",
+                    "Distribution of players ping, milliseconds",
+                    labels=common + ["faction"]
                 ),
                 "planets": GaugeMetricFamily(
                     "planets_count",
                     "Number of planets in the game world",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "sim_speed": GaugeMetricFamily(
                     "simulation_speed",
                     "Currnet simulation speed in the game world",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "simulation_cpu_load": GaugeMetricFamily(
                     "simulation_cpu_load",
                     "CPU load generated by the simulation",
-                    labels=["server", "world"]
+                    labels=common
+                ),
+                "sim_speed_window": GaugeMetricFamily(
+                    "simulation_speed_window",
+                    "Min, max, mean and quantiles of the simulation speed sampled over the window",
+                    labels=extra_labels["sim_speed_window"]
+                ),
+                "simulation_cpu_load_window": GaugeMetricFamily(
+                    "simulation_cpu_load_window",
+                    "Min, max, mean and quantiles of the simulation CPU load sampled over the window",
+                    labels=extra_labels["simulation_cpu_load_window"]
                 ),
                 "total_time": GaugeMetricFamily(
                     "server_game_uptime_seconds",
                     "Time during which the server is ready to play",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "used_pcu": GaugeMetricFamily(
                     "total_pcu_used",
                     "Number of total used PCU on the server",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "pirate_used_pcu": GaugeMetricFamily(
                     "pirate_total_pcu_used",
                     "Number of total used PCU by Pirates on the server",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "grids": GaugeMetricFamily(
                     "total_grids",
                     "Count of total grids on the game world",
-                    labels=["server", "world"]
+                    labels=common
+                ),
+                "grids_pcu_used": GaugeMetricFamily(
+                    "grids_pcu_used",
+                    "Number of PCU used by grids of the faction or owner, factions are known for online owners only",
+                    labels=extra_labels["grids_pcu_used"]
+                ),
+                "grids_blocks": GaugeMetricFamily(
+                    "grids_blocks",
+                    "Number of blocks of grids of the faction or owner, factions are known for online owners only",
+                    labels=extra_labels["grids_blocks"]
+                ),
+                "grids_count": GaugeMetricFamily(
+                    "grids_count",
+                    "Number of powered and unpowered grids of the faction or owner, factions of online owners only",
+                    labels=extra_labels["grids_count"]
+                ),
+                "entity_density_cells": GaugeMetricFamily(
+                    "entity_density_cells",
+                    "Number of cells of the density grid occupied by entities",
+                    labels=extra_labels["entity_density_cells"]
+                ),
+                "entity_density_top": GaugeMetricFamily(
+                    "entity_density_top",
+                    "Number of entities in the densest cells of the density grid, by rank",
+                    labels=extra_labels["entity_density_top"]
+                ),
+                "entity_density_top_x": GaugeMetricFamily(
+                    "entity_density_top_x",
+                    "X coordinate of the center of the densest cells of the density grid, by rank",
+                    labels=extra_labels["entity_density_top_x"]
+                ),
+                "entity_density_top_y": GaugeMetricFamily(
+                    "entity_density_top_y",
+                    "Y coordinate of the center of the densest cells of the density grid, by rank",
+                    labels=extra_labels["entity_density_top_y"]
+                ),
+                "entity_density_top_z": GaugeMetricFamily(
+                    "entity_density_top_z",
+                    "Z coordinate of the center of the densest cells of the density grid, by rank",
+                    labels=extra_labels["entity_density_top_z"]
+                ),
+                "entity_density_quantile": GaugeMetricFamily(
+                    "entity_density_quantile",
+                    "Quantiles of the number of entities per occupied cell of the density grid",
+                    labels=extra_labels["entity_density_quantile"]
+                ),
+                "entity_created": CounterMetricFamily(
+                    "entity_created",
+                    "Number of grids, characters or floating objects created since the exporter start",
+                    labels=extra_labels["entity_created"]
+                ),
+                "entity_removed": CounterMetricFamily(
+                    "entity_removed",
+                    "Number of grids, characters or floating objects removed since the exporter start",
+                    labels=extra_labels["entity_removed"]
                 ),
                 "asteroids": GaugeMetricFamily(
                     "total_asteroids",
                     "Count of total asteroids on the game world",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "floating_objects": GaugeMetricFamily(
                     "total_floating_objects",
                     "Count of total floating objects on the game world",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "characters": GaugeMetricFamily(
                     "characters_count",
                     "Count of total characters (including disconnected, but are on the server) on the game world",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "banned_players": GaugeMetricFamily(
                     "total_banned_players",
                     "Count of total banned players on the game world",
-                    labels=["server", "world"]
+                    labels=common
                 ),
                 "kicked_players": GaugeMetricFamily(
                     "total_kicked_players",
                     "Count of total kicked players on the game world",
-                    labels=["server", "world"]
+                    labels=common
                 )
             }
 
-            for m in self.vrage_client.metrics():
+            label_values = {}
+            for m in chain(self.__metrics(targets), self.__window_metrics(targets)):
                 if m.name not in prometheus_metrics.keys():
                     if m.name != "version":
                         logger.debug(f"Unhandled metric received, {m}")
@@ -117,42 +245,275 @@ class SpaceEngineersCollector(Base):
                         logger.debug(f"Bad metric fetched: {m}")  # because Remote API very strange :/
 
                     elif m.name == "player_ping":
+                        labels = dict(m.labels)
                         pm.add_metric(
-                            [m.server, m.world, m.player_name, m.player_id, m.faction],
+                            [labels.get(label, "") for label in common] + [m.player_name, m.player_id, m.faction],
                             m.value
                         )
 
-                    else:
+                    elif m.name in extra_labels:
+                        labels = dict(m.labels)
+                        pm.add_metric([labels.get(label, "") for label in extra_labels[m.name]], m.value)
+
+                    elif m.name == "player_ping_distribution":
+                        labels = dict(m.labels)
+                        counts, total = m.value
                         pm.add_metric(
-                            [m.server, m.world],
-                            m.value
+                            [labels.get(label, "") for label in common] + [m.faction],
+                            buckets=self.__buckets(counts),
+                            sum_value=total
                         )
+
+                    else:
+                        # label sets are shared between samples, so their values are looked up once per set
+                        values = label_values.get(m.labels)
+                        if values is None:
+                            labels = dict(m.labels)
+                            values = label_values[m.labels] = [labels.get(label, "") for label in common]
+                        pm.add_metric(values, m.value)
                 except Exception as e:
                     logger.error(f"The error occurred while getting metrics. {type(e).__name__} - {e}")
 
             for _, metric in prometheus_metrics.items():
                 yield metric
 
+            yield from self.__resource_metrics(targets)
+            if targets is not None:
+                yield from self.__snapshot_metrics(targets)
+
         logger.debug(f"SE metrics collection finished")
 
+    def __buckets(self, counts: list) -> list:
+        """Convert counts of ping buckets to cumulative buckets of the histogram."""
+        buckets = []
+        cumulative = 0
+        for le, number in zip(VRageAPI.__PING_BUCKETS__ + (float("inf"),), counts):
+            cumulative += number
+            buckets.append(("+Inf" if le == float("inf") else str(float(le)), cumulative))
+        return buckets
+
+    def __clients(self, targets: Optional[Targets]) -> list:
+        if targets is None:
+            return [self.vrage_client]
+        return list(targets.clients.values())
+
+    def __common_labels(self, targets: Optional[Targets]) -> list:
+        """Server and world labels followed by static labels of all targets, sorted by name."""
+        static = set()
+        for client in self.__clients(targets):
+            static.update(client.static_labels.keys())
+        return ["server", "world"] + sorted(static - {"server", "world"})
+
+    def __metrics(self, targets: Optional[Targets]) -> list:
+        if targets is None:
+            warm_up = self._warm_up
+            if warm_up is not None:
+                warm_up.join()  # the first scrape reuses resources cached by the first collection
+                self._warm_up = None
+            return PROFILER.runcall(self.vrage_client.metrics)
+
+        metrics = []
+        for snapshot in targets.snapshots.values():
+            metrics.extend(snapshot.metrics)
+        return metrics
+
+    def __window_metrics(self, targets: Optional[Targets]) -> list:
+        """Windowed statistics of sampled server fields, computed on every scrape."""
+        metrics = []
+        for client in self.__clients(targets):
+            metrics.extend(client.window_metrics())
+        return metrics
+
+    def __resource_metrics(self, targets: Optional[Targets]) -> GaugeMetricFamily:
+        failures = CounterMetricFamily(
+            "se_resource_failures",
+            "Number of failed requests of VRage API resource",
+            labels=["target", "resource"]
+        )
+        circuit_open = GaugeMetricFamily(
+            "se_resource_circuit_open",
+            "Whether requests of VRage API resource are suspended by the circuit breaker",
+            labels=["target", "resource"]
+        )
+        interval = GaugeMetricFamily(
+            "se_resource_interval_seconds",
+            "Current refresh interval of VRage API resource, stretched while adaptive polling backs off",
+            labels=["target", "resource"]
+        )
+        concurrency = GaugeMetricFamily(
+            "se_request_concurrency",
+            "Current max number of concurrent VRage API requests of the target",
+            labels=["target"]
+        )
+        level = GaugeMetricFamily(
+            "se_adaptive_polling_level",
+            "Back off level of adaptive polling, 0 while the server isn't struggling",
+            labels=["target"]
+        )
+
+        for client in self.__clients(targets):
+            for resource, breaker in client.breakers.items():
+                failures.add_metric([client.name, resource], breaker.failures)
+                circuit_open.add_metric([client.name, resource], int(breaker.is_open))
+                interval.add_metric([client.name, resource], client.interval(resource))
+            concurrency.add_metric([client.name], client.concurrency)
+            level.add_metric([client.name], client.throttle.level)
+
+        yield failures
+        yield circuit_open
+        yield interval
+        yield concurrency
+        yield level
+
+    def __snapshot_metrics(self, targets: Targets) -> GaugeMetricFamily:
+        up = GaugeMetricFamily(
+            "se_up",
+            "Whether the last poll of the target was successful",
+            labels=["target"]
+        )
+        age = GaugeMetricFamily(
+            "se_snapshot_age_seconds",
+            "Seconds since the served snapshot was collected from VRage API",
+            labels=["target"]
+        )
+        last_success = GaugeMetricFamily(
+            "se_snapshot_last_success_timestamp_seconds",
+            "Unix time of the last successful collection from VRage API",
+            labels=["target"]
+        )
+
+        for name in targets.clients:
+            status = targets.up.get(name)
+            if status is not None:
+                up.add_metric([name], int(status))
+
+            snapshot = targets.snapshots.get(name)
+            if snapshot is not None:
+                age.add_metric([name], snapshot.age)
+                last_success.add_metric([name], snapshot.timestamp)
+
+        yield up
+        yield age
+        yield last_success
+
 
 class SpaceEngineersExporter(Base):
     """This object represents a metrics exporter from Space Engineers Server.
     Register the Space Engineers metrics collector and create WSGI application.
+    With the cache enabled, the exposition is rendered once per new snapshot of the poller.
+
+    The asyncio server serves metrics and drives the poller on one event loop,
+    it requires background polling. Debug endpoints are served by the same server, if enabled.
+    The snapshot API serves decoded snapshots of the poller, it requires background polling too.
+    With the pusher, metrics are also pushed to a remote write receiver or Pushgateway.
+
+    With the supervisor, targets are polled by worker processes and the WSGI server
+    serves the merged exposition of all workers.
     """
-    def __init__(self, vrage_client: VRageAPI = None):
+    def __init__(
+        self,
+        vrage_client: VRageAPI = None,
+        poller: VRagePoller = None,
+        cache: bool = False,
+        server: str = "wsgi",
+        max_requests: int = 64,
+        debug: bool = False,
+        supervisor: "Supervisor" = None,
+        api: bool = False,
+        pusher: "Pusher" = None
+    ):
         self.client = vrage_client
+        self.poller = poller
+        self.supervisor = supervisor
+        self.cache = cache
+        self.server = server or "wsgi"
+        self.max_requests = max_requests
+        self.debug = debug
+        self.api = api
+        self.pusher = pusher
+
+        if self.server not in ("wsgi", "asyncio"):
+            raise ValueError(f"Unknown server type: {self.server}")
+        if self.server == "asyncio" and self.poller is None and self.supervisor is None:
+            raise ValueError("The asyncio server requires background polling")
+
+    def __run_supervisor(self, addr: str, port: int) -> None:
+        from se_exporter.client.supervisor import SupervisorCollector
+
+        if self.server == "asyncio":
+            logger.warning("Worker processes are served by the WSGI server")
+        if self.api:
+            logger.warning("The snapshot API isn't supported with worker processes, it's disabled")
+
+        REGISTRY.register(SupervisorCollector(self.supervisor))
+        cache = ExpositionCache(REGISTRY, version=self.supervisor.version, render=self.supervisor.render)
+        debug = DebugEndpoints([]) if self.debug else None
+
+        # the supervisor must stop workers and remove the spool on SIGTERM too
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.supervisor.start()
+        start_wsgi_server(ExporterApp(REGISTRY, cache=cache, debug=debug), addr=addr, port=port)
+        logger.info(f"Serving the app on {addr}:{port}")
+
+        try:
+            while True:
+                time.sleep(0.5)
+        finally:
+            self.supervisor.stop()
 
     def run(self, addr: str = "0.0.0.0", port: int = 9122) -> None:
-        """Register the collector and run WSGI server."""
-        REGISTRY.register(
-            SpaceEngineersCollector(
-                vrage_client=self.client,
-            )
+        """Register the collector and run the server."""
+        if self.supervisor is not None:
+            return self.__run_supervisor(addr, port)
+
+        collector = SpaceEngineersCollector(
+            vrage_client=self.client,
+            poller=self.poller
         )
+        REGISTRY.register(collector)
+        collector.warm_up()
+        if self.poller is not None and self.server != "asyncio":
+            self.poller.start()  # the first poll runs while the server is being started
         logger.debug("The collector's registration was successful, starting web server...")
 
-        start_wsgi_server(port, addr=addr)
+        cache = None
+        if self.cache and self.poller is not None:
+            cache = ExpositionCache(REGISTRY, version=lambda: self.poller.version)
+        elif self.cache:
+            logger.warning("The exposition cache requires background polling, it's disabled")
+
+        debug = None
+        if self.debug:
+            clients = list(self.poller.clients.values()) if self.poller is not None else [self.client]
+            debug = DebugEndpoints(clients, poller=self.poller)
+            logger.warning("Debug endpoints are enabled on /debug/, don't expose them publicly")
+
+        api = None
+        if self.api and self.poller is not None:
+            api = SnapshotAPI(self.poller)
+            logger.info("The snapshot API is enabled on /api/snapshot")
+        elif self.api:
+            logger.warning("The snapshot API requires background polling, it's disabled")
+
+        if self.pusher is not None:
+            # the last batch must be delivered or spooled on SIGTERM too
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            self.pusher.start()
+
+        try:
+            self.__serve(addr, port, cache=cache, debug=debug, api=api)
+        finally:
+            if self.pusher is not None:
+                self.pusher.stop()
+
+    def __serve(self, addr: str, port: int, **options) -> None:
+        if self.server == "asyncio":
+            from se_exporter.client.aioserver import AsyncioServer
+
+            AsyncioServer(self.poller, REGISTRY, max_requests=self.max_requests, **options).run(addr, port)
+            return
+
+        start_wsgi_server(ExporterApp(REGISTRY, **options), addr=addr, port=port)
         logger.info(f"Serving the app on {addr}:{port}")
 
         while True:
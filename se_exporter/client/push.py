@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""This module contains PushSpool and Pusher classes and encode_write_request function.
+
+Remote write requests are encoded by hand, the WriteRequest message of Prometheus remote write 1.0 is:
+
+    WriteRequest { repeated TimeSeries timeseries = 1; }
+    TimeSeries { repeated Label labels = 1; repeated Sample samples = 2; }
+    Label { string name = 1; string value = 2; }
+    Sample { double value = 1; int64 timestamp = 2; }
+"""
+
+import gzip
+import logging
+import os
+import socket
+import struct
+import tempfile
+import threading
+from time import monotonic, time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from se_exporter.client.poller import VRagePoller
+from se_exporter.models.base import Base
+from se_exporter.utils.lru import LRUCache
+from se_exporter.utils.snappy import compress
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, generate_latest
+from prometheus_client.core import REGISTRY, CollectorRegistry
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+_DOUBLE = struct.Struct("<d")
+
+# the module is imported only in push mode, so pull-mode expositions don't get push metrics
+PUSH_REQUESTS = Counter(
+    "se_push_requests",
+    "Number of push requests to the receiver by HTTP status",
+    ["status"]
+)
+PUSH_BYTES = Counter(
+    "se_push_bytes",
+    "Compressed bytes delivered to the push receiver"
+)
+PUSH_SAMPLES = Counter(
+    "se_push_samples",
+    "Number of samples batched for delivery to the push receiver"
+)
+PUSH_DROPPED = Counter(
+    "se_push_dropped_batches",
+    "Number of batches dropped without delivery by reason",
+    ["reason"]
+)
+PUSH_SPOOL_BYTES = Gauge(
+    "se_push_spool_bytes",
+    "Size of undelivered batches in the push spool"
+)
+
+
+def _uvarint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    return _uvarint(number << 3 | 2) + _uvarint(len(payload)) + payload
+
+
+def encode_labels(labels: Iterable[Tuple[str, str]]) -> bytes:
+    """Returns encoded Label fields of a TimeSeries, labels must be sorted by name."""
+    return b"".join(
+        _field(1, _field(1, name.encode("utf-8")) + _field(2, value.encode("utf-8")))
+        for name, value in labels
+    )
+
+
+def encode_write_request(series: Iterable[Tuple[bytes, List[Tuple[float, int]]]]) -> bytes:
+    """Returns an encoded WriteRequest of series given as (encoded labels, [(value, timestamp ms), ...])."""
+    return b"".join(
+        _field(1, labels + b"".join(
+            _field(2, b"\x09" + _DOUBLE.pack(value) + b"\x10" + _uvarint(timestamp))
+            for value, timestamp in samples
+        ))
+        for labels, samples in series
+    )
+
+
+class PushSpool(Base):
+    """This object represents a bounded on-disk queue of undelivered push batches.
+
+    Every batch is a file named by its sequence number, so batches survive restarts
+    and are delivered in order. When the spool is over max_bytes, the oldest batches are dropped.
+
+    Arguments:
+      :path: str
+      :max_bytes: int
+
+    """
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+        self._batches = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".batch"):
+                self._batches.append((name, os.path.getsize(os.path.join(path, name))))
+        self.size = sum(size for _, size in self._batches)
+        self._sequence = int(self._batches[-1][0].split(".")[0]) + 1 if self._batches else 0
+        PUSH_SPOOL_BYTES.set(self.size)
+        if self._batches:
+            logger.info(f"{len(self._batches)} undelivered batch(es) found in the push spool {path}")
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+    def put(self, body: bytes) -> None:
+        name = f"{self._sequence:012d}.batch"
+        self._sequence += 1
+        path = os.path.join(self.path, name)
+        with open(f"{path}.tmp", "wb") as fh:
+            fh.write(body)
+        os.replace(f"{path}.tmp", path)
+        self._batches.append((name, len(body)))
+        self.size += len(body)
+
+        while self.size > self.max_bytes and len(self._batches) > 1:
+            self.remove(self._batches[0][0])
+            PUSH_DROPPED.labels("spool_full").inc()
+            logger.warning(f"The push spool is over {self.max_bytes} bytes, the oldest batch is dropped")
+        PUSH_SPOOL_BYTES.set(self.size)
+
+    def oldest(self) -> Optional[Tuple[str, bytes]]:
+        """Returns the name and body of the oldest batch or None if the spool is empty."""
+        if not self._batches:
+            return
+        name = self._batches[0][0]
+        with open(os.path.join(self.path, name), "rb") as fh:
+            return name, fh.read()
+
+    def remove(self, name: str) -> None:
+        for i, (batch, size) in enumerate(self._batches):
+            if batch == name:
+                del self._batches[i]
+                self.size -= size
+                break
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+        PUSH_SPOOL_BYTES.set(self.size)
+
+
+class Pusher(Base):
+    """This object represents a push delivery of metrics for exporters which Prometheus can't scrape,
+    e.g. behind NAT on rented game hosts.
+
+    With the remote_write protocol, the registry is sampled after every new snapshot of the poller,
+    at most once per poll interval, samples are batched by series and delivered every interval seconds
+    (or as soon as max_samples are batched) as one snappy-compressed remote write request.
+    Batches which can't be delivered are kept in the spool and retried in order, a few per interval.
+
+    With the pushgateway protocol, the current exposition is pushed gzip-compressed every interval seconds.
+    Pushgateway keeps only the last push, so failed pushes aren't spooled.
+
+    Requests which the receiver rejects with 4xx (except 429) are dropped, other failures are retried.
+
+    Arguments:
+      :url: str
+      :poller: VRagePoller
+      :registry: CollectorRegistry
+      :protocol: str
+      :interval: float
+      :job: str
+      :instance: str
+      :max_samples: int
+      :headers: Dict
+      :timeout: float
+      :spool_dir: str
+      :spool_size: int
+
+    """
+    __PROTOCOLS__ = ("remote_write", "pushgateway")
+    __MAX_SPOOLED_PER_INTERVAL__ = 10
+
+    def __init__(
+        self,
+        url: str,
+        poller: VRagePoller,
+        registry: CollectorRegistry = REGISTRY,
+        protocol: str = "remote_write",
+        interval: float = 60,
+        job: str = "se_exporter",
+        instance: str = None,
+        max_samples: int = 50000,
+        headers: Dict = None,
+        timeout: float = 10,
+        spool_dir: str = None,
+        spool_size: int = 64 * 1024 * 1024
+    ):
+        if protocol not in self.__PROTOCOLS__:
+            raise ValueError(f"Unknown push protocol: {protocol}")
+
+        self.url = url.rstrip("/")
+        self.poller = poller
+        self.registry = registry
+        self.protocol = protocol
+        self.interval = float(interval or 60)
+        self.job = job or "se_exporter"
+        self.instance = instance or socket.gethostname()
+        self.max_samples = max_samples or 50000
+        self.headers = dict(headers or {})
+        self.timeout = timeout or 10
+        self.spool = None
+        if self.protocol == "remote_write":
+            self.spool = PushSpool(spool_dir or os.path.join(tempfile.gettempdir(), "se-exporter-push"), spool_size)
+        self._series = {}
+        self._samples = 0
+        self._labels = LRUCache(maxsize=65536)
+        self._version = None
+        self._session = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __session(self) -> "requests.Session":
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update(self.headers)
+        return self._session
+
+    def sample(self) -> int:
+        """Add current samples of the registry to the batch. Returns the number of added samples."""
+        timestamp = int(time() * 1000)
+        added = 0
+        for family in self.registry.collect():
+            for s in family.samples:
+                key = (s.name, tuple(sorted(s.labels.items())))
+                ts = timestamp if s.timestamp is None else int(s.timestamp * 1000)
+                self._series.setdefault(key, []).append((s.value, ts))
+                added += 1
+
+        self._samples += added
+        PUSH_SAMPLES.inc(added)
+        return added
+
+    def __encoded_labels(self, key: Tuple) -> bytes:
+        labels = self._labels.get(key)
+        if labels is None:
+            name, sample_labels = key
+            merged = dict(sample_labels, __name__=name)
+            merged.setdefault("job", self.job)
+            merged.setdefault("instance", self.instance)
+            labels = self._labels.put(key, encode_labels(sorted(merged.items())))
+        return labels
+
+    def __batch(self) -> Optional[bytes]:
+        if not self._series:
+            return
+        series, self._series, self._samples = self._series, {}, 0
+        return compress(encode_write_request((self.__encoded_labels(key), samples) for key, samples in series.items()))
+
+    def __deliver(self, method: str, url: str, body: bytes, headers: Dict) -> bool:
+        """Returns False if the body should be retried later."""
+        try:
+            response = self.__session().request(method, url, data=body, headers=headers, timeout=self.timeout)
+        except Exception as e:
+            PUSH_REQUESTS.labels("error").inc()
+            logger.warning(f"Can't push metrics to {self.url}. {type(e).__name__} - {e}")
+            return False
+
+        status = response.status_code
+        PUSH_REQUESTS.labels(str(status)).inc()
+        if status < 300:
+            PUSH_BYTES.inc(len(body))
+            return True
+        if status == 429 or status >= 500:
+            logger.warning(f"Push receiver {self.url} answered {status}, the batch will be retried")
+            return False
+
+        PUSH_DROPPED.labels("rejected").inc()
+        logger.error(f"Push receiver {self.url} rejected the batch with {status}: {response.text[:200]}")
+        return True
+
+    def __remote_write(self, body: bytes) -> bool:
+        return self.__deliver("POST", self.url, body, {
+            "Content-Type": "application/x-protobuf",
+            "Content-Encoding": "snappy",
+            "X-Prometheus-Remote-Write-Version": "0.1.0"
+        })
+
+    def __flush_remote_write(self) -> None:
+        body = self.__batch()
+        delivered = True
+        if body is not None:
+            # batches are delivered in order, so a new one waits behind the spooled ones
+            if len(self.spool):
+                self.spool.put(body)
+            elif not self.__remote_write(body):
+                self.spool.put(body)
+                delivered = False
+
+        for _ in range(self.__MAX_SPOOLED_PER_INTERVAL__ if delivered else 0):
+            spooled = self.spool.oldest()
+            if spooled is None or not self.__remote_write(spooled[1]):
+                break
+            self.spool.remove(spooled[0])
+
+    def __flush_pushgateway(self) -> None:
+        url = f"{self.url}/metrics/job/{self.job}/instance/{self.instance}"
+        body = gzip.compress(generate_latest(self.registry), compresslevel=6)
+        if not self.__deliver("PUT", url, body, {"Content-Type": CONTENT_TYPE_LATEST, "Content-Encoding": "gzip"}):
+            PUSH_DROPPED.labels("failed").inc()
+
+    def flush(self) -> None:
+        """Deliver the batch, or the exposition for Pushgateway, and spooled batches."""
+        if self.protocol == "remote_write":
+            self.__flush_remote_write()
+        else:
+            self.__flush_pushgateway()
+
+    def __run(self) -> None:
+        flushed = monotonic()
+        while not self._stop.wait(self.poller.interval if self.protocol == "remote_write" else self.interval):
+            try:
+                if self.protocol == "remote_write" and self.poller.version != self._version:
+                    self._version = self.poller.version
+                    self.sample()
+                if monotonic() - flushed >= self.interval or self._samples >= self.max_samples:
+                    flushed = monotonic()
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Push to {self.url} failed. {type(e).__name__} - {e}")
+
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"The last push to {self.url} failed. {type(e).__name__} - {e}")
+
+    def start(self) -> None:
+        """Start pushing in a daemon thread."""
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self.__run, name="se-pusher", daemon=True)
+        self._thread.start()
+        logger.info(f"Pushing metrics to {self.url} every {self.interval}s, {self.protocol} protocol")
+
+    def stop(self) -> None:
+        """Stop pushing, the last batch is delivered or spooled."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout * 2)
+            self._thread = None
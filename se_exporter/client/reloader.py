@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""This module contains ConfigReloader class."""
+
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from se_exporter.client.poller import VRagePoller
+from se_exporter.client.sampler import ServerSampler
+from se_exporter.client.vrage import VRageAPI
+from se_exporter.models.base import Base
+from se_exporter.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+Loaded = Tuple[Config, List[Dict], Dict]
+
+
+class ConfigReloader(Base):
+    """This object represents a watcher of the config file and the targets file,
+    which applies their changes without a restart.
+
+    Files are checked every interval seconds by modification time, size and inode, so replaced files
+    (e.g. a mounted ConfigMap) are noticed too. On change, load() returns the new config, VRageAPI arguments
+    of every target and poller arguments, and targets are updated incrementally:
+      - clients of unchanged targets are kept with their connection pools and snapshots
+      - a rotated token is set on the running client
+      - clients of added targets are created by create(), clients of removed ones are closed
+      - a target with other changed arguments gets a new client, its last snapshot is served until the first poll
+    The poller swaps all targets at once, so a scrape sees either the old or the new set of targets.
+    If the config can't be loaded, the error is logged and the current config is kept.
+
+    Without the poller, only tokens are updated. Options of the server require a restart and are only logged.
+
+    Arguments:
+      :load: Callable[[], Tuple[Config, List[Dict], Dict]]
+      :create: Callable[[Dict], VRageAPI]
+      :config: Config
+      :options: List[Dict]
+      :clients: List[VRageAPI]
+      :poller: VRagePoller
+      :sampler: ServerSampler
+      :interval: float
+
+    """
+    __RESTART_OPTIONS__ = (
+        "listen_addr", "listen_port", "server", "max_requests", "workers", "spool_dir", "background_polling",
+        "max_concurrency", "exposition_cache", "snapshot_api", "debug_endpoints", "loglevel", "record", "replay",
+        "replay_speed", "push_url", "push_protocol", "push_interval", "push_job", "push_instance", "push_max_samples",
+        "push_headers", "push_timeout", "push_spool_dir", "push_spool_size_mb", "watch_config", "reload_interval"
+    )
+
+    def __init__(
+        self,
+        load: Callable[[], Loaded],
+        create: Callable[[Dict], VRageAPI],
+        config: Config,
+        options: List[Dict],
+        clients: List[VRageAPI],
+        poller: VRagePoller = None,
+        sampler: ServerSampler = None,
+        interval: float = 5
+    ):
+        self.load = load
+        self.create = create
+        self.config = config
+        self.poller = poller
+        self.sampler = sampler
+        self.interval = float(interval or 5)
+        self.reloads = 0
+        self._options = {o["name"]: o for o in options}
+        self._clients = {client.name: client for client in clients}
+        self._signature = self.__signature()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __files(self) -> List[str]:
+        return [path for path in (self.config.filepath, self.config.targets_file) if path]
+
+    def __signature(self) -> Tuple:
+        signature = []
+        for path in self.__files():
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except OSError:
+                signature.append((path, None))
+        return tuple(signature)
+
+    def __restart_required(self, config: Config) -> None:
+        changed = [
+            option for option in self.__RESTART_OPTIONS__
+            if getattr(config, option, None) != getattr(self.config, option, None)
+        ]
+        if changed:
+            logger.warning(f"Changed options require a restart to be applied: {', '.join(changed)}")
+
+    def __clients(self, options: Dict[str, Dict]) -> Optional[Tuple[Dict[str, VRageAPI], Dict[str, int]]]:
+        """Returns clients of the options and counts of changes, or None if clients can't be created."""
+        clients, created = {}, []
+        counts = dict(added=0, removed=0, replaced=0, rotated=0)
+        try:
+            for name, target in options.items():
+                client, current = self._clients.get(name), self._options.get(name)
+                changed = {key for key in {**target, **(current or {})} if target.get(key) != (current or {}).get(key)}
+                if client is not None and not changed:
+                    clients[name] = client
+                elif client is not None and changed == {"token"}:
+                    clients[name] = client
+                    counts["rotated"] += 1
+                else:
+                    clients[name] = self.create(target)
+                    created.append(clients[name])
+                    counts["replaced" if client is not None else "added"] += 1
+        except Exception as e:
+            logger.error(f"Can't create the client of {name}, the config isn't applied. {type(e).__name__} - {e}")
+            for client in created:
+                client.close()
+            return
+
+        counts["removed"] = len(self._clients.keys() - clients.keys())
+        return clients, counts
+
+    def apply(self, config: Config, options: List[Dict], poll: Dict) -> None:
+        """Apply the loaded config to running targets."""
+        self.__restart_required(config)
+        desired = {o["name"]: o for o in options}
+
+        if self.poller is None:
+            # a single target is scraped by its client, only the token can be changed in place
+            desired = {name: o for name, o in desired.items() if name in self._clients}
+            if desired.keys() != self._clients.keys() or any(
+                {**o, "token": None} != {**self._options[name], "token": None} for name, o in desired.items()
+            ):
+                logger.warning("Targets can be changed without a restart only with background polling")
+            for name, client in self._clients.items():
+                if name in desired:
+                    if desired[name]["token"] != client.token:
+                        logger.info(f"Token of {name} is updated")
+                    client.token = desired[name]["token"]
+                else:
+                    desired[name] = self._options[name]
+            self._options, self.config = desired, config
+            return
+
+        result = self.__clients(desired)
+        if result is None:
+            return
+
+        clients, counts = result
+        for name, target in desired.items():
+            if name in self._clients and clients[name] is self._clients[name]:
+                clients[name].token = target["token"]
+
+        self.poller.interval = float(poll.get("interval") or self.poller.interval)
+        self.poller.timeout = float(poll["timeout"]) if poll.get("timeout") else None
+        if counts["added"] or counts["removed"] or counts["replaced"]:
+            self.poller.update(list(clients.values()))
+        if self.sampler is not None:
+            self.sampler.update(list(clients.values()))
+
+        self._clients, self._options, self.config = clients, desired, config
+        logger.info(
+            f"Config reloaded, {len(clients)} target(s): {counts['added']} added, {counts['removed']} removed, "
+            f"{counts['replaced']} replaced, {counts['rotated']} token(s) rotated"
+        )
+
+    def reload(self) -> bool:
+        """Load the config and apply it. Returns False if it can't be loaded."""
+        try:
+            config, options, poll = self.load()
+        except Exception as e:
+            logger.error(f"Can't reload the config, the current one is kept. {type(e).__name__} - {e}")
+            return False
+
+        self.apply(config, options, poll)
+        self.reloads += 1
+        return True
+
+    def __run(self) -> None:
+        while not self._stop.wait(self.interval):
+            signature = self.__signature()
+            if signature == self._signature:
+                continue
+
+            # a broken file is not retried until it's changed again
+            self._signature = signature
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Config reload failed. {type(e).__name__} - {e}")
+
+    def start(self) -> None:
+        """Start watching files in a daemon thread."""
+        if self._thread is not None or not self.__files():
+            return
+
+        self._thread = threading.Thread(target=self.__run, name="se-reloader", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {', '.join(self.__files())} for changes every {self.interval}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
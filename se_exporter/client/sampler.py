@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""This module contains ServerSampler class."""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import monotonic
+from typing import List
+
+from se_exporter.client.vrage import VRageAPI
+from se_exporter.models.base import Base
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSampler(Base):
+    """This object represents a background sampler of the server resource of VRage API targets.
+
+    The server resource is cheap, so it's requested at a high rate, apart from collections,
+    and sampled values are kept in ring buffers of the clients. Only clients with sample_interval
+    are sampled, at the shortest of their intervals. Targets are sampled concurrently
+    by a pool of max_workers threads, a slow target doesn't delay samples of others.
+    Replayed and recorded clients aren't sampled, samples would take or add responses of collections.
+
+    Arguments:
+      :clients: List[VRageAPI]
+      :max_workers: int
+
+    """
+    def __init__(self, clients: List[VRageAPI], max_workers: int = 8):
+        self.max_workers = max_workers or 8
+        self._stop = threading.Event()
+        self._thread = None
+        self.__set(clients)
+
+    def __set(self, clients: List[VRageAPI]) -> None:
+        sampled = []
+        for client in clients:
+            if not client.sample_interval:
+                continue
+            if client.replay is not None or client.recorder is not None:
+                logger.warning(f"Sampling isn't supported with record and replay, {client.name} isn't sampled")
+                continue
+            sampled.append(client)
+        self.interval = min((client.sample_interval for client in sampled), default=None)
+        self.clients = sampled
+
+    def update(self, clients: List[VRageAPI]) -> None:
+        """Replace sampled clients, sampling is started if it wasn't, since no client had sample_interval."""
+        self.__set(clients)
+        self.start()
+
+    def __sample(self, client: VRageAPI) -> None:
+        try:
+            client.sample()
+        except Exception as e:
+            logger.debug(f"Can't sample server of {client.name}. {type(e).__name__} - {e}")
+
+    def __run(self) -> None:
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="se-sampler") as executor:
+            in_flight = {}
+            while not self._stop.is_set():
+                started = monotonic()
+                interval, clients = self.interval or 1, self.clients
+                in_flight = {client.name: in_flight[client.name] for client in clients if client.name in in_flight}
+                for client in clients:
+                    # a target whose previous sample is still in flight is skipped
+                    future = in_flight.get(client.name)
+                    if future is None or future.done():
+                        in_flight[client.name] = executor.submit(self.__sample, client)
+
+                wait(in_flight.values(), timeout=interval)
+                self._stop.wait(max(interval - (monotonic() - started), 0))
+
+    def start(self) -> None:
+        """Start sampling in a daemon thread, if any client has sample_interval."""
+        if not self.clients or self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self.__run, name="se-sampler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling server resource of {len(self.clients)} target(s) every {self.interval}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
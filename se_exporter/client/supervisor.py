@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""This module contains Supervisor and SupervisorCollector classes and the worker process of the fleet."""
+
+import logging
+import marshal
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from se_exporter.client.exposition import render_families
+from se_exporter.models.base import Base
+from prometheus_client.core import REGISTRY, CollectorRegistry, CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+
+def _shared_memory_dir() -> Optional[str]:
+    """Returns tmpfs directory if available, so worker results are passed through memory."""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def run_worker(
+    index: int,
+    targets: List[Dict],
+    poll_options: Dict,
+    path: str,
+    parent_pid: int,
+    loglevel: str = "INFO"
+) -> None:
+    """Worker process: poll the shard of targets and write rendered families to the path
+    after every poll, until the supervisor exits.
+    """
+    from se_exporter.client.poller import VRagePoller
+    from se_exporter.client.prometheus import SpaceEngineersCollector
+    from se_exporter.client.sampler import ServerSampler
+    from se_exporter.client.vrage import VRageAPI
+    from se_exporter.utils.loop import EventLoopThread
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=loglevel,
+        datefmt="%d/%m/%Y %H:%M:%S",
+        format=f"%(asctime)s [%(levelname)s] [worker {index}] %(message)s"
+    )
+
+    loop = EventLoopThread(name=f"vrage-worker-{index}")
+    clients = [VRageAPI(loop=loop, **options) for options in targets]
+    poller = VRagePoller(clients=clients, loop=loop, **poll_options)
+    REGISTRY.register(SpaceEngineersCollector(poller=poller))
+    poller.start()
+    ServerSampler(clients).start()
+
+    worker = str(index)
+    version = None
+    while os.getppid() == parent_pid:
+        if poller.version != version:
+            version = poller.version
+            families = []
+            for family in REGISTRY.collect():
+                # samples without a target are per-process, so they are told apart by the worker
+                family.samples = [
+                    sample if "target" in sample.labels else sample._replace(labels={**sample.labels, "worker": worker})
+                    for sample in family.samples
+                ]
+                families.append(family)
+            _write_atomic(path, marshal.dumps(render_families(families)))
+        time.sleep(0.2)
+
+    logger.info("Supervisor exited, stopping")
+    poller.stop()
+
+
+class Supervisor(Base):
+    """This object represents a supervisor of worker processes, each of them polls its own shard
+    of the fleet targets and writes rendered metric families to a spool directory
+    (in shared memory, if available). The supervisor merges families of all workers into one exposition.
+
+    A worker which exits is restarted with a growing delay, other workers aren't affected.
+
+    Arguments:
+      :targets: List[Dict]
+      :workers: int
+      :poll_options: Dict
+      :spool_dir: str
+      :registry: CollectorRegistry
+      :loglevel: str
+
+    Targets are arguments of VRageAPI, poll options are arguments of VRagePoller.
+    """
+    __MAX_RESTART_DELAY__ = 60
+
+    def __init__(
+        self,
+        targets: List[Dict],
+        workers: int = 2,
+        poll_options: Dict = None,
+        spool_dir: str = None,
+        registry: CollectorRegistry = REGISTRY,
+        loglevel: str = "INFO"
+    ):
+        self.workers = max(min(workers or 2, len(targets)), 1)
+        self.shards = [targets[i::self.workers] for i in range(self.workers)]
+        self.poll_options = dict(poll_options or {})
+        self.spool_dir = spool_dir
+        self.registry = registry
+        self.loglevel = loglevel
+        self.restarts = [0] * self.workers
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = [None] * self.workers
+        self._started = [0.0] * self.workers
+        self._restart_at = [0.0] * self.workers
+        self._results = [(None, [])] * self.workers
+        self._spool = None
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def path(self, index: int) -> str:
+        return os.path.join(self._spool, f"worker-{index}.bin")
+
+    def __spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self.shards[index], self.poll_options, self.path(index), os.getpid(), self.loglevel),
+            name=f"se-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+        logger.info(f"Worker {index} started, pid {process.pid}, {len(self.shards[index])} target(s)")
+
+    def __check(self) -> None:
+        now = time.monotonic()
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+
+            if self._restart_at[index] == 0.0:
+                # stale results of a dead worker aren't served
+                self._results[index] = (None, [])
+                try:
+                    os.remove(self.path(index))
+                except FileNotFoundError:
+                    pass
+
+                # a worker which lived long enough is restarted immediately
+                failures = 0 if now - self._started[index] > self.__MAX_RESTART_DELAY__ else self.restarts[index]
+                delay = min(2 ** failures - 1, self.__MAX_RESTART_DELAY__)
+                self._restart_at[index] = now + delay
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restart in {delay}s")
+
+            if now >= self._restart_at[index]:
+                self._restart_at[index] = 0.0
+                self.restarts[index] += 1
+                self.__spawn(index)
+
+    def __run_monitor(self) -> None:
+        while not self._stop.wait(1):
+            try:
+                self.__check()
+            except Exception as e:
+                logger.error(f"Can't check workers. {type(e).__name__} - {e}")
+
+    def start(self) -> None:
+        """Spawn workers and start monitoring them."""
+        self._spool = tempfile.mkdtemp(prefix="se-exporter-", dir=self.spool_dir or _shared_memory_dir())
+        for index in range(self.workers):
+            self.__spawn(index)
+
+        self._monitor = threading.Thread(target=self.__run_monitor, name="se-supervisor", daemon=True)
+        self._monitor.start()
+        logger.info(f"Supervisor started {self.workers} worker(s), spool {self._spool}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(5)
+        if self._spool is not None:
+            shutil.rmtree(self._spool, ignore_errors=True)
+
+    def __mtime(self, index: int) -> Optional[int]:
+        try:
+            return os.stat(self.path(index)).st_mtime_ns
+        except (FileNotFoundError, TypeError):
+            return None
+
+    def version(self) -> Tuple:
+        """Returns modification times of worker results, they change after every poll."""
+        return tuple(self.__mtime(index) for index in range(self.workers))
+
+    def results(self, index: int) -> List[Tuple[str, bytes, bytes]]:
+        """Returns rendered families of the worker, loaded again only if the worker wrote new ones."""
+        mtime = self.__mtime(index)
+        loaded, families = self._results[index]
+        if mtime is None or mtime == loaded:
+            return families
+
+        try:
+            with open(self.path(index), "rb") as fh:
+                families = marshal.loads(fh.read())
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logger.warning(f"Can't read results of worker {index}. {type(e).__name__} - {e}")
+            return families
+
+        self._results[index] = (mtime, families)
+        return families
+
+    def render(self) -> bytes:
+        """Merge families of the supervisor registry and of all workers into one exposition."""
+        merged = {}
+        sources = [render_families(self.registry.collect())]
+        sources.extend(self.results(index) for index in range(self.workers))
+
+        for families in sources:
+            for name, header, samples in families:
+                family = merged.get(name)
+                if family is None:
+                    merged[name] = (header, [samples])
+                else:
+                    family[1].append(samples)
+
+        return b"".join(header + b"".join(samples) for header, samples in merged.values())
+
+    def alive(self, index: int) -> bool:
+        process = self._processes[index]
+        return process is not None and process.is_alive()
+
+
+class SupervisorCollector(Base):
+    """This object represents a collector of the worker processes state."""
+    def __init__(self, supervisor: Supervisor):
+        self.supervisor = supervisor
+
+    def collect(self) -> GaugeMetricFamily:
+        up = GaugeMetricFamily("se_worker_up", "Whether the worker process is running", labels=["worker"])
+        targets = GaugeMetricFamily("se_worker_targets", "Number of targets polled by the worker", labels=["worker"])
+        restarts = CounterMetricFamily("se_worker_restarts", "Number of restarts of the worker", labels=["worker"])
+
+        for index in range(self.supervisor.workers):
+            worker = str(index)
+            up.add_metric([worker], int(self.supervisor.alive(index)))
+            targets.add_metric([worker], len(self.supervisor.shards[index]))
+            restarts.add_metric([worker], self.supervisor.restarts[index])
+
+        yield up
+        yield targets
+        yield restarts
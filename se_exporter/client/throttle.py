@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""This module contains AdaptiveThrottle class."""
+
+import logging
+from typing import Optional
+
+from se_exporter.models.base import Base
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveThrottle(Base):
+    """This object represents an adaptive load level of one VRage API target.
+
+    The level is updated from simulation speed and CPU load of every server response.
+    While the server is struggling (simulation speed below min_sim_speed or CPU load above
+    max_cpu_load) the level grows by one step per collection up to max_level. Once both
+    recover with a margin, the level goes down by one step per collection.
+
+    Every level halves concurrency of requests and doubles refresh intervals of heavy resources.
+
+    Arguments:
+      :concurrency: int
+      :min_sim_speed: float
+      :max_cpu_load: float
+      :max_level: int
+      :min_interval: float
+
+    """
+    __RECOVERY_MARGIN__ = 0.05
+
+    def __init__(
+        self,
+        concurrency: int = 9,
+        min_sim_speed: float = 0.9,
+        max_cpu_load: float = 80,
+        max_level: int = 3,
+        min_interval: float = 30
+    ):
+        self.max_concurrency = max(concurrency or 1, 1)
+        self.min_sim_speed = 0.9 if min_sim_speed is None else min_sim_speed
+        self.max_cpu_load = 80 if max_cpu_load is None else max_cpu_load
+        self.max_level = max(max_level or 3, 1)
+        self.min_interval = min_interval or 30
+        self.level = 0
+
+    def __struggling(self, sim_speed: Optional[float], cpu_load: Optional[float]) -> bool:
+        return (
+            (sim_speed is not None and sim_speed < self.min_sim_speed)
+            or (cpu_load is not None and cpu_load > self.max_cpu_load)
+        )
+
+    def __recovered(self, sim_speed: Optional[float], cpu_load: Optional[float]) -> bool:
+        margin = self.__RECOVERY_MARGIN__
+        return (
+            (sim_speed is None or sim_speed >= self.min_sim_speed + margin)
+            and (cpu_load is None or cpu_load <= self.max_cpu_load * (1 - margin))
+        )
+
+    def update(self, sim_speed: Optional[float], cpu_load: Optional[float]) -> int:
+        """Move the level one step according to the server state. Returns the new level."""
+        level = self.level
+        if self.__struggling(sim_speed, cpu_load):
+            level = min(level + 1, self.max_level)
+        elif self.__recovered(sim_speed, cpu_load):
+            level = max(level - 1, 0)
+
+        if level != self.level:
+            action = "backing off" if level > self.level else "ramping up"
+            logger.info(
+                f"Simulation speed {sim_speed}, CPU load {cpu_load}: {action} to level {level}, "
+                f"concurrency {max(self.max_concurrency >> level, 1)}"
+            )
+            self.level = level
+        return level
+
+    @property
+    def concurrency(self) -> int:
+        """Returns the max number of concurrent requests of the current level."""
+        return max(self.max_concurrency >> self.level, 1)
+
+    def interval(self, interval: float) -> float:
+        """Returns the refresh interval of a heavy resource stretched for the current level."""
+        if self.level == 0:
+            return interval
+        return max(interval, self.min_interval) * 2 ** self.level
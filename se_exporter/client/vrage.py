@@ -6,28 +6,83 @@ import hashlib
 import hmac
 import logging
 import random
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
 from datetime import datetime as dt
-from itertools import count
-from time import mktime, time
-from typing import Dict, List, Optional, Tuple
+from itertools import chain, count, repeat
+from math import floor, fsum
+from operator import mul
+from time import mktime, monotonic, perf_counter, time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from wsgiref.handlers import format_date_time
 
-import aiohttp
-import requests
+from se_exporter.client.breaker import CircuitBreaker
+from se_exporter.client.capture import CaptureError, CaptureReader, CaptureWriter
+from se_exporter.client.instrumentation import (
+    ERRORS,
+    MAPPING_DURATION,
+    RESPONSES,
+    UNCHANGED_RESPONSES,
+    MeteredDecoder
+)
+from se_exporter.client.throttle import AdaptiveThrottle
 from se_exporter.models.base import Base
-from se_exporter.utils.helpers import universal_obj_hook
+from se_exporter.utils.decoder import (
+    CHUNK_SIZE,
+    UNCHANGED,
+    BufferedDecoder,
+    Columns,
+    FingerprintDecoder,
+    Schema,
+    StreamDecoder
+)
+from se_exporter.utils.helpers import intern_labels
+from se_exporter.utils.loop import EventLoopThread
+from se_exporter.utils.lru import LRUCache
+from se_exporter.utils.ring import RingBuffer
+
+if TYPE_CHECKING:  # HTTP stacks are imported by the mode which uses them
+    import aiohttp
+    import requests
 
 logger = logging.getLogger(__name__)
 
 
 class Metric(Base):
-    """This object represents a SE metric."""
-    def __init__(self, name: str = None, **kwargs):
+    """This object represents a SE metric sample.
+
+    Labels are a tuple of (name, value) pairs. Label sets of a client are interned,
+    so samples of one target share a single tuple instead of a dict per sample.
+    Label values are available as attributes too.
+    """
+    __slots__ = ("name", "value", "labels")
+
+    def __init__(self, name: str = None, value=None, labels: Tuple = ()):
         self.name = name
+        self.value = value
+        self.labels = labels
+
+    def __getattr__(self, item: str):
+        if item.startswith("__") or item in Metric.__slots__:
+            raise AttributeError(item)
+
+        for key, value in self.labels:
+            if key == item:
+                return value
+        raise AttributeError(item)
 
-        for key, value in kwargs.items():
-            if isinstance(key, str):
-                setattr(self, key, value)
+    def __getitem__(self, item: str):
+        return getattr(self, item)
+
+    @property
+    def key(self) -> Tuple:
+        """Returns the identity of the series: the name and labels."""
+        return self.name, self.labels
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "value": self.value, **dict(self.labels)}
 
 
 class VRageAPI(Base):
@@ -38,6 +93,78 @@ class VRageAPI(Base):
       :token: str
       :port: int
       :run_async: bool
+      :persistent: bool
+      :pool_size: int
+      :labels: dict
+      :name: str
+      :loop: EventLoopThread
+      :resource_intervals: dict
+      :timeout: float
+      :deadline: float
+      :failure_threshold: int
+      :backoff: float
+      :max_backoff: float
+      :change_detection: bool
+      :player_ping_limit: int
+      :player_ping_aggregation: str
+      :grid_aggregation: str
+      :density_cell_size: float
+      :density_top_cells: int
+      :entity_churn: bool
+      :adaptive_polling: bool
+      :min_sim_speed: float
+      :max_cpu_load: float
+      :recorder: CaptureWriter
+      :replay: CaptureReader
+      :sample_interval: float
+      :sample_windows: Tuple[int, ...]
+
+    Static labels are attached to every metric of the client, the name identifies
+    the target in a fleet. The loop can be shared between several clients.
+
+    With persistent mode the client keeps one event loop and one keep-alive
+    connection pool for the whole process lifetime instead of creating them on every scrape.
+
+    Session and admin resources are decoded incrementally while the body is received,
+    using precompiled schemas: arrays are counted or reduced to the fields metrics need.
+
+    Every resource has its own refresh interval in seconds, 0 by default. A collection requests only
+    resources which are due and takes the rest from the results of previous collections.
+
+    Every request is limited by the timeout and, if the deadline is set, by a share of time
+    left until the end of the collection cycle. Failed resources are dropped from the results,
+    others are returned as usual. Each resource has a circuit breaker, which stops requesting it
+    after failure_threshold consecutive failures for an exponentially growing backoff.
+
+    With change detection, session and admin responses are fingerprinted, and if a body
+    is identical to the previous one, it isn't decoded and previous metrics are reused.
+
+    Ping of every player is exported while there are at most player_ping_limit players online,
+    above it only the ping distribution by faction (or server-wide) is exported.
+
+    If grid_aggregation is set, grids are aggregated by faction or owner into PCU, blocks and number
+    of powered and unpowered grids, otherwise they are only counted. Factions are known only for owners
+    who are online, grids of offline owners are grouped under the empty faction. Grids are mapped
+    after players of the same collection and grouped again when a faction of an owner changes.
+
+    If density_cell_size is set, positions of grids and floating objects are binned into
+    a 3D grid of cubic cells of that size in meters. Entity counts and center coordinates
+    of density_top_cells densest cells and density quantiles over occupied cells are exported.
+
+    With entity churn, IDs of grids, characters and floating objects are decoded into int64 columns,
+    and the set of IDs of the previous response is kept per resource. Entities created and removed
+    between responses are counted by set difference and exported as counters.
+
+    With adaptive polling the client backs off while the server is struggling, judging by
+    simulation speed and CPU load of the server resource: concurrency of async requests
+    is lowered and refresh intervals of heavy resources are stretched, see AdaptiveThrottle.
+
+    With the recorder, raw response bodies are appended to a capture file. With the replay,
+    responses are read from a capture file instead of the network, see CaptureReader.
+
+    With sample_interval, simulation speed and CPU load are sampled by ServerSampler into
+    ring buffers, and their min, max, mean and quantiles over sample_windows seconds are exported.
+    Sampling respects the circuit breaker and the backoff of the server resource.
 
     """
 
@@ -52,8 +179,75 @@ class VRageAPI(Base):
         "admin/bannedPlayers",
         "admin/kickedPlayers"
     )
+    __RESOURCE_INTERVALS__ = {
+        "server": 0,
+        "session/players": 0,
+        "session/characters": 0,
+        "session/grids": 0,
+        "session/asteroids": 0,
+        "session/floatingObjects": 0,
+        "session/planets": 0,
+        "admin/bannedPlayers": 0,
+        "admin/kickedPlayers": 0
+    }
+    __SCHEMAS__ = {
+        "session/players": Schema("players", fields=("SteamID", "DisplayName", "FactionName", "Ping")),
+        "session/planets": Schema("planets"),
+        "session/characters": Schema("characters"),
+        "session/grids": Schema("grids"),
+        "session/asteroids": Schema("asteroids"),
+        "session/floatingObjects": Schema("floating_objects"),
+        "admin/bannedPlayers": Schema("banned_players"),
+        "admin/kickedPlayers": Schema("kicked_players")
+    }
+    __GRID_SCHEMA__ = Schema("grids", columns=(
+        ("OwnerSteamId", "q"),
+        ("OwnerDisplayName", None),
+        ("PCU", "q"),
+        ("BlocksCount", "q"),
+        ("IsPowered", "b")
+    ))
+    __HEAVY_RESOURCES__ = ("session/grids", "session/floatingObjects", "session/asteroids")
+    __POSITION_COLUMNS__ = (("Position.X", "d"), ("Position.Y", "d"), ("Position.Z", "d"))
+    __DENSITY_RESOURCES__ = ("session/grids", "session/floatingObjects")
+    __CHURN_RESOURCES__ = ("session/grids", "session/characters", "session/floatingObjects")
+    __DENSITY_QUANTILES__ = (0.5, 0.9, 0.99)
+    __PING_BUCKETS__ = (25, 50, 75, 100, 150, 200, 300, 500, 1000)
+    __SAMPLED_FIELDS__ = ("sim_speed", "simulation_cpu_load")
+    __SAMPLE_QUANTILES__ = (0.05, 0.5, 0.95)
 
-    def __init__(self, host: str, token: str, port: int = 8080, run_async: bool = False):
+    def __init__(
+        self,
+        host: str,
+        token: str,
+        port: int = 8080,
+        run_async: bool = False,
+        persistent: bool = False,
+        pool_size: int = 10,
+        labels: Dict = None,
+        name: str = None,
+        loop: EventLoopThread = None,
+        resource_intervals: Dict = None,
+        timeout: float = 5,
+        deadline: float = None,
+        failure_threshold: int = 3,
+        backoff: float = 30,
+        max_backoff: float = 600,
+        change_detection: bool = False,
+        player_ping_limit: int = 100,
+        player_ping_aggregation: str = "faction",
+        grid_aggregation: Optional[str] = None,
+        density_cell_size: float = None,
+        density_top_cells: int = 5,
+        entity_churn: bool = False,
+        adaptive_polling: bool = False,
+        min_sim_speed: float = 0.9,
+        max_cpu_load: float = 80,
+        recorder: CaptureWriter = None,
+        replay: CaptureReader = None,
+        sample_interval: float = None,
+        sample_windows: Tuple[int, ...] = (60, 300)
+    ):
         if not isinstance(host, str):
             raise ValueError("Host is empty or bad format")
         if token is None:
@@ -66,12 +260,89 @@ class VRageAPI(Base):
         self.endpoint = f"{self.host}:{self.port}{self.basepath}"
         self.nonce = count(int(time() * random.randint(10, 100)))
         self.run_async = run_async
-        self.labels = {}
+        self.persistent = persistent
+        self.pool_size = pool_size or 10
+        self.name = name or f"{self.host.split('://')[-1]}:{self.port}"
+        self.static_labels = dict(labels or {})
+        self.labels = dict(self.static_labels)
+        self.intervals = {**self.__RESOURCE_INTERVALS__, **(resource_intervals or {})}
+        self.timeout = timeout or 5
+        self.deadline = deadline
+        self.breakers = {
+            res: CircuitBreaker(failure_threshold, backoff, max_backoff)
+            for res in (self.__BASE_RESOURCE__,) + self.__OTHER_RESOURCES__
+        }
+        self.change_detection = change_detection
+        self.player_ping_limit = 100 if player_ping_limit is None else player_ping_limit
+        self.player_ping_aggregation = player_ping_aggregation or "faction"
+        if self.player_ping_aggregation not in ("faction", "server"):
+            raise ValueError(f"Unknown player ping aggregation: {self.player_ping_aggregation}")
+        self._player_labels = LRUCache(maxsize=max(self.player_ping_limit * 2, 64))
+        self._ping_limited = False
+        self.grid_aggregation = grid_aggregation
+        if self.grid_aggregation not in ("faction", "owner", None):
+            raise ValueError(f"Unknown grid aggregation: {self.grid_aggregation}")
+        self.density_cell_size = density_cell_size or None
+        self.density_top_cells = 5 if density_top_cells is None else density_top_cells
+        if self.density_cell_size is not None and self.density_cell_size <= 0:
+            raise ValueError(f"Density cell size must be positive: {self.density_cell_size}")
+        self.schemas = dict(self.__SCHEMAS__)
+        if self.grid_aggregation is not None:
+            self.schemas["session/grids"] = self.__GRID_SCHEMA__
+        if self.density_cell_size is not None:
+            for resource in self.__DENSITY_RESOURCES__:
+                schema = self.schemas[resource]
+                self.schemas[resource] = schema._replace(columns=(schema.columns or ()) + self.__POSITION_COLUMNS__)
+        self.entity_churn = entity_churn
+        if self.entity_churn:
+            for resource in self.__CHURN_RESOURCES__:
+                schema = self.schemas[resource]
+                self.schemas[resource] = schema._replace(columns=(schema.columns or ()) + (("EntityId", "q"),))
+        self._entity_ids = {}
+        self._churn = {}
+        self._churn_lock = threading.Lock()
+        self.adaptive_polling = adaptive_polling
+        self.throttle = AdaptiveThrottle(
+            concurrency=len(self.__OTHER_RESOURCES__) + 1,
+            min_sim_speed=min_sim_speed,
+            max_cpu_load=max_cpu_load
+        )
+        self.recorder = recorder
+        self.replay = replay
+        self.sample_interval = sample_interval or None
+        self.sample_windows = tuple(sample_windows or (60, 300))
+        self._samples = {}
+        self._sampled_at = 0.0
+        if self.sample_interval is not None:
+            capacity = int(max(self.sample_windows) / self.sample_interval) + 1
+            self._samples = {field: RingBuffer(capacity) for field in self.__SAMPLED_FIELDS__}
+        self._factions = {}
+        self._grid_factions = {}
+        self._grid_columns = None
+        self._players = []
+        self._group_labels = LRUCache(maxsize=4096)
+        self._cache = {}
+        self._fingerprints = {}
+        self._session = None
+        self._aiosession = None
+        self._loop = loop
+        self._own_loop = False
         logger.debug(f"VRageAPI client ready: {self}")
 
+    @property
+    def loop(self) -> Optional[EventLoopThread]:
+        """Returns the event loop thread of the client, if any."""
+        return self._loop
+
+    @property
+    def cache(self) -> Dict[str, Tuple]:
+        """Returns cached results as (fetched_at, result) keyed by resource name."""
+        return dict(self._cache)
+
     def __verify_host(self, host: str) -> str:
-        if not host.startswith("http://"):
+        if not host.startswith(("http://", "https://")):
             return f"http://{host}"
+        return host
 
     def __date(self) -> str:
         return format_date_time(
@@ -112,120 +383,735 @@ class VRageAPI(Base):
             return
 
         players = []
+        extra = []
         if len(data) > 1:
             logger.warning(f"Unhandled metrics received, {data}")
             return
 
+        labels = intern_labels(self.labels)
         for name, value in data.items():
             if isinstance(value, list):
+                if name == "players":
+                    # the players resource lists only online players, factions of offline owners aren't known
+                    self._players = value
+                    self.__set_factions({i.get("SteamID"): i.get("FactionName") or "" for i in value})
                 if name == "players" and len(value) > 0:
-                    for i in value:
-                        if i.get("Ping") > 0:
-                            players.append(
-                                Metric(
-                                    name="player_ping",
-                                    value=i.get("Ping"),
-                                    player_name=i.get("DisplayName"),
-                                    player_id=str(i.get("SteamID")),
-                                    faction=i.get("FactionName"),
-                                    **self.labels
-                                )
-                            )
+                    players = self.__players(labels, value)
                 else:
                     value = len(value)
+            elif isinstance(value, Columns):
+                if name == "grids" and self.grid_aggregation is not None:
+                    extra.extend(self.__grids(labels, value))
+                if "Position.X" in value:
+                    extra.extend(self.__density(labels, name, value))
+                if "EntityId" in value:
+                    extra.extend(self.__entity_churn(labels, name, value["EntityId"]))
+                value = len(value)
             elif isinstance(value, bool):
                 value = int(value)
 
         if players:
             return players
-        return Metric(name=name, value=value, **self.labels)
+        if extra:
+            return [Metric(name=name, value=value, labels=labels)] + extra
+        return Metric(name=name, value=value, labels=labels)
 
-    async def aioget_metric(self, name: str) -> Dict:
-        url, headers = self.__prepare_request(name)
+    def __players(self, labels: Tuple, players: List[Dict]) -> List[Metric]:
+        """Returns ping gauges of players while there are at most player_ping_limit of them,
+        otherwise the ping histogram by faction or server-wide. Label sets of players are taken from the LRU cache.
+        Players without a numeric positive ping (e.g. a null Ping of a player who is connecting) are skipped.
+        """
+        online = [i for i in players if self.__ping(i) > 0]
+        metrics = []
 
-        async with aiohttp.ClientSession(read_timeout=5, conn_timeout=5) as session:
-            async with session.get(url, headers=headers, raise_for_status=True) as response:
-                logger.debug(f"Request for {url} status: {response.status}")
-                try:
-                    res = await response.json()
-                except Exception as e:
-                    logger.error(e)
-                    return
-
-            result = res.get("data")
-            if name != "server":
-                return self.__mapping(universal_obj_hook(result))
-            return universal_obj_hook(result)
-
-    def aiofetch_metrics(self) -> List:
-        queue = [self.aioget_metric(res) for res in self.__OTHER_RESOURCES__]
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        metrics = loop.run_until_complete(asyncio.gather(*queue))
-        loop.close()
+        if len(online) <= self.player_ping_limit:
+            self._ping_limited = False
+            for i in online:
+                key = (labels, i.get("SteamID"), i.get("DisplayName"), i.get("FactionName"))
+                player_labels = self._player_labels.get(key)
+                if player_labels is None:
+                    player_labels = self._player_labels.put(key, labels + (
+                        ("faction", i.get("FactionName")),
+                        ("player_id", str(i.get("SteamID"))),
+                        ("player_name", i.get("DisplayName"))
+                    ))
+                metrics.append(Metric(name="player_ping", value=i.get("Ping"), labels=player_labels))
+            return metrics
 
-        rewrited_metrics = []
-        for metric in metrics:
-            if isinstance(metric, list):
-                for m in metric:
-                    rewrited_metrics.append(m)
+        if not self._ping_limited:
+            logger.warning(
+                f"{len(online)} players online on {self.name}, more than player_ping_limit "
+                f"{self.player_ping_limit}. Only ping distribution is exported"
+            )
+        self._ping_limited = True
+
+        buckets = self.__PING_BUCKETS__
+        histograms = {}
+        for i in online:
+            faction = (i.get("FactionName") or "") if self.player_ping_aggregation == "faction" else ""
+            counts, total = histograms.get(faction) or ([0] * (len(buckets) + 1), 0)
+            counts[bisect_left(buckets, i.get("Ping"))] += 1
+            histograms[faction] = (counts, total + i.get("Ping"))
+
+        for faction, value in histograms.items():
+            metrics.append(Metric(
+                name="player_ping_distribution",
+                value=value,
+                labels=labels + (("faction", faction),)
+            ))
+        return metrics
+
+    def __set_factions(self, factions: Dict) -> None:
+        """Replace factions of online players. If a faction of a grid owner has changed, the grids fingerprint
+        is dropped and cached grid metrics are grouped again from the columns of the last grids response,
+        so an unchanged grids body isn't served under stale faction labels.
+        """
+        previous, self._factions = self._factions, factions
+        if factions == previous:
+            return
+        if all(factions.get(owner, "") == faction for owner, faction in self._grid_factions.items()):
+            return
+
+        self._fingerprints.pop("session/grids", None)
+        cached = self._cache.get("session/grids")
+        if cached is None or self._grid_columns is None:
+            self._cache.pop("session/grids", None)
+            return
+        # grids aren't dropped until their next request, it would leave them out of collections in between
+        self._cache["session/grids"] = (cached[0], self.__mapping({"grids": self._grid_columns}))
+
+    def __ping(self, player: Dict) -> float:
+        """Returns the ping of the player or 0 if it isn't a number."""
+        ping = player.get("Ping")
+        if isinstance(ping, bool) or not isinstance(ping, (int, float)):
+            return 0
+        return ping
+
+    def __grids(self, labels: Tuple, columns: Columns) -> List[Metric]:
+        """Returns PCU, blocks and number of powered and unpowered grids by faction or owner.
+        Totals are accumulated in arrays indexed by group, grid records are never turned into dicts.
+        Factions of owners are taken from the last players response, which lists online players only.
+        """
+        by_owner = self.grid_aggregation == "owner"
+        factions = self._factions
+        owners = {}
+        groups = {}
+        names = []
+        pcu, blocks, powered, unpowered = array("q"), array("q"), array("q"), array("q")
+
+        for owner, name, grid_pcu, grid_blocks, is_powered in zip(
+            columns["OwnerSteamId"],
+            columns["OwnerDisplayName"],
+            columns["PCU"],
+            columns["BlocksCount"],
+            columns["IsPowered"]
+        ):
+            faction = factions.get(owner, "")
+            key = (faction, owner) if by_owner else faction
+            i = groups.get(key)
+            if i is None:
+                i = groups[key] = len(pcu)
+                for column in (pcu, blocks, powered, unpowered):
+                    column.append(0)
+                names.append(name or "")
+
+            owners[owner] = faction
+            pcu[i] += grid_pcu
+            blocks[i] += grid_blocks
+            if is_powered:
+                powered[i] += 1
+            else:
+                unpowered[i] += 1
+        self._grid_columns = columns
+        self._grid_factions = owners
+
+        metrics = []
+        for key, i in groups.items():
+            if by_owner:
+                faction, owner = key
+                group = (("faction", faction), ("owner_id", str(owner) if owner else ""), ("owner_name", names[i]))
             else:
-                rewrited_metrics.append(metric)
-        return rewrited_metrics
+                group = (("faction", key), ("owner_id", ""), ("owner_name", ""))
+
+            group_labels = self._group_labels.get((labels, group))
+            if group_labels is None:
+                group_labels = self._group_labels.put((labels, group), labels + group)
+
+            metrics.append(Metric(name="grids_pcu_used", value=pcu[i], labels=group_labels))
+            metrics.append(Metric(name="grids_blocks", value=blocks[i], labels=group_labels))
+            metrics.append(Metric(name="grids_count", value=powered[i], labels=group_labels + (("powered", "1"),)))
+            metrics.append(Metric(name="grids_count", value=unpowered[i], labels=group_labels + (("powered", "0"),)))
+        return metrics
+
+    def __density(self, labels: Tuple, entity: str, columns: Columns) -> List[Metric]:
+        """Returns the number of occupied cells, entity counts of the densest cells and density
+        quantiles over occupied cells. Positions are binned by a single pass of map() over the columns.
+        """
+        size = self.density_cell_size
+        scale = 1 / size
+        cells = Counter(zip(
+            map(floor, map(mul, columns["Position.X"], repeat(scale))),
+            map(floor, map(mul, columns["Position.Y"], repeat(scale))),
+            map(floor, map(mul, columns["Position.Z"], repeat(scale)))
+        ))
+        if not cells:
+            return []
+
+        entity_labels = labels + (("entity", entity),)
+        metrics = [Metric(name="entity_density_cells", value=len(cells), labels=entity_labels)]
+
+        # coordinates of the cells are values, not labels, so a moving hotspot doesn't create new series
+        for rank, (cell, number) in enumerate(cells.most_common(self.density_top_cells), 1):
+            rank_labels = entity_labels + (("rank", str(rank)),)
+            metrics.append(Metric(name="entity_density_top", value=number, labels=rank_labels))
+            for axis, i in zip("xyz", cell):
+                metrics.append(Metric(name=f"entity_density_top_{axis}", value=(i + 0.5) * size, labels=rank_labels))
+
+        densities = sorted(cells.values())
+        for quantile in self.__DENSITY_QUANTILES__:
+            metrics.append(Metric(
+                name="entity_density_quantile",
+                value=densities[min(int(quantile * len(densities)), len(densities) - 1)],
+                labels=entity_labels + (("quantile", str(quantile)),)
+            ))
+        return metrics
+
+    def __entity_churn(self, labels: Tuple, entity: str, ids: array) -> List[Metric]:
+        """Returns totals of entities created and removed since the first response of the resource.
+        Unique IDs of the previous response are kept as an int64 array, 8 bytes per entity,
+        and a set is built only for the current response. The first response is the baseline.
+        Concurrent scrapes are serialized, so two of them never diff against the same previous IDs.
+        """
+        with self._churn_lock:
+            previous = self._entity_ids.get(entity)
+            current = set(ids)
+            self._entity_ids[entity] = array("q", current)
+            totals = self._churn.setdefault(entity, [0, 0])
+            if previous is not None:
+                created = len(current.difference(previous))
+                totals[0] += created
+                totals[1] += len(previous) - (len(current) - created)
+            created, removed = totals
+
+        entity_labels = labels + (("entity", entity),)
+        return [
+            Metric(name="entity_created", value=created, labels=entity_labels),
+            Metric(name="entity_removed", value=removed, labels=entity_labels)
+        ]
+
+    def __session(self) -> "requests.Session":
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            self._session = requests.Session()
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        return self._session
+
+    def __aiosession(self) -> "aiohttp.ClientSession":
+        if self._aiosession is None or self._aiosession.closed:
+            import aiohttp
+
+            self._aiosession = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(sock_connect=5, sock_read=5)
+            )
+        return self._aiosession
+
+    def __decoder(self, name: str) -> MeteredDecoder:
+        schema = self.schemas.get(name)
+        if schema is None:
+            return MeteredDecoder(BufferedDecoder())
+
+        if self.change_detection:
+            return MeteredDecoder(FingerprintDecoder(StreamDecoder(schema), self._fingerprints, name))
+        return MeteredDecoder(StreamDecoder(schema))
+
+    def __record(self, name: str, status: int, chunks: List[bytes]) -> None:
+        try:
+            self.recorder.write(self.name, name, status, b"".join(chunks))
+        except (OSError, ValueError) as e:
+            logger.error(f"Can't record {name} response of {self.name}. {type(e).__name__} - {e}")
+
+    def __replayed(self, name: str) -> Optional[Dict]:
+        """Decode the next recorded response of the resource, as if it was received from the network."""
+        decoder = self.__decoder(name)
+        status, chunks = self.replay.read(self.name, name)
+        RESPONSES.labels(self.name, name, status).inc()
+        if status >= 400:
+            raise CaptureError(f"Recorded {name} response status is {status}")
+
+        for chunk in chunks:
+            decoder.feed(chunk)
+        result = decoder.result()
+
+        decoder.observe(self.name, name)
+        return result
+
+    async def __aiorequest(self, session: "aiohttp.ClientSession", name: str, timeout: float) -> Optional[Dict]:
+        import aiohttp
 
-    def get_metric(self, name: str) -> Dict:
         url, headers = self.__prepare_request(name)
+        decoder = self.__decoder(name)
+        recorded = [] if self.recorder is not None else None
 
-        with requests.Session() as session:
-            response = session.get(url, headers=headers, timeout=5)
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            logger.debug(f"Request for {url} status: {response.status}")
+            RESPONSES.labels(self.name, name, response.status).inc()
+            if recorded is not None and response.status >= 400:
+                self.__record(name, response.status, recorded)
+            response.raise_for_status()
+
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                decoder.feed(chunk)
+                if recorded is not None:
+                    recorded.append(chunk)
+            result = decoder.result()
+
+        decoder.observe(self.name, name)
+        if recorded is not None:
+            self.__record(name, response.status, recorded)
+        return result
+
+    def __request(self, session: "requests.Session", name: str, timeout: float) -> Dict:
+        url, headers = self.__prepare_request(name)
+        decoder = self.__decoder(name)
+        expires = monotonic() + timeout
+        recorded = [] if self.recorder is not None else None
+
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
             logger.debug(f"Request for {url} status: {response.status_code}")
+            RESPONSES.labels(self.name, name, response.status_code).inc()
+            if recorded is not None and response.status_code >= 400:
+                self.__record(name, response.status_code, recorded)
             response.raise_for_status()
 
-            result = response.json().get("data")
-            if name != "server":
-                return self.__mapping(universal_obj_hook(result))
-            return universal_obj_hook(result)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if monotonic() > expires:
+                    raise TimeoutError(f"Timeout reading {name} response")
+                decoder.feed(chunk)
+                if recorded is not None:
+                    recorded.append(chunk)
+            result = decoder.result()
 
-    def fetch_metrics(self) -> List:
-        metrics = []
-        for res in self.__OTHER_RESOURCES__:
-            metric = self.get_metric(res)
-            if isinstance(metric, list):
-                for m in metric:
-                    metrics.append(m)
-            else:
-                metrics.append(metric)
+        decoder.observe(self.name, name)
+        if recorded is not None:
+            self.__record(name, response.status_code, recorded)
+        return result
+
+    def __map(self, name: str, result: Optional[Dict]) -> Optional[List]:
+        if result is UNCHANGED:
+            if name not in self._cache:
+                self._fingerprints.pop(name, None)
+                return
+            UNCHANGED_RESPONSES.labels(self.name, name).inc()
+            return self._cache[name][1]
+
+        started = perf_counter()
+        if name == self.__BASE_RESOURCE__:
+            metrics = self.__base_metrics(result)
+        else:
+            metrics = self.__mapping(result)
+        MAPPING_DURATION.labels(self.name, name).observe(perf_counter() - started)
         return metrics
 
-    def metrics(self) -> List:
-        """Returns a list of metrics. Each metric is a dict."""
-        metrics = []
+    async def __aioget(self, name: str, timeout: float) -> Optional[Dict]:
+        """Request the resource over the persistent session or a new one, without mapping."""
+        if self.replay is not None:
+            return self.__replayed(name)  # replayed responses don't need a session
+        if self.persistent:
+            return await self.__aiorequest(self.__aiosession(), name, timeout)
 
-        if self.run_async:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            base_metrics = loop.run_until_complete(self.aioget_metric(self.__BASE_RESOURCE__))
-            loop.close()
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            return await self.__aiorequest(session, name, timeout)
+
+    async def aioget_metric(self, name: str, timeout: float = None) -> Dict:
+        timeout = timeout or self.timeout
+        result = await self.__aioget(name, timeout)
+        if name != self.__BASE_RESOURCE__:
+            return self.__map(name, result)
+        return result
+
+    def aiofetch_metrics(self, deadline_at: float = None) -> List:
+        started = monotonic()
+        due = self.__due(self.__OTHER_RESOURCES__, started)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        results = loop.run_until_complete(self.__gather(due, deadline_at))
+        loop.close()
+
+        # responses are mapped in order of resources, so grids are grouped by factions of the same cycle's players
+        self.__store(due, [self.__map(res, r) for res, r in zip(due, results)], started)
+        return self.__cached(self.__OTHER_RESOURCES__)
+
+    def get_metric(self, name: str, timeout: float = None) -> Dict:
+        timeout = timeout or self.timeout
+        if self.replay is not None:
+            result = self.__replayed(name)  # replayed responses don't need a session
+        elif self.persistent:
+            result = self.__request(self.__session(), name, timeout)
+        else:
+            import requests
+
+            with requests.Session() as session:
+                result = self.__request(session, name, timeout)
+
+        if name != self.__BASE_RESOURCE__:
+            return self.__map(name, result)
+        return result
+
+    def fetch_metrics(self, deadline_at: float = None) -> List:
+        started = monotonic()
+        due = self.__due(self.__OTHER_RESOURCES__, started)
+        results = [self.__fetch(res, self.__budget(deadline_at, len(due) - i)) for i, res in enumerate(due)]
+
+        self.__store(due, results, started)
+        return self.__cached(self.__OTHER_RESOURCES__)
+
+    def __budget(self, deadline_at: Optional[float], left: int = 1) -> float:
+        """Returns the timeout of the next request: the request timeout limited by
+        an equal share of time left until the deadline among left requests.
+        """
+        if deadline_at is None:
+            return self.timeout
+        return min(self.timeout, (deadline_at - monotonic()) / max(left, 1))
+
+    def __fetch(self, name: str, timeout: float) -> Optional[Dict]:
+        """Request the resource, count the result in its circuit breaker, never raise."""
+        if timeout <= 0:
+            logger.warning(f"Deadline exceeded, {name} skipped on {self.name}")
+            return
+
+        try:
+            result = self.get_metric(name, timeout)
+        except Exception as e:
+            return self.__failed(name, e)
+        return self.__succeeded(name, result)
+
+    async def __aiofetch(self, name: str, timeout: float, raw: bool = False) -> Optional[Dict]:
+        """Coroutine version of __fetch. Raw results are not mapped to metrics."""
+        if timeout <= 0:
+            logger.warning(f"Deadline exceeded, {name} skipped on {self.name}")
+            return
+
+        if raw:
+            request = self.__aioget(name, timeout)
         else:
-            base_metrics = self.get_metric(self.__BASE_RESOURCE__)
+            request = self.aioget_metric(name, timeout)
+
+        try:
+            result = await asyncio.wait_for(request, timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return self.__failed(name, e)
+        return self.__succeeded(name, result)
+
+    def __succeeded(self, name: str, result: Optional[Dict]) -> Optional[Dict]:
+        if result is None:
+            return self.__failed(name, ValueError("Empty or malformed response"))
+
+        self.breakers[name].success()
+        return result
+
+    def __failed(self, name: str, error: Exception) -> None:
+        # failed resources are dropped from the results instead of being served stale
+        self._cache.pop(name, None)
+        self._fingerprints.pop(name, None)
+        backoff = self.breakers[name].failure()
+        ERRORS.labels(self.name, name, type(error).__name__).inc()
+
+        message = f"Can't fetch {name} from {self.name}. {type(error).__name__} - {error}"
+        if backoff:
+            message += f". Circuit is open for {backoff:.0f}s"
+        logger.error(message)
+
+    def __due(self, resources: Tuple, now: float) -> Tuple:
+        """Returns resources which were never fetched or whose refresh interval has elapsed,
+        skipping resources with open circuits.
+        """
+        due = []
+        for res in resources:
+            if not self.breakers[res].allow(now):
+                continue
+
+            cached = self._cache.get(res)
+            if cached is None or now - cached[0] >= self.interval(res):
+                due.append(res)
+        return tuple(due)
+
+    def interval(self, resource: str) -> float:
+        """Returns the current refresh interval of the resource, stretched if the client backs off."""
+        interval = self.intervals.get(resource, 0)
+        if self.adaptive_polling and resource in self.__HEAVY_RESOURCES__:
+            return self.throttle.interval(interval)
+        return interval
+
+    @property
+    def concurrency(self) -> int:
+        """Returns the current max number of concurrent requests of async collections."""
+        if self.adaptive_polling:
+            return self.throttle.concurrency
+        return self.throttle.max_concurrency
+
+    @property
+    def collection_timeout(self) -> float:
+        """Returns the longest time one collection can take: the deadline if set, otherwise the timeout
+        of every request in turn, or of every wave of concurrent requests in async mode, plus a second of decoding.
+        With the deadline, waves of throttled requests share it, so it holds for any concurrency.
+        """
+        if self.deadline:
+            return self.deadline + 1
+        requests = len(self.__OTHER_RESOURCES__)
+        if self.run_async:
+            return self.timeout * (1 + self.__waves(requests)) + 1
+        return self.timeout * (1 + requests) + 1
+
+    def __adapt(self, base: Optional[Dict]) -> None:
+        if self.adaptive_polling and base:
+            self.throttle.update(base.get("sim_speed"), base.get("simulation_cpu_load"))
+
+    def __waves(self, requests: int) -> int:
+        """Returns the number of waves of concurrent requests needed for the requests."""
+        return -(-requests // max(self.concurrency, 1))
+
+    async def __gather(self, resources: Tuple, deadline_at: Optional[float]) -> List:
+        """Fetch raw results of resources concurrently, at most concurrency of them at a time.
+        The timeout of a request is taken once it gets a slot: time left until the deadline
+        is shared among the waves left, so throttled collections still finish by the deadline.
+        The base resource, without which there are no results, may take all the time left.
+        """
+        concurrency = max(self.concurrency, 1)
+        semaphore = asyncio.Semaphore(concurrency)
+        started = 0
+
+        async def limited(res: str) -> Optional[Dict]:
+            nonlocal started
+            async with semaphore:
+                waves = 1 if res == self.__BASE_RESOURCE__ else -(-(len(resources) - started) // concurrency)
+                started += 1
+                return await self.__aiofetch(res, self.__budget(deadline_at, waves), raw=True)
+
+        return await asyncio.gather(*[limited(res) for res in resources])
+
+    def __store(self, resources: Tuple, results: List, fetched_at: float) -> None:
+        for res, result in zip(resources, results):
+            if result is not None:
+                self._cache[res] = (fetched_at, result)
+
+    def __cached(self, resources: Tuple) -> List:
+        return self.__flatten(self._cache[res][1] for res in resources if res in self._cache)
+
+    def __flatten(self, metrics: List) -> List:
+        result = []
+        for metric in metrics:
+            if isinstance(metric, list):
+                result.extend(metric)
+            else:
+                result.append(metric)
+        return result
+
+    def __base_metrics(self, base_metrics: Dict) -> List:
+        metrics = []
 
         common_labels = ("server_name", "world_name")
         exclude = ("game", "server_id")
+        labels = dict(self.labels)
         for k, v in base_metrics.items():
             if k in common_labels:
                 self.labels.update({k.strip("_name"): v.lower()})
 
+        if labels != self.labels:
+            self._fingerprints.clear()  # previous metrics have stale labels
+
         for k, v in base_metrics.items():
             if k not in exclude and k not in common_labels:
                 metrics.append(self.__mapping({k: v}))
 
+        return metrics
+
+    def __cached_base(self) -> Dict:
+        if self.__BASE_RESOURCE__ not in self._cache:
+            raise RuntimeError(f"Can't fetch {self.__BASE_RESOURCE__} resource from {self.name}")
+        return self._cache[self.__BASE_RESOURCE__][1]
+
+    def __merge(self, metrics: List, other_metrics: List) -> List:
+        """Merge samples keyed by name and labels, the first sample of a series wins."""
+        merged = {}
+        for m in chain(metrics, other_metrics):
+            if m is not None:
+                merged.setdefault(m.key, m)
+        return list(merged.values())
+
+    async def acollect(self) -> List:
+        """Coroutine version of metrics() for persistent mode.
+        All resources, including the base one, are fetched concurrently
+        over the shared connection pool of the running event loop.
+        """
+        started = monotonic()
+        deadline_at = started + self.deadline if self.deadline else None
+        due = self.__due((self.__BASE_RESOURCE__,) + self.__OTHER_RESOURCES__, started)
+        results = await self.__gather(due, deadline_at)
+        results = dict(zip(due, results))
+
+        # the base resource sets common labels, so it must be mapped before others
+        base = results.pop(self.__BASE_RESOURCE__, None)
+        self.__store((self.__BASE_RESOURCE__,), [base], started)
+        self.__adapt(base)
+        metrics = self.__map(self.__BASE_RESOURCE__, self.__cached_base())
+
+        # players are mapped before grids, so grids are grouped by factions of the same cycle
+        self.__store(tuple(results), [self.__map(res, r) for res, r in results.items()], started)
+        return self.__merge(metrics, self.__cached(self.__OTHER_RESOURCES__))
+
+    def metrics(self) -> List:
+        """Returns a list of metrics. Each metric is a dict."""
+        if self.persistent and self.run_async:
+            if self._loop is None:
+                self._loop = EventLoopThread(name="vrage-loop")
+                self._own_loop = True
+            return self._loop.run(self.acollect())
+
+        started = monotonic()
+        deadline_at = started + self.deadline if self.deadline else None
+
+        if self.__due((self.__BASE_RESOURCE__,), started):
+            if self.run_async:
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                base_metrics = loop.run_until_complete(
+                    self.__aiofetch(self.__BASE_RESOURCE__, self.__budget(deadline_at))
+                )
+                loop.close()
+            else:
+                base_metrics = self.__fetch(
+                    self.__BASE_RESOURCE__,
+                    self.__budget(deadline_at, len(self.__OTHER_RESOURCES__) + 1)
+                )
+            self.__store((self.__BASE_RESOURCE__,), [base_metrics], started)
+            self.__adapt(base_metrics)
+
+        metrics = self.__map(self.__BASE_RESOURCE__, self.__cached_base())
+
         if self.run_async:
-            other_metrics = self.aiofetch_metrics()
+            other_metrics = self.aiofetch_metrics(deadline_at)
         else:
-            other_metrics = self.fetch_metrics()
+            other_metrics = self.fetch_metrics(deadline_at)
 
-        for m in other_metrics:
-            if m not in metrics:
-                metrics.append(m)
+        return self.__merge(metrics, other_metrics)
 
+    def snapshot(self) -> Dict:
+        """Returns the latest decoded state of the server: server info, players and counts of entities.
+        Resources which weren't fetched yet or failed are left out.
+        """
+        cache = self._cache
+        base = cache.get(self.__BASE_RESOURCE__)
+        state = dict(labels=dict(self.labels), server=dict(base[1]) if base else None, players=[], counts={})
+
+        if "session/players" in cache:
+            state["players"] = [
+                dict(
+                    steam_id=i.get("SteamID"),
+                    display_name=i.get("DisplayName"),
+                    faction_name=i.get("FactionName"),
+                    ping=i.get("Ping")
+                )
+                for i in self._players
+            ]
+            state["counts"]["players"] = len(self._players)
+
+        for res in self.__OTHER_RESOURCES__:
+            if res == "session/players" or res not in cache:
+                continue
+            name = self.schemas[res].name
+            for m in self.__flatten([cache[res][1]]):
+                if m is not None and m.name == name:
+                    state["counts"][name] = m.value
+                    break
+        return state
+
+    def __sample_due(self, now: float) -> bool:
+        """Check the circuit of the server resource and, while the client backs off, space samples out
+        like refresh intervals of heavy resources, doubling the interval on every level.
+        """
+        if not self.breakers[self.__BASE_RESOURCE__].allow(now):
+            return False
+        if not self.adaptive_polling or self.throttle.level == 0:
+            return True
+        # half an interval of slack, since the sampler ticks at the interval and ticks jitter
+        return now - self._sampled_at >= self.sample_interval * (2 ** self.throttle.level - 0.5)
+
+    def sample(self) -> None:
+        """Request the server resource and append sampled fields to the ring buffers.
+        Samples are requested over a keep-alive session, which is kept even if the client isn't persistent,
+        and counted in the circuit breaker of the resource. Replayed and recorded clients aren't sampled,
+        so captures hold responses of collections only.
+        """
+        name = self.__BASE_RESOURCE__
+        now = monotonic()
+        if self.replay is not None or self.recorder is not None or not self.__sample_due(now):
+            return
+
+        self._sampled_at = now
+        try:
+            result = self.__request(self.__session(), name, self.timeout)
+        except Exception as e:
+            self.breakers[name].failure()
+            ERRORS.labels(self.name, name, type(e).__name__).inc()
+            raise
+        if not result:
+            return
+
+        self.breakers[name].success()
+        now = monotonic()
+        for field, ring in self._samples.items():
+            value = result.get(field)
+            if value is not None:
+                ring.append(now, float(value))
+
+    def __window_name(self, seconds: int) -> str:
+        return f"{seconds // 60}m" if seconds % 60 == 0 else f"{seconds}s"
+
+    def window_metrics(self) -> List[Metric]:
+        """Returns min, max, mean and quantiles of sampled fields over every window."""
+        now = monotonic()
+        labels = intern_labels(self.labels)
+        metrics = []
+
+        for field, ring in self._samples.items():
+            for window in self.sample_windows:
+                values = sorted(ring.window(window, now))
+                if not values:
+                    continue
+
+                stats = [("min", values[0]), ("max", values[-1]), ("mean", fsum(values) / len(values))]
+                stats.extend(
+                    (f"p{round(quantile * 100)}", values[min(int(quantile * len(values)), len(values) - 1)])
+                    for quantile in self.__SAMPLE_QUANTILES__
+                )
+
+                name = f"{field}_window"
+                window_labels = labels + (("window", self.__window_name(window)),)
+                for stat, value in stats:
+                    metrics.append(Metric(name=name, value=value, labels=window_labels + (("stat", stat),)))
         return metrics
+
+    async def aclose(self) -> None:
+        if self._aiosession is not None and not self._aiosession.closed:
+            await self._aiosession.close()
+
+    def close(self) -> None:
+        """Close persistent sessions and stop the client event loop."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+        if self._loop is not None:
+            self._loop.run(self.aclose())
+            if self._own_loop:
+                self._loop.stop()
+            self._loop = None
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""This module contains ExporterApp WSGI application and a threaded WSGI server for it."""
+
+import logging
+import threading
+from http import HTTPStatus
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from se_exporter.client.api import SnapshotAPI
+from se_exporter.client.debug import DebugEndpoints
+from se_exporter.client.exposition import ExpositionCache
+from se_exporter.models.base import Base
+from prometheus_client import make_wsgi_app
+from prometheus_client.core import REGISTRY, CollectorRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class ExporterApp(Base):
+    """This object represents the WSGI application of the exporter.
+
+    Without the cache the registry is rendered on every request by prometheus_client.
+    With the cache, prerendered plain or gzip bodies are served with ETag and
+    If-None-Match support. /healthz answers while the server is alive.
+    Debug endpoints are served under /debug/ and the snapshot API on /api/snapshot, if given.
+    """
+    def __init__(
+        self,
+        registry: CollectorRegistry = REGISTRY,
+        cache: ExpositionCache = None,
+        debug: DebugEndpoints = None,
+        api: SnapshotAPI = None
+    ):
+        self.registry = registry
+        self.cache = cache
+        self.debug = debug
+        self.api = api
+        self._metrics_app = make_wsgi_app(registry)
+
+    def __call__(self, environ: dict, start_response):
+        if environ.get("PATH_INFO") == "/healthz":
+            return self.__respond(start_response, 200, [("Content-Type", "text/plain")], b"OK\n")
+
+        path = environ.get("PATH_INFO", "")
+        if self.debug is not None and path.startswith("/debug/"):
+            query = dict(parse_qsl(environ.get("QUERY_STRING", "")))
+            return self.__respond(start_response, *self.debug.handle(path, query))
+
+        if self.api is not None and path == "/api/snapshot":
+            response = self.api.handle(
+                dict(parse_qsl(environ.get("QUERY_STRING", ""))),
+                if_none_match=environ.get("HTTP_IF_NONE_MATCH"),
+                accept=environ.get("HTTP_ACCEPT"),
+                accept_encoding=environ.get("HTTP_ACCEPT_ENCODING")
+            )
+            return self.__respond(start_response, *response)
+
+        if self.cache is None:
+            return self._metrics_app(environ, start_response)
+
+        status, headers, body = self.cache.response(
+            if_none_match=environ.get("HTTP_IF_NONE_MATCH"),
+            accept_encoding=environ.get("HTTP_ACCEPT_ENCODING")
+        )
+        return self.__respond(start_response, status, headers, body)
+
+    def __respond(self, start_response, status: int, headers: list, body: bytes) -> list:
+        status = HTTPStatus(status)
+        start_response(f"{status.value} {status.phrase}", headers + [("Content-Length", str(len(body)))])
+        return [body]
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """Thread per request server."""
+    daemon_threads = True
+
+
+class _SilentHandler(WSGIRequestHandler):
+    """WSGI handler that does not log requests."""
+    def log_message(self, format, *args):
+        pass
+
+
+def start_wsgi_server(app: ExporterApp, addr: str = "0.0.0.0", port: int = 9122) -> WSGIServer:
+    """Start a threaded WSGI server for the app in a daemon thread."""
+    httpd = make_server(addr, port, app, _ThreadingWSGIServer, handler_class=_SilentHandler)
+    thread = threading.Thread(target=httpd.serve_forever, name="wsgi-server", daemon=True)
+    thread.start()
+    return httpd
@@ -5,10 +5,10 @@ import argparse
 import logging
 
 from .__version__ import __version__
-from .client.prometheus import SpaceEngineersExporter
-from .client.vrage import VRageAPI
 from .utils.config import Config
 
+logger = logging.getLogger(__name__)
+
 parser = argparse.ArgumentParser(
     prog="space-engineers-exporter",
     description="Prometheus exporter for Space Engineers Dedicated Server",
@@ -78,12 +78,185 @@ options.add_argument(
     required=False,
     help="Path to the config file"
 )
+options.add_argument(
+    "--targets-file",
+    metavar="file",
+    dest="targets_file",
+    type=str,
+    required=False,
+    help="Path to the targets file in file_sd format, merged with config targets"
+)
+options.add_argument(
+    "--watch-config",
+    action="store_true",
+    help="Reload the config file and the targets file on change, without a restart"
+)
 options.add_argument(
     "-a", "--run-async",
     action="store_true",
     help="Enable async collect metrics from SE. It works much faster. \
           If your se server doesn't have good perfomance - don't use this feature"
 )
+options.add_argument(
+    "--persistent",
+    action="store_true",
+    help="Keep one event loop and one keep-alive connection pool for the process lifetime"
+)
+options.add_argument(
+    "--pool-size",
+    metavar="size",
+    dest="pool_size",
+    type=int,
+    required=False,
+    help="Max connections in the persistent pool. Default: 10"
+)
+options.add_argument(
+    "-b", "--background-polling",
+    action="store_true",
+    help="Poll SE in the background and serve the latest snapshot on scrape"
+)
+options.add_argument(
+    "--poll-interval",
+    metavar="seconds",
+    dest="poll_interval",
+    type=float,
+    required=False,
+    help="Interval between background polls. Default: 15"
+)
+options.add_argument(
+    "--server",
+    metavar="wsgi/asyncio",
+    dest="server",
+    type=str,
+    required=False,
+    help="HTTP server type. Asyncio server enables background polling, persistent and async modes. Default: wsgi"
+)
+options.add_argument(
+    "--max-requests",
+    metavar="count",
+    dest="max_requests",
+    type=int,
+    required=False,
+    help="Max concurrent requests to the asyncio server. Default: 64"
+)
+options.add_argument(
+    "-w", "--workers",
+    metavar="count",
+    dest="workers",
+    type=int,
+    required=False,
+    help="Worker processes polling shards of the fleet targets. Default: 1"
+)
+options.add_argument(
+    "--exposition-cache",
+    action="store_true",
+    help="Render metrics once per new snapshot and serve them with gzip and ETag support"
+)
+options.add_argument(
+    "--adaptive-polling",
+    action="store_true",
+    help="Back off while the server is struggling: lower concurrency and stretch heavy resource intervals"
+)
+options.add_argument(
+    "--change-detection",
+    action="store_true",
+    help="Skip decoding of VRage API responses identical to the previous ones"
+)
+options.add_argument(
+    "--player-ping-limit",
+    metavar="count",
+    dest="player_ping_limit",
+    type=int,
+    required=False,
+    help="Max players with own ping series, only ping distribution is exported above it. Default: 100"
+)
+options.add_argument(
+    "--density-cell-size",
+    metavar="meters",
+    dest="density_cell_size",
+    type=float,
+    required=False,
+    help="Bin positions of grids and floating objects into cells of this size to find hotspots"
+)
+options.add_argument(
+    "--entity-churn",
+    action="store_true",
+    help="Count grids, characters and floating objects created and removed"
+)
+options.add_argument(
+    "--sample-interval",
+    metavar="seconds",
+    dest="sample_interval",
+    type=float,
+    required=False,
+    help="Sample simulation speed and CPU load at this interval for windowed statistics"
+)
+options.add_argument(
+    "--record",
+    metavar="file",
+    dest="record",
+    type=str,
+    required=False,
+    help="Append raw VRage API responses to the capture file"
+)
+options.add_argument(
+    "--replay",
+    metavar="file",
+    dest="replay",
+    type=str,
+    required=False,
+    help="Read VRage API responses from the capture file instead of the network"
+)
+options.add_argument(
+    "--replay-speed",
+    metavar="realtime/max",
+    dest="replay_speed",
+    choices=["realtime", "max"],
+    required=False,
+    help="Replay responses as they were recorded in time or one after another. Default: realtime"
+)
+options.add_argument(
+    "--push-url",
+    metavar="url",
+    dest="push_url",
+    type=str,
+    required=False,
+    help="Push metrics to this remote write receiver or Pushgateway. Enables background polling"
+)
+options.add_argument(
+    "--push-protocol",
+    metavar="protocol",
+    dest="push_protocol",
+    choices=["remote_write", "pushgateway"],
+    required=False,
+    help="Push protocol, remote_write or pushgateway. Default: remote_write"
+)
+options.add_argument(
+    "--push-interval",
+    metavar="seconds",
+    dest="push_interval",
+    type=float,
+    required=False,
+    help="Interval between pushes, samples are batched in between. Default: 60"
+)
+options.add_argument(
+    "--push-spool-dir",
+    metavar="dir",
+    dest="push_spool_dir",
+    type=str,
+    required=False,
+    help="Directory of undelivered remote write batches. Default: se-exporter-push in the temp dir"
+)
+options.add_argument(
+    "--snapshot-api",
+    action="store_true",
+    help="Serve the latest decoded snapshot as JSON or MessagePack on /api/snapshot. Requires background polling"
+)
+options.add_argument(
+    "--debug-endpoints",
+    action="store_true",
+    help="Serve profiling endpoints under /debug/. Don't expose them publicly"
+)
 options.add_argument(
     "--loglevel",
     metavar="debug/info/warning/error",
@@ -91,26 +264,201 @@ options.add_argument(
     help="Log facility. Default: info"
 )
 
-args = parser.parse_args()
-config = Config(args.config)
-
-logging.basicConfig(
-    level=args.loglevel or config.loglevel,
-    datefmt="%d/%m/%Y %H:%M:%S",
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
-logger = logging.getLogger(__name__)
 
+def targets(args: argparse.Namespace, config: Config) -> list:
+    """Returns the list of SE targets. A single target is built from args when no targets configured."""
+    if config.targets or config.targets_file:
+        return config.targets
 
-def main() -> None:
-    client = VRageAPI(
+    return [dict(
         host=args.host or config.host,
         token=args.token or config.token,
-        port=args.port or config.port,
-        run_async=args.run_async or config.run_async
+        port=args.port or config.port
+    )]
+
+
+def client_options(args: argparse.Namespace, config: Config, target: dict, fleet: bool, server: str = None) -> dict:
+    """Returns VRageAPI arguments of the target. The asyncio server polls only persistent async clients,
+    their collections run on the server loop instead of threads with event loops of their own.
+    """
+    native = server == "asyncio"
+    replaying = bool(args.replay or config.replay)
+    host = target.get("host") or ("localhost" if replaying else None)
+    port = target.get("port") or config.port or 8080
+    name = target.get("name") or f"{str(host).split('://')[-1]}:{port}"
+    labels = dict(target.get("labels") or {})
+    if fleet:
+        labels.setdefault("target", name)
+
+    return dict(
+        host=host,
+        token=target.get("token") or config.token or ("" if replaying else None),
+        port=port,
+        run_async=args.run_async or config.run_async or native,
+        persistent=args.persistent or config.persistent or native,
+        pool_size=args.pool_size or config.pool_size,
+        labels=labels,
+        name=name,
+        resource_intervals={**config.resource_intervals, **(target.get("resource_intervals") or {})},
+        timeout=config.request_timeout,
+        deadline=config.scrape_deadline,
+        failure_threshold=config.failure_threshold,
+        backoff=config.backoff,
+        max_backoff=config.max_backoff,
+        change_detection=args.change_detection or config.change_detection,
+        player_ping_limit=args.player_ping_limit if args.player_ping_limit is not None else config.player_ping_limit,
+        player_ping_aggregation=config.player_ping_aggregation,
+        grid_aggregation=None if str(config.grid_aggregation).lower() == "none" else config.grid_aggregation,
+        density_cell_size=args.density_cell_size or config.density_cell_size,
+        density_top_cells=config.density_top_cells,
+        entity_churn=args.entity_churn or config.entity_churn,
+        adaptive_polling=args.adaptive_polling or config.adaptive_polling,
+        min_sim_speed=config.min_sim_speed,
+        max_cpu_load=config.max_cpu_load,
+        sample_interval=args.sample_interval or config.sample_interval,
+        sample_windows=config.sample_windows
+    )
+
+
+def poll_options(args: argparse.Namespace, config: Config) -> dict:
+    """Returns VRagePoller arguments."""
+    return dict(
+        interval=args.poll_interval or config.poll_interval,
+        max_concurrency=config.max_concurrency,
+        timeout=config.poll_timeout
+    )
+
+
+def push_options(args: argparse.Namespace, config: Config) -> dict:
+    """Returns Pusher arguments."""
+    return dict(
+        url=args.push_url or config.push_url,
+        protocol=args.push_protocol or config.push_protocol,
+        interval=args.push_interval or config.push_interval,
+        job=config.push_job,
+        instance=config.push_instance,
+        max_samples=config.push_max_samples,
+        headers=config.push_headers,
+        timeout=config.push_timeout,
+        spool_dir=args.push_spool_dir or config.push_spool_dir,
+        spool_size=int(config.push_spool_size_mb * 1024 * 1024)
+    )
+
+
+def main() -> None:
+    args = parser.parse_args()
+    config = Config(args.config, targets_file=args.targets_file)
+
+    logging.basicConfig(
+        level=(args.loglevel or config.loglevel).upper(),
+        datefmt="%d/%m/%Y %H:%M:%S",
+        format="%(asctime)s [%(levelname)s] %(message)s"
     )
 
-    exporter = SpaceEngineersExporter(vrage_client=client)
+    # modules are imported here, after arguments are parsed, so --help and --version don't wait for them
+    from .client.capture import CaptureReader, CaptureWriter
+    from .client.poller import VRagePoller
+    from .client.prometheus import SpaceEngineersExporter
+    from .client.sampler import ServerSampler
+    from .client.vrage import VRageAPI
+    from .utils.loop import EventLoopThread
+
+    fleet = bool(config.targets or config.targets_file)
+    watch = args.watch_config or config.watch_config
+    server = args.server or config.server
+    workers = args.workers or config.workers
+
+    if fleet and workers > 1:
+        from .client.supervisor import Supervisor
+
+        if args.record or config.record or args.replay or config.replay:
+            logger.warning("Record and replay aren't supported with worker processes, ignored")
+        if args.push_url or config.push_url:
+            logger.warning("Push isn't supported with worker processes, ignored")
+        if watch:
+            logger.warning("Config reload isn't supported with worker processes, ignored")
+        supervisor = Supervisor(
+            targets=[client_options(args, config, target, fleet) for target in targets(args, config)],
+            workers=workers,
+            poll_options=poll_options(args, config),
+            spool_dir=config.spool_dir,
+            loglevel=(args.loglevel or config.loglevel).upper()
+        )
+        exporter = SpaceEngineersExporter(
+            supervisor=supervisor,
+            server=server,
+            debug=args.debug_endpoints or config.debug_endpoints,
+            api=args.snapshot_api or config.snapshot_api
+        )
+        exporter.run(
+            addr=args.listen_addr or config.listen_addr,
+            port=args.listen_port or config.listen_port
+        )
+        return
+
+    if workers > 1:
+        logger.warning("Worker processes require fleet mode (targets in the config file), ignored")
+
+    transport = {}
+    if args.record or config.record:
+        transport["recorder"] = CaptureWriter(args.record or config.record)
+    if args.replay or config.replay:
+        transport["replay"] = CaptureReader(
+            args.replay or config.replay,
+            speed=args.replay_speed or config.replay_speed
+        )
+
+    push = bool(args.push_url or config.push_url)
+    background = args.background_polling or config.background_polling or fleet or server == "asyncio" or push
+    loop = EventLoopThread(name="vrage-loop") if background and server != "asyncio" else None
+
+    options = [client_options(args, config, target, fleet, server) for target in targets(args, config)]
+    clients = [VRageAPI(loop=loop, **transport, **target) for target in options]
+
+    sampler = ServerSampler(clients)
+    sampler.start()
+
+    poller = None
+    if background:
+        poller = VRagePoller(clients=clients, loop=loop, **poll_options(args, config))
+
+    if watch:
+        from .client.reloader import ConfigReloader
+
+        def load() -> tuple:
+            loaded = Config(args.config, targets_file=args.targets_file)
+            targets_options = [
+                client_options(args, loaded, target, fleet, server) for target in targets(args, loaded)
+            ]
+            return loaded, targets_options, poll_options(args, loaded)
+
+        ConfigReloader(
+            load=load,
+            create=lambda target: VRageAPI(loop=loop, **transport, **target),
+            config=config,
+            options=options,
+            clients=clients,
+            poller=poller,
+            sampler=sampler,
+            interval=config.reload_interval
+        ).start()
+
+    pusher = None
+    if push:
+        from .client.push import Pusher
+
+        pusher = Pusher(poller=poller, **push_options(args, config))
+
+    exporter = SpaceEngineersExporter(
+        vrage_client=clients[0] if clients else None,
+        poller=poller,
+        cache=args.exposition_cache or config.exposition_cache,
+        server=server,
+        max_requests=args.max_requests or config.max_requests,
+        debug=args.debug_endpoints or config.debug_endpoints,
+        api=args.snapshot_api or config.snapshot_api,
+        pusher=pusher
+    )
     exporter.run(
         addr=args.listen_addr or config.listen_addr,
         port=args.listen_port or config.listen_port
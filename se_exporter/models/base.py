@@ -9,6 +9,7 @@ class Base(object):
     """Base class for metrics objects."""
 
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     def __str__(self):
         return str(self.to_dict())
@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
 """This module contains a Config for app."""
 
-import yaml
 from se_exporter.models.base import Base
 
 
 class Config(Base):
 
-    def __init__(self, filepath: str = None):
+    def __init__(self, filepath: str = None, targets_file: str = None):
         self.filepath = filepath
         self.token = None
         self.host = None
@@ -16,10 +15,63 @@ class Config(Base):
         self.listen_port = 9122
         self.loglevel = "INFO"
         self.run_async = False
+        self.persistent = False
+        self.pool_size = 10
+        self.background_polling = False
+        self.poll_interval = 15
+        self.poll_timeout = None
+        self.max_concurrency = 4
+        self.targets = []
+        self.targets_file = None
+        self.watch_config = False
+        self.reload_interval = 5
+        self.workers = 1
+        self.spool_dir = None
+        self.exposition_cache = False
+        self.server = "wsgi"
+        self.max_requests = 64
+        self.resource_intervals = {}
+        self.request_timeout = 5
+        self.scrape_deadline = None
+        self.failure_threshold = 3
+        self.backoff = 30
+        self.max_backoff = 600
+        self.change_detection = False
+        self.player_ping_limit = 100
+        self.player_ping_aggregation = "faction"
+        self.grid_aggregation = None
+        self.density_cell_size = None
+        self.density_top_cells = 5
+        self.entity_churn = False
+        self.adaptive_polling = False
+        self.min_sim_speed = 0.9
+        self.max_cpu_load = 80
+        self.record = None
+        self.replay = None
+        self.replay_speed = "realtime"
+        self.sample_interval = None
+        self.sample_windows = [60, 300]
+        self.push_url = None
+        self.push_protocol = "remote_write"
+        self.push_interval = 60
+        self.push_job = "se_exporter"
+        self.push_instance = None
+        self.push_max_samples = 50000
+        self.push_headers = {}
+        self.push_timeout = 10
+        self.push_spool_dir = None
+        self.push_spool_size_mb = 64
+        self.snapshot_api = False
+        self.debug_endpoints = False
 
         self.__build()
+        self.targets_file = targets_file or self.targets_file
+        if self.targets_file:
+            self.targets = list(self.targets or []) + self.__read_targets()
 
     def __read(self):
+        import yaml
+
         try:
             with open(self.filepath, "r") as cfgfile:
                 data = yaml.load(cfgfile, Loader=yaml.Loader)
@@ -41,3 +93,47 @@ class Config(Base):
             if key.lower() == "loglevel":
                 value = value.upper()
             setattr(self, key, value)
+
+    def __read_targets(self) -> list:
+        """Read targets from a file in the file_sd format of Prometheus, YAML or JSON:
+
+            - targets: ["se1.example.com:8080", "se2.example.com:8080"]
+              labels: {env: prod, __token__: "key"}
+
+        Labels starting with __ aren't exported: __token__ is the Remote API key of the targets
+        and __scheme__ is http or https.
+        """
+        import yaml
+
+        try:
+            with open(self.targets_file, "r") as fh:
+                groups = yaml.safe_load(fh)
+        except FileNotFoundError:
+            raise RuntimeError(f"Targets file not found: {self.targets_file}")
+        except yaml.YAMLError as e:
+            raise RuntimeError(f"Corrupted targets file: {e}")
+
+        if groups is None:
+            return []
+        if not isinstance(groups, list):
+            raise RuntimeError("Targets file must contain a list of target groups")
+
+        targets = []
+        for group in groups:
+            if not isinstance(group, dict):
+                raise RuntimeError(f"Bad target group in the targets file: {group}")
+
+            labels = {str(k): str(v) for k, v in (group.get("labels") or {}).items()}
+            meta = {k: labels.pop(k) for k in list(labels) if k.startswith("__")}
+            scheme = meta.get("__scheme__")
+            for address in group.get("targets") or []:
+                host, _, port = str(address).rpartition(":")
+                if not host or not port.isdigit():
+                    host, port = str(address), None
+
+                target = dict(host=f"{scheme}://{host}" if scheme else host, port=int(port) if port else None)
+                target["labels"] = dict(labels)
+                if "__token__" in meta:
+                    target["token"] = meta["__token__"]
+                targets.append(target)
+        return targets
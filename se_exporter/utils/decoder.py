@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""This module contains Schema and decoders of VRage API responses."""
+
+import codecs
+import hashlib
+import json
+import logging
+import re
+from array import array
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from se_exporter.models.base import Base
+from se_exporter.utils.helpers import universal_obj_hook
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+UNCHANGED = object()  # the result of a response which is byte-identical to the previous one
+
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_END = re.compile(r'["\\]')
+_SEPARATORS = re.compile(r'[\s,]*')
+_ELEMENT_END = frozenset(" \t\r\n,]")
+
+
+class Schema(NamedTuple):
+    """This object represents a precompiled decoding schema of a session or admin resource.
+
+    The name replaces the camel case key of the resource array, so no key conversion is needed.
+    Without fields only the number of array elements is counted, otherwise every element
+    is reduced to a dict of the listed fields. With columns, values of listed fields are
+    accumulated into Columns: arrays of the given typecode, or lists if typecode is None.
+    A dotted field like "Position.X" is a field of a nested object.
+    """
+    name: str
+    fields: Optional[Tuple[str, ...]] = None
+    columns: Optional[Tuple[Tuple[str, Optional[str]], ...]] = None
+
+
+class Columns(Base):
+    """This object represents array-backed columns of decoded array elements, one per field.
+    Elements aren't kept, so memory is a few bytes per element and field instead of a dict per element.
+    """
+    def __init__(self, columns: Tuple[Tuple[str, Optional[str]], ...]):
+        self.count = 0
+        self.arrays = {field: array(typecode) if typecode else [] for field, typecode in columns}
+        self._appenders = tuple(
+            (tuple(field.split(".")), self.arrays[field].append, self.__convert(typecode))
+            for field, typecode in columns
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, field: str):
+        return self.arrays[field]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.arrays
+
+    def __convert(self, typecode: Optional[str]):
+        if typecode is None:
+            return None
+        return float if typecode in "fd" else int
+
+    def append(self, item: Dict) -> None:
+        for path, append, convert in self._appenders:
+            value = item
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            append(convert(value or 0) if convert else value)
+        self.count += 1
+
+
+class StreamDecoder(Base):
+    """This object represents an incremental decoder of a VRage API response body
+    like {"data": {"Grids": [{...}, {...}]}, "meta": {...}}.
+
+    Chunks are fed as they arrive from the network. The prefix is scanned up to the array
+    inside "data", then array elements are decoded one at a time, so memory doesn't grow
+    with the size of the world.
+    """
+    __SEEK__ = 0
+    __ARRAY__ = 1
+    __DONE__ = 2
+
+    def __init__(self, schema: Schema):
+        self.schema = schema
+        self.count = 0
+        self.items = [] if schema.fields else None
+        self.columns = Columns(schema.columns) if schema.columns else None
+        self._state = self.__SEEK__
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = []
+        self._last_key = None
+        self._in_data = False
+
+    def feed(self, chunk: bytes) -> None:
+        """Decode the next chunk of the response body."""
+        if self._state == self.__DONE__:
+            return
+
+        text = self._text.decode(chunk)
+        if self._state == self.__SEEK__:
+            text = self.__seek(text)
+
+        if self._state == self.__ARRAY__:
+            self._buffer += text
+            self.__consume()
+
+    def __seek(self, text: str) -> str:
+        """Scan the body prefix up to the array of the data object.
+        Returns the rest of the text after the opening bracket of the array.
+        """
+        pos = 0
+        size = len(text)
+
+        while pos < size:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+
+                match = _STRING_END.search(text, pos)
+                end = match.start() if match else size
+                if self._depth == 1:
+                    self._key.append(text[pos:end])
+                if match is None:
+                    return ""
+
+                if text[end] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = "".join(self._key)
+                pos = end + 1
+                continue
+
+            match = _STRUCTURE.search(text, pos)
+            if match is None:
+                return ""
+
+            char = match.group()
+            pos = match.end()
+
+            if char == '"':
+                self._in_string = True
+                self._key = []
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and char == "{" and self._last_key == "data":
+                    self._in_data = True
+                elif self._depth == 3 and char == "[" and self._in_data:
+                    self._state = self.__ARRAY__
+                    return text[pos:]
+            else:
+                if self._depth == 2:
+                    self._in_data = False
+                self._depth -= 1
+
+        return ""
+
+    def __consume(self) -> None:
+        """Decode complete array elements from the buffer, keep an incomplete tail for the next chunk."""
+        buffer = self._buffer
+        fields = self.schema.fields
+        columns = self.columns
+        pos = 0
+
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+
+            if buffer[pos] == "]":
+                self._state = self.__DONE__
+                pos = len(buffer)
+                break
+
+            try:
+                item, pos_end = self._json.raw_decode(buffer, pos)
+            except ValueError:
+                break  # the element isn't received completely yet
+            if pos_end == len(buffer) or buffer[pos_end] not in _ELEMENT_END:
+                break  # a number cut by the chunk boundary is decoded partially, it's complete only before a separator
+
+            pos = pos_end
+            self.count += 1
+            if fields and isinstance(item, dict):
+                self.items.append({field: item.get(field) for field in fields})
+            elif columns is not None and isinstance(item, dict):
+                columns.append(item)
+
+        self._buffer = buffer[pos:]
+
+    def result(self) -> Optional[Dict]:
+        """Returns decoded data in the same shape as the data of the response,
+        or None if the body doesn't contain a complete array.
+        """
+        if self._state != self.__DONE__:
+            return None
+
+        if self.schema.fields:
+            return {self.schema.name: self.items}
+        if self.columns is not None:
+            return {self.schema.name: self.columns}
+        return {self.schema.name: self.count}
+
+
+class BufferedDecoder(Base):
+    """This object represents a decoder of small responses with the same interface as StreamDecoder.
+    The body is buffered and decoded at once, keys of the data are converted to snake case.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def feed(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+
+    def result(self) -> Optional[Dict]:
+        try:
+            data = json.loads(b"".join(self._chunks))
+        except ValueError as e:
+            logger.error(e)
+            return None
+        return universal_obj_hook(data.get("data"))
+
+
+class FingerprintDecoder(Base):
+    """This object represents a decoder which skips byte-identical responses.
+
+    Chunks are buffered and fingerprinted while the body is received. If the fingerprint
+    matches the previous one of the resource, the body isn't decoded at all and
+    the result is UNCHANGED, otherwise the buffered body is fed to the wrapped decoder.
+
+    Arguments:
+      :decoder: StreamDecoder or BufferedDecoder
+      :fingerprints: dict
+      :name: str
+
+    """
+    def __init__(self, decoder, fingerprints: Dict[str, bytes], name: str):
+        self.decoder = decoder
+        self.fingerprints = fingerprints
+        self.name = name
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._chunks = []
+
+    def feed(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self._chunks.append(chunk)
+
+    def result(self):
+        digest = self._hash.digest()
+        if self.fingerprints.get(self.name) == digest:
+            return UNCHANGED
+
+        for chunk in self._chunks:
+            self.decoder.feed(chunk)
+        self._chunks = []
+
+        result = self.decoder.result()
+        if result is not None:
+            self.fingerprints[self.name] = digest
+        return result
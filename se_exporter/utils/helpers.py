@@ -2,8 +2,18 @@
 """This module contains helper functions."""
 
 import re
+import threading
+from functools import lru_cache
+from typing import Dict, Tuple
 
+from se_exporter.utils.lru import LRUCache
 
+# bounded, so label sets of removed targets and churning players don't accumulate
+_LABEL_SETS = LRUCache(maxsize=4096)
+_LABEL_SETS_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
 def convert_camel_to_snake(text: str):
     s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', text)
     return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
@@ -32,3 +42,15 @@ def _object_hook(obj: dict):
 
         cleaned_object.update({key: value})
     return cleaned_object
+
+
+def intern_labels(labels: Dict) -> Tuple:
+    """Returns labels as a tuple of (name, value) pairs sorted by name.
+    Equal label sets share one tuple object while they are among the recently used ones.
+    """
+    key = tuple(sorted(labels.items()))
+    with _LABEL_SETS_LOCK:
+        interned = _LABEL_SETS.get(key)
+        if interned is None:
+            interned = _LABEL_SETS.put(key, key)
+    return interned
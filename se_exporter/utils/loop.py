@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""This module contains EventLoopThread class."""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable
+
+from se_exporter.models.base import Base
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopThread(Base):
+    """This object represents a long-lived asyncio event loop running in a daemon thread.
+    Coroutines can be submitted to it from any other thread.
+    """
+    def __init__(self, name: str = "se-loop"):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        logger.debug(f"Event loop thread {name} started")
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive() and not self.loop.is_closed()
+
+    def run(self, coro: Awaitable, timeout: float = None) -> Any:
+        """Run the coroutine on the loop and block until it is done."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout)
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop the loop and wait for the thread to finish."""
+        if not self.running:
+            return
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self.loop.close()
+        logger.debug(f"Event loop thread {self.name} stopped")
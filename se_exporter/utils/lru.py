@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""This module contains LRUCache class."""
+
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from se_exporter.models.base import Base
+
+
+class LRUCache(Base):
+    """This object represents a mapping of limited size, which evicts least recently used items."""
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = max(maxsize, 1)
+        self._items = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            self._items.move_to_end(key)
+        except KeyError:
+            return default
+        return self._items[key]
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        self._items.clear()
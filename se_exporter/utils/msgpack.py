@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""This module contains packb function, a MessagePack encoder of JSON-like values.
+
+Only encoding is implemented, it's enough to serve snapshots in the compact binary format
+without the msgpack dependency. Integers, floats, strings, bytes, lists, tuples and dicts
+are packed in their shortest MessagePack representation, floats as float 64.
+"""
+
+import struct
+from typing import Any
+
+_UINT = ((0xff, b"\xcc", ">B"), (0xffff, b"\xcd", ">H"), (0xffffffff, b"\xce", ">I"), (2 ** 64 - 1, b"\xcf", ">Q"))
+_INT = ((2 ** 7, b"\xd0", ">b"), (2 ** 15, b"\xd1", ">h"), (2 ** 31, b"\xd2", ">i"), (2 ** 63, b"\xd3", ">q"))
+_STR = ((0xff, b"\xd9", ">B"), (0xffff, b"\xda", ">H"), (0xffffffff, b"\xdb", ">I"))
+_BIN = ((0xff, b"\xc4", ">B"), (0xffff, b"\xc5", ">H"), (0xffffffff, b"\xc6", ">I"))
+_ARRAY = ((0xffff, b"\xdc", ">H"), (0xffffffff, b"\xdd", ">I"))
+_MAP = ((0xffff, b"\xde", ">H"), (0xffffffff, b"\xdf", ">I"))
+
+
+def _header(out: bytearray, size: int, formats: tuple) -> None:
+    for limit, code, fmt in formats:
+        if size <= limit:
+            out += code + struct.pack(fmt, size)
+            return
+    raise ValueError(f"Value is too large for MessagePack: {size}")
+
+
+def _int(out: bytearray, value: int) -> None:
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -0x20 <= value < 0:
+        out.append(value & 0xff)
+    elif value > 0:
+        _header(out, value, _UINT)
+    else:
+        for limit, code, fmt in _INT:
+            if -value <= limit:
+                out += code + struct.pack(fmt, value)
+                return
+        raise ValueError(f"Integer is too small for MessagePack: {value}")
+
+
+def _pack(out: bytearray, value: Any) -> None:
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        _int(out, value)
+    elif isinstance(value, float):
+        out += b"\xcb" + struct.pack(">d", value)
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+        if len(encoded) < 32:
+            out.append(0xa0 | len(encoded))
+        else:
+            _header(out, len(encoded), _STR)
+        out += encoded
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _header(out, len(value), _BIN)
+        out += value
+    elif isinstance(value, (list, tuple)):
+        if len(value) < 16:
+            out.append(0x90 | len(value))
+        else:
+            _header(out, len(value), _ARRAY)
+        for item in value:
+            _pack(out, item)
+    elif isinstance(value, dict):
+        if len(value) < 16:
+            out.append(0x80 | len(value))
+        else:
+            _header(out, len(value), _MAP)
+        for key, item in value.items():
+            _pack(out, key)
+            _pack(out, item)
+    else:
+        raise TypeError(f"Can't pack {type(value).__name__} to MessagePack")
+
+
+def packb(value: Any) -> bytes:
+    """Returns the value packed to MessagePack bytes."""
+    out = bytearray()
+    _pack(out, value)
+    return bytes(out)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""This module contains RingBuffer class."""
+
+from array import array
+from typing import List
+
+from se_exporter.models.base import Base
+
+
+class RingBuffer(Base):
+    """This object represents a fixed-size buffer of timestamped samples backed by arrays of doubles.
+    The oldest sample is overwritten by a new one, so memory doesn't grow with time.
+    """
+    def __init__(self, capacity: int = 300):
+        self.capacity = max(capacity, 1)
+        self._timestamps = array("d", [float("-inf")]) * self.capacity
+        self._values = array("d", [0.0]) * self.capacity
+        self._position = 0
+
+    def append(self, timestamp: float, value: float) -> None:
+        position = self._position
+        self._values[position] = value
+        self._timestamps[position] = timestamp
+        self._position = (position + 1) % self.capacity
+
+    def window(self, seconds: float, now: float) -> List[float]:
+        """Returns values of samples taken within the last seconds, in no particular order."""
+        since = now - seconds
+        return [value for timestamp, value in zip(self._timestamps, self._values) if timestamp >= since]
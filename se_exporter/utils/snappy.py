@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""This module contains compress and decompress functions of the Snappy block format.
+
+Snappy is the compression of Prometheus remote write requests. The input is compressed in 64 KiB blocks,
+like the reference implementation, so every copy has a 2-byte offset. Matches are found through a hash
+table of 4-byte prefixes and extended by slices, and the search accelerates on incompressible data.
+"""
+
+_BLOCK_SIZE = 1 << 16
+_MIN_MATCH = 4
+_MAX_COPY = 64
+
+
+def _uvarint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _literal(out: bytearray, data: bytes, start: int, end: int) -> None:
+    size = end - start - 1
+    if size < 0:
+        return
+    if size < 60:
+        out.append(size << 2)
+    else:
+        encoded = size.to_bytes((size.bit_length() + 7) // 8, "little")
+        out.append((59 + len(encoded)) << 2)
+        out += encoded
+    out += data[start:end]
+
+
+def _copy(out: bytearray, offset: int, length: int) -> None:
+    encoded = offset.to_bytes(2, "little")
+    while length > 0:
+        size = min(length, _MAX_COPY)
+        if 0 < length - size < _MIN_MATCH:
+            size = length - _MIN_MATCH  # the last copy mustn't be too short to be worth it
+        out.append((size - 1) << 2 | 2)
+        out += encoded
+        length -= size
+
+
+def _match_length(data: bytes, candidate: int, position: int, end: int) -> int:
+    length = _MIN_MATCH
+    for step in (64, 8, 1):
+        while position + length + step <= end and \
+                data[candidate + length:candidate + length + step] == data[position + length:position + length + step]:
+            length += step
+    return length
+
+
+def _compress_block(out: bytearray, data: bytes, start: int, end: int) -> None:
+    table = {}
+    position = literal = start
+    misses = 0
+    limit = end - _MIN_MATCH
+
+    while position <= limit:
+        key = data[position:position + _MIN_MATCH]
+        candidate = table.get(key)
+        table[key] = position
+        if candidate is None:
+            misses += 1
+            position += 1 + (misses >> 5)
+            continue
+
+        length = _match_length(data, candidate, position, end)
+        _literal(out, data, literal, position)
+        _copy(out, position - candidate, length)
+        position += length
+        literal = position
+        misses = 0
+
+    _literal(out, data, literal, end)
+
+
+def compress(data: bytes) -> bytes:
+    """Returns the data compressed to the Snappy block format."""
+    data = bytes(data)
+    out = bytearray(_uvarint(len(data)))
+    for start in range(0, len(data), _BLOCK_SIZE):
+        _compress_block(out, data, start, min(start + _BLOCK_SIZE, len(data)))
+    return bytes(out)
+
+
+def _decompress(data: bytes) -> bytes:
+    size = shift = position = 0
+    while True:
+        byte = data[position]
+        position += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+
+    out = bytearray()
+    while position < len(data):
+        tag = data[position]
+        position += 1
+        kind = tag & 3
+
+        if kind == 0:
+            length = tag >> 2
+            if length >= 60:
+                extra = length - 59
+                length = int.from_bytes(data[position:position + extra], "little")
+                position += extra
+            length += 1
+            out += data[position:position + length]
+            position += length
+            continue
+
+        if kind == 1:
+            length = (tag >> 2 & 7) + 4
+            offset = (tag >> 5) << 8 | data[position]
+            position += 1
+        else:
+            length = (tag >> 2) + 1
+            extra = 2 if kind == 2 else 4
+            offset = int.from_bytes(data[position:position + extra], "little")
+            position += extra
+
+        if offset == 0 or offset > len(out):
+            raise ValueError(f"Bad Snappy copy offset: {offset}")
+        start = len(out) - offset
+        if offset >= length:
+            out += out[start:start + length]
+        else:
+            for i in range(length):
+                out.append(out[start + i])
+
+    if len(out) != size:
+        raise ValueError(f"Snappy data is corrupted, {len(out)} bytes decompressed instead of {size}")
+    return bytes(out)
+
+
+def decompress(data: bytes) -> bytes:
+    """Returns the data decompressed from the Snappy block format. Raises ValueError if it's corrupted."""
+    try:
+        return _decompress(data)
+    except IndexError:
+        raise ValueError("Snappy data is truncated") from None
@@ -0,0 +1,64 @@
+import threading
+from array import array
+
+from se_exporter.client.vrage import VRageAPI
+from se_exporter.utils.decoder import Columns
+
+
+class SlowIds:
+    """Entity IDs whose iteration waits until another collection has run, to interleave two collections."""
+    def __init__(self, ids: list, entered: threading.Event, other_done: threading.Event):
+        self.ids = ids
+        self.entered = entered
+        self.other_done = other_done
+
+    def __iter__(self):
+        self.entered.set()
+        self.other_done.wait(0.5)
+        return iter(self.ids)
+
+
+def floating_objects(ids) -> dict:
+    columns = Columns((("EntityId", "q"),))
+    columns.arrays["EntityId"] = ids
+    columns.count = len(ids.ids if isinstance(ids, SlowIds) else ids)
+    return {"floating_objects": columns}
+
+
+def churn(client: VRageAPI, ids) -> dict:
+    metrics = client._VRageAPI__map("session/floatingObjects", floating_objects(ids))
+    return {m.name: m.value for m in metrics if m.name.startswith("entity_")}
+
+
+def test_churn_totals():
+    client = VRageAPI(host="localhost", token="", entity_churn=True)
+    assert churn(client, array("q", [1, 2, 3])) == {"entity_created": 0, "entity_removed": 0}
+    assert churn(client, array("q", [2, 3, 4, 5])) == {"entity_created": 2, "entity_removed": 1}
+    assert churn(client, array("q", [2, 3, 4, 5])) == {"entity_created": 2, "entity_removed": 1}
+    assert churn(client, array("q", [6])) == {"entity_created": 3, "entity_removed": 5}
+
+
+def test_concurrent_collections_are_counted_once():
+    client = VRageAPI(host="localhost", token="", entity_churn=True)
+    churn(client, array("q", [1, 2, 3]))
+
+    entered, done = threading.Event(), threading.Event()
+    results = {}
+
+    def first():
+        results["first"] = churn(client, SlowIds([2, 3, 4], entered, done))
+
+    def second():
+        entered.wait(1)
+        results["second"] = churn(client, array("q", [2, 3, 4]))
+        done.set()
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # the second collection of the same IDs adds nothing on top of the first one
+    assert results["second"] == {"entity_created": 1, "entity_removed": 1}
+    assert churn(client, array("q", [2, 3, 4])) == {"entity_created": 1, "entity_removed": 1}
@@ -0,0 +1,68 @@
+import asyncio
+from time import monotonic
+
+from se_exporter.client.vrage import VRageAPI
+
+
+def throttled_client(deadline: float, latency: float, base_latency: float = 0) -> VRageAPI:
+    """Persistent async client backed off to one request at a time, whose requests take latency seconds,
+    base_latency for the server resource.
+    """
+    client = VRageAPI(
+        host="localhost",
+        token="",
+        persistent=True,
+        run_async=True,
+        timeout=5,
+        deadline=deadline,
+        adaptive_polling=True,
+        resource_intervals={res: 0 for res in VRageAPI.__RESOURCE_INTERVALS__}
+    )
+    client.throttle.level = client.throttle.max_level
+    assert client.concurrency == 1
+    client.timeouts = {}
+
+    async def get(name: str, timeout: float) -> dict:
+        client.timeouts[name] = timeout
+        if name == "server":
+            await asyncio.sleep(base_latency)
+            return {"sim_speed": 0.5, "server_name": "alpha", "world_name": "world"}
+        await asyncio.sleep(latency)
+        return {client.schemas[name].name: 1}
+
+    client._VRageAPI__aioget = get
+    return client
+
+
+def test_waves_share_the_deadline():
+    client = throttled_client(deadline=3, latency=0)
+    metrics = asyncio.run(client.acollect())
+
+    # nine resources in nine waves, every request gets a share of the deadline left instead of the timeout,
+    # except the server resource, which may take all of it
+    timeouts = list(client.timeouts.values())
+    assert len(timeouts) == 9
+    assert 3 - 0.05 <= timeouts[0] <= 3
+    for wave, timeout in enumerate(timeouts[1:], 1):
+        assert 3 / (9 - wave) - 0.05 <= timeout <= 3 / (9 - wave)
+    assert {m.name for m in metrics} >= {"sim_speed", "planets", "grids", "kicked_players"}
+
+
+def test_throttled_collection_returns_partial_results_by_the_deadline():
+    client = throttled_client(deadline=1, latency=1)
+    started = monotonic()
+    metrics = asyncio.run(asyncio.wait_for(client.acollect(), client.collection_timeout))
+
+    assert monotonic() - started < 1.5
+    assert [m.name for m in metrics] == ["sim_speed"]
+    assert client.breakers["session/grids"].consecutive_failures == 1
+
+
+def test_slow_server_resource_gets_the_time_left():
+    # as slow as the rest, it wouldn't fit into a ninth of the deadline
+    client = throttled_client(deadline=2, latency=1, base_latency=0.5)
+    started = monotonic()
+    metrics = asyncio.run(asyncio.wait_for(client.acollect(), client.collection_timeout))
+
+    assert monotonic() - started < 2.5
+    assert "sim_speed" in [m.name for m in metrics]
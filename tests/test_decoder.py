@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from se_exporter.utils.decoder import Schema, StreamDecoder
+
+
+def body(items: list) -> bytes:
+    return json.dumps({"data": {"Players": items}, "meta": {"apiVersion": "1.0"}}).encode("utf-8")
+
+
+def decode(schema: Schema, data: bytes, size: int) -> dict:
+    decoder = StreamDecoder(schema)
+    for start in range(0, len(data), size):
+        decoder.feed(data[start:start + size])
+    return decoder.result()
+
+
+@pytest.mark.parametrize("items", [
+    [76561197000000001, 76561197000000002, 76561197000000003],
+    [1.25, -3e10, 0, 42],
+    ["Player 1", 'Игрок "2" \\ ]', "Player 3"],
+    [True, None, False]
+])
+def test_scalar_elements_split_at_every_boundary(items):
+    data = body(items)
+    for size in range(1, len(data) + 1):
+        assert decode(Schema("players"), data, size) == {"players": len(items)}, f"chunk size {size}"
+
+
+def test_object_elements_split_at_every_boundary():
+    items = [{"SteamID": 76561197000000000 + i, "DisplayName": f"Player {i}", "Ping": 10 * i} for i in range(3)]
+    data = body(items)
+    expected = [{"SteamID": item["SteamID"], "Ping": item["Ping"]} for item in items]
+    for size in range(1, len(data) + 1):
+        result = decode(Schema("players", fields=("SteamID", "Ping")), data, size)
+        assert result == {"players": expected}, f"chunk size {size}"
+
+
+def test_columns_split_at_every_boundary():
+    items = [{"EntityId": 120000000 + i, "PCU": i} for i in range(4)]
+    data = body(items)
+    for size in range(1, len(data) + 1):
+        columns = decode(Schema("grids", columns=(("EntityId", "q"), ("PCU", "q"))), data, size)["grids"]
+        assert list(columns["EntityId"]) == [item["EntityId"] for item in items], f"chunk size {size}"
+        assert len(columns) == len(items)
+
+
+def test_empty_and_incomplete_arrays():
+    assert decode(Schema("players"), body([]), 1) == {"players": 0}
+    data = body([1, 2])
+    assert decode(Schema("players"), data[:data.index(b"]")], 4) is None
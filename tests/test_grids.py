@@ -0,0 +1,49 @@
+from se_exporter.client.vrage import VRageAPI
+from se_exporter.utils.decoder import Columns
+
+
+def grids(*rows) -> dict:
+    columns = Columns(VRageAPI.__GRID_SCHEMA__.columns)
+    for owner, pcu in rows:
+        columns.append({"OwnerSteamId": owner, "OwnerDisplayName": f"Owner {owner}", "PCU": pcu, "BlocksCount": 1})
+    return {"grids": columns}
+
+
+def players(*rows) -> dict:
+    return {"players": [{"SteamID": steam_id, "FactionName": faction, "Ping": 10} for steam_id, faction in rows]}
+
+
+def pcu_by_faction(metrics) -> dict:
+    return {dict(m.labels)["faction"]: m.value for m in metrics if m is not None and m.name == "grids_pcu_used"}
+
+
+def collect(client: VRageAPI, name: str, result: dict) -> None:
+    client._cache[name] = (0, client._VRageAPI__map(name, result))
+
+
+def test_grids_are_only_counted_by_default():
+    client = VRageAPI(host="localhost", token="")
+    assert client.schemas["session/grids"] == VRageAPI.__SCHEMAS__["session/grids"]
+
+
+def test_grids_are_grouped_by_factions_of_players():
+    client = VRageAPI(host="localhost", token="", grid_aggregation="faction")
+    collect(client, "session/players", players((1, "A"), (2, "B")))
+    collect(client, "session/grids", grids((1, 100), (2, 20), (3, 5)))
+
+    assert pcu_by_faction(client._cache["session/grids"][1]) == {"A": 100, "B": 20, "": 5}
+
+
+def test_cached_grids_are_grouped_again_when_an_owner_faction_changes():
+    client = VRageAPI(host="localhost", token="", grid_aggregation="faction", change_detection=True)
+    collect(client, "session/players", players((1, "A")))
+    collect(client, "session/grids", grids((1, 100), (2, 20)))
+    client._fingerprints["session/grids"] = b"fingerprint"
+
+    # an online player who doesn't own grids doesn't invalidate them
+    collect(client, "session/players", players((1, "A"), (4, "C")))
+    assert client._fingerprints["session/grids"] == b"fingerprint"
+
+    collect(client, "session/players", players((1, "B"), (2, "A")))
+    assert "session/grids" not in client._fingerprints
+    assert pcu_by_faction(client._cache["session/grids"][1]) == {"B": 100, "A": 20}
@@ -0,0 +1,15 @@
+from se_exporter.utils import helpers
+from se_exporter.utils.helpers import intern_labels
+
+
+def test_equal_label_sets_share_one_tuple():
+    first = intern_labels({"world": "w", "server": "s"})
+    second = intern_labels({"server": "s", "world": "w"})
+    assert first == (("server", "s"), ("world", "w"))
+    assert first is second
+
+
+def test_interned_label_sets_are_bounded():
+    for i in range(helpers._LABEL_SETS.maxsize * 2):
+        intern_labels({"server": str(i)})
+    assert len(helpers._LABEL_SETS) == helpers._LABEL_SETS.maxsize
@@ -0,0 +1,200 @@
+import math
+import struct
+
+import pytest
+
+from se_exporter.utils.msgpack import packb
+
+
+def unpack(data: bytes, position: int = 0) -> tuple:
+    """Decode one MessagePack value, returns it and the position after it."""
+    code = data[position]
+    position += 1
+
+    def read(fmt: str) -> tuple:
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, data[position:position + size])[0], position + size
+
+    def sequence(size: int, position: int, pairs: bool) -> tuple:
+        items = []
+        for _ in range(size * 2 if pairs else size):
+            item, position = unpack(data, position)
+            items.append(item)
+        if pairs:
+            return dict(zip(items[::2], items[1::2])), position
+        return items, position
+
+    if code < 0x80:
+        return code, position
+    if code >= 0xe0:
+        return code - 0x100, position
+    if code & 0xf0 == 0x80:
+        return sequence(code & 0x0f, position, pairs=True)
+    if code & 0xf0 == 0x90:
+        return sequence(code & 0x0f, position, pairs=False)
+    if code & 0xe0 == 0xa0:
+        size = code & 0x1f
+        return data[position:position + size].decode("utf-8"), position + size
+
+    fixed = {0xc0: None, 0xc2: False, 0xc3: True}
+    if code in fixed:
+        return fixed[code], position
+    numbers = {
+        0xcb: ">d", 0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q", 0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q"
+    }
+    if code in numbers:
+        return read(numbers[code])
+
+    sized = {
+        0xc4: (">B", "bin"), 0xc5: (">H", "bin"), 0xc6: (">I", "bin"),
+        0xd9: (">B", "str"), 0xda: (">H", "str"), 0xdb: (">I", "str"),
+        0xdc: (">H", "array"), 0xdd: (">I", "array"), 0xde: (">H", "map"), 0xdf: (">I", "map")
+    }
+    fmt, kind = sized[code]
+    size, position = read(fmt)
+    if kind == "bin":
+        return data[position:position + size], position + size
+    if kind == "str":
+        return data[position:position + size].decode("utf-8"), position + size
+    return sequence(size, position, pairs=kind == "map")
+
+
+def unpackb(data: bytes):
+    value, position = unpack(data)
+    assert position == len(data), "trailing bytes"
+    return value
+
+
+@pytest.mark.parametrize("value, prefix", [
+    (0, b"\x00"),
+    (0x7f, b"\x7f"),
+    (0x80, b"\xcc"),
+    (0xff, b"\xcc"),
+    (0x100, b"\xcd"),
+    (0xffff, b"\xcd"),
+    (0x10000, b"\xce"),
+    (0xffffffff, b"\xce"),
+    (0x100000000, b"\xcf"),
+    (2 ** 64 - 1, b"\xcf"),
+    (-1, b"\xff"),
+    (-32, b"\xe0"),
+    (-33, b"\xd0"),
+    (-128, b"\xd0"),
+    (-129, b"\xd1"),
+    (-2 ** 15, b"\xd1"),
+    (-2 ** 15 - 1, b"\xd2"),
+    (-2 ** 31, b"\xd2"),
+    (-2 ** 31 - 1, b"\xd3"),
+    (-2 ** 63, b"\xd3"),
+])
+def test_integers(value, prefix):
+    packed = packb(value)
+    assert packed.startswith(prefix)
+    assert unpackb(packed) == value
+
+
+@pytest.mark.parametrize("value", [2 ** 64, -2 ** 63 - 1])
+def test_integers_out_of_range(value):
+    with pytest.raises(ValueError):
+        packb(value)
+
+
+@pytest.mark.parametrize("value", [0.0, -0.0, 1.5, -1e300, 5e-324, math.inf])
+def test_floats(value):
+    packed = packb(value)
+    assert packed[:1] == b"\xcb" and len(packed) == 9
+    assert unpackb(packed) == value
+
+
+@pytest.mark.parametrize("size, prefix", [
+    (0, b"\xa0"),
+    (31, b"\xbf"),
+    (32, b"\xd9\x20"),
+    (255, b"\xd9\xff"),
+    (256, b"\xda\x01\x00"),
+    (0xffff, b"\xda\xff\xff"),
+    (0x10000, b"\xdb\x00\x01\x00\x00"),
+])
+def test_strings(size, prefix):
+    value = "s" * size
+    packed = packb(value)
+    assert packed.startswith(prefix)
+    assert unpackb(packed) == value
+
+
+def test_strings_are_sized_in_utf8_bytes():
+    value = "Ё" * 16  # 16 characters, 32 bytes
+    assert packb(value).startswith(b"\xd9\x20")
+    assert unpackb(packb(value)) == value
+
+
+@pytest.mark.parametrize("size, prefix", [
+    (0, b"\xc4\x00"),
+    (255, b"\xc4\xff"),
+    (256, b"\xc5\x01\x00"),
+    (0xffff, b"\xc5\xff\xff"),
+    (0x10000, b"\xc6\x00\x01\x00\x00"),
+])
+def test_binary(size, prefix):
+    value = b"\x01" * size
+    packed = packb(value)
+    assert packed.startswith(prefix)
+    assert unpackb(packed) == value
+
+
+@pytest.mark.parametrize("size, prefix", [
+    (0, b"\x90"),
+    (15, b"\x9f"),
+    (16, b"\xdc\x00\x10"),
+    (0xffff, b"\xdc\xff\xff"),
+    (0x10000, b"\xdd\x00\x01\x00\x00"),
+])
+def test_arrays(size, prefix):
+    value = list(range(size))
+    packed = packb(value)
+    assert packed.startswith(prefix)
+    assert unpackb(packed) == value
+    assert packb(tuple(value)) == packed
+
+
+@pytest.mark.parametrize("size, prefix", [
+    (0, b"\x80"),
+    (15, b"\x8f"),
+    (16, b"\xde\x00\x10"),
+    (0xffff, b"\xde\xff\xff"),
+    (0x10000, b"\xdf\x00\x01\x00\x00"),
+])
+def test_maps(size, prefix):
+    value = {f"k{i}": i for i in range(size)}
+    packed = packb(value)
+    assert packed.startswith(prefix)
+    assert unpackb(packed) == value
+
+
+def test_snapshot_like_value():
+    value = {
+        "labels": {"server": "alpha", "world": "star system"},
+        "server": {"sim_speed": 0.98, "players": 3, "is_ready": True, "game": None},
+        "players": [{"steam_id": 76561197960287930, "display_name": "Игрок", "ping": -1}],
+        "counts": {},
+    }
+    assert unpackb(packb(value)) == value
+
+
+def test_unsupported_types():
+    with pytest.raises(TypeError):
+        packb({1, 2})
+
+
+def test_interoperability_with_the_reference_implementation():
+    msgpack = pytest.importorskip("msgpack")
+    value = {
+        "int": [0, 0x7f, 0x80, 0xffff, 2 ** 64 - 1, -1, -33, -2 ** 63],
+        "float": [1.5, -0.0],
+        "str": ["", "s" * 31, "s" * 32, "s" * 0x10000],
+        "bin": b"\x00" * 300,
+        "array": list(range(16)),
+        "map": {str(i): i for i in range(16)},
+        "other": [None, True, False],
+    }
+    assert msgpack.unpackb(packb(value), raw=False) == value
@@ -0,0 +1,37 @@
+from se_exporter.client.vrage import VRageAPI
+
+
+def players(*pings) -> dict:
+    return {"players": [
+        {"SteamID": i, "DisplayName": f"Player {i}", "FactionName": "ABC", "Ping": ping}
+        for i, ping in enumerate(pings)
+    ]}
+
+
+def names(client: VRageAPI, result: dict) -> list:
+    return sorted({m.name for m in client._VRageAPI__map("session/players", result)})
+
+
+def test_ping_of_every_player_is_exported_under_the_limit():
+    client = VRageAPI(host="localhost", token="", player_ping_limit=3)
+    assert names(client, players(10, 20, 30)) == ["player_ping"]
+
+
+def test_only_ping_distribution_is_exported_over_the_limit():
+    client = VRageAPI(host="localhost", token="", player_ping_limit=2)
+    metrics = client._VRageAPI__map("session/players", players(10, 20, 3000))
+    assert [m.name for m in metrics] == ["player_ping_distribution"]
+
+    counts, total = metrics[0].value
+    assert sum(counts) == 3 and counts[-1] == 1
+    assert total == 3030
+
+
+def test_players_without_ping_are_skipped():
+    client = VRageAPI(host="localhost", token="", player_ping_limit=1)
+    metrics = client._VRageAPI__map("session/players", players(None, "15", 0, 40))
+    assert [(m.name, m.value) for m in metrics] == [("player_ping", 40)]
+
+    metrics = client._VRageAPI__map("session/players", players(None, 10, 40))
+    assert [m.name for m in metrics] == ["player_ping_distribution"]
+    assert sum(metrics[0].value[0]) == 2
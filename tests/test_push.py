@@ -0,0 +1,204 @@
+import struct
+import subprocess
+import sys
+
+import pytest
+
+from se_exporter.client.push import Pusher, PushSpool, encode_labels, encode_write_request
+from se_exporter.utils.snappy import decompress
+from prometheus_client import CollectorRegistry, Gauge
+
+SERIES = [
+    ([("__name__", "sim_speed"), ("server", "alpha"), ("world", "Ёжик")], [(0.987, 1700000000000), (1.0, 1700000015000)]),
+    ([("__name__", "players"), ("job", "se_exporter")], [(-3.5, 1)]),
+]
+
+# SERIES serialized by the reference protobuf implementation
+REFERENCE = bytes.fromhex(
+    "0a5f0a150a085f5f6e616d655f5f120973696d5f73706565640a0f0a067365727665721205616c7068610a110a05776f726c6412"
+    "08d081d0b6d0b8d0ba1210092fdd24068195ef3f1080d095ffbc31121009000000000000f03f1098c596ffbc310a360a130a085f"
+    "5f6e616d655f5f1207706c61796572730a120a036a6f62120b73655f6578706f72746572120b090000000000000cc01001"
+)
+
+
+def uvarint(data: bytes, position: int) -> tuple:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def fields(data: bytes) -> list:
+    """Decode protobuf wire format into (field number, value) pairs, length-delimited values are bytes."""
+    result = []
+    position = 0
+    while position < len(data):
+        key, position = uvarint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = uvarint(data, position)
+        elif wire_type == 1:
+            value = struct.unpack("<d", data[position:position + 8])[0]
+            position += 8
+        elif wire_type == 2:
+            size, position = uvarint(data, position)
+            value = data[position:position + size]
+            position += size
+        else:
+            raise ValueError(f"Unexpected wire type {wire_type}")
+        result.append((number, value))
+    return result
+
+
+def write_request(data: bytes) -> list:
+    """Decode a WriteRequest into [(labels, samples), ...]."""
+    series = []
+    for _, timeseries in fields(data):
+        labels, samples = [], []
+        for number, value in fields(timeseries):
+            message = dict(fields(value))
+            if number == 1:
+                labels.append((message[1].decode("utf-8"), message[2].decode("utf-8")))
+            else:
+                samples.append((message[1], message[2]))
+        series.append((labels, samples))
+    return series
+
+
+def encode(series: list) -> bytes:
+    return encode_write_request((encode_labels(labels), samples) for labels, samples in series)
+
+
+def test_write_request_matches_the_reference_encoding():
+    assert encode(SERIES) == REFERENCE
+
+
+def test_write_request_roundtrip():
+    series = SERIES + [
+        ([("__name__", "x" * 200), ("label", "")], [(float(2 ** 53), 2 ** 62), (1e-300, 0)]),
+        ([("__name__", "empty")], []),
+    ]
+    assert write_request(encode(series)) == series
+
+
+def test_spool_is_drained_in_order(tmp_path):
+    spool = PushSpool(str(tmp_path))
+    for body in (b"first", b"second", b"third"):
+        spool.put(body)
+    assert len(spool) == 3
+    assert spool.size == len(b"firstsecondthird")
+
+    drained = []
+    while spool.oldest() is not None:
+        name, body = spool.oldest()
+        drained.append(body)
+        spool.remove(name)
+    assert drained == [b"first", b"second", b"third"]
+    assert spool.size == 0
+    assert not list(tmp_path.iterdir())
+
+
+def test_spool_survives_restarts(tmp_path):
+    spool = PushSpool(str(tmp_path))
+    spool.put(b"first")
+    spool.put(b"second")
+    spool.remove(spool.oldest()[0])
+
+    spool = PushSpool(str(tmp_path))
+    spool.put(b"third")
+    assert len(spool) == 2
+    assert spool.oldest()[1] == b"second"
+    spool.remove(spool.oldest()[0])
+    assert spool.oldest()[1] == b"third"
+
+
+def test_spool_drops_the_oldest_batches_over_max_bytes(tmp_path):
+    spool = PushSpool(str(tmp_path), max_bytes=10)
+    for body in (b"aaaa", b"bbbb", b"cccc", b"dddd"):
+        spool.put(body)
+    assert len(spool) == 2
+    assert spool.size == 8
+    assert spool.oldest()[1] == b"cccc"
+
+    # the newest batch is kept even if it's over max_bytes alone
+    spool.put(b"e" * 20)
+    assert len(spool) == 1
+    assert spool.oldest()[1] == b"e" * 20
+
+
+class Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.text = ""
+
+
+class Receiver:
+    """Session stub which answers with the given statuses and keeps delivered series."""
+    def __init__(self):
+        self.statuses = []
+        self.delivered = []
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status < 300:
+            self.delivered.append(write_request(decompress(data)))
+        return Response(status)
+
+
+@pytest.fixture
+def pusher(tmp_path):
+    registry = CollectorRegistry()
+    pusher = Pusher("http://receiver/api/v1/write", poller=None, registry=registry, spool_dir=str(tmp_path))
+    pusher.gauge = Gauge("batch", "Number of the batch", registry=registry)
+    pusher._session = Receiver()
+    return pusher
+
+
+def push(pusher: Pusher, batch: int) -> None:
+    pusher.gauge.set(batch)
+    pusher.sample()
+    pusher.flush()
+
+
+def batches(receiver: Receiver) -> list:
+    return [samples[0][0] for delivered in receiver.delivered for labels, samples in delivered]
+
+
+def test_undelivered_batches_are_replayed_in_order(pusher):
+    receiver = pusher._session
+    receiver.statuses = [503, 429]
+    push(pusher, 1)  # 503, spooled
+    assert len(pusher.spool) == 1
+
+    push(pusher, 2)  # queued behind the spooled batch, which gets 429
+    assert len(pusher.spool) == 2
+    assert receiver.delivered == []
+
+    push(pusher, 3)
+    assert batches(receiver) == [1, 2, 3]
+    assert len(pusher.spool) == 0
+
+
+def test_rejected_batches_are_dropped(pusher):
+    receiver = pusher._session
+    receiver.statuses = [400]
+    push(pusher, 1)
+    assert len(pusher.spool) == 0
+
+    push(pusher, 2)
+    assert batches(receiver) == [2]
+
+
+def test_pull_mode_doesnt_export_push_metrics():
+    script = (
+        "import se_exporter.client.prometheus\n"
+        "from prometheus_client import REGISTRY, generate_latest\n"
+        "print(generate_latest(REGISTRY).decode())"
+    )
+    exposition = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    assert "se_vrage_errors" in exposition
+    assert "se_push_" not in exposition
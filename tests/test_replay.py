@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+import pytest
+
+from se_exporter.client.capture import CaptureReader, CaptureWriter
+from se_exporter.client.vrage import VRageAPI
+
+
+def body(data: dict) -> bytes:
+    return json.dumps({"data": data, "meta": {"apiVersion": "1.0"}}).encode("utf-8")
+
+
+@pytest.fixture
+def capture(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    writer = CaptureWriter(path)
+    writer.write("alpha", "server", 200, body({"ServerName": "Alpha", "WorldName": "World", "SimSpeed": 0.5}))
+    writer.write("alpha", "session/players", 200, body({"Players": [{"SteamID": 1, "Ping": 10}]}))
+    writer.close()
+    return path
+
+
+@pytest.fixture
+def no_sessions(monkeypatch):
+    import aiohttp
+    import requests
+
+    def session(*args, **kwargs):
+        raise AssertionError("A session was created in replay mode")
+
+    monkeypatch.setattr(requests, "Session", session)
+    monkeypatch.setattr(aiohttp, "ClientSession", session)
+
+
+def test_replay_doesnt_create_sessions(capture, no_sessions):
+    client = VRageAPI(host="localhost", token="", name="alpha", replay=CaptureReader(capture, speed="max"))
+    assert client.get_metric("server")["sim_speed"] == 0.5
+    assert [m.value for m in client.get_metric("session/players") if m.name == "player_ping"] == [10]
+
+    assert asyncio.run(client.aioget_metric("server"))["sim_speed"] == 0.5
+    assert [m.value for m in asyncio.run(client.aioget_metric("session/players")) if m.name == "player_ping"] == [10]
@@ -0,0 +1,64 @@
+import os
+import random
+
+import pytest
+
+from se_exporter.utils.snappy import compress, decompress
+
+# compressed by the reference implementation of Snappy
+REFERENCE = [
+    (b"", bytes.fromhex("00")),
+    (b"a", bytes.fromhex("010061")),
+    (b"abcd" * 40, bytes.fromhex("a0010c61626364fe0400fe04006e0400")),
+    (b"Hello, Hello, Hello, world!", bytes.fromhex("1b1848656c6c6f2c2036070014776f726c6421")),
+]
+
+
+def samples() -> list:
+    rand = random.Random(42)
+    data = [
+        b"",
+        b"x",
+        b"\x00" * 200000,
+        bytes(range(256)) * 300,
+        b'se_player_ping{faction="ABC",player_name="Player"} 42\n' * 3000,
+        os.urandom(70000),
+    ]
+    # lengths around the 64 KiB block boundary and literal length encodings
+    for size in (59, 60, 61, 255, 256, 257, 65535, 65536, 65537, 131073):
+        data.append(bytes(rand.choice(b"abc") for _ in range(size)))
+    return data
+
+
+@pytest.mark.parametrize("data, compressed", REFERENCE)
+def test_reference_streams(data, compressed):
+    assert compress(data) == compressed
+    assert decompress(compressed) == data
+
+
+@pytest.mark.parametrize("data", samples(), ids=lambda data: f"{len(data)} bytes")
+def test_roundtrip(data):
+    assert decompress(compress(data)) == data
+
+
+def test_overlapping_copy():
+    # a literal "ab" followed by a copy of 10 bytes at offset 2, which overlaps its own output
+    assert decompress(bytes.fromhex("0c") + b"\x04ab" + bytes([(10 - 1) << 2 | 2, 2, 0])) == b"ab" * 6
+
+
+@pytest.mark.parametrize("corrupted", [
+    bytes.fromhex("0400610a0500"),  # a copy offset past the decompressed data
+    bytes.fromhex("050061"),  # a declared length longer than the data
+    bytes.fromhex("05000061"),  # a copy cut off after its tag
+    b"",  # no length
+])
+def test_corrupted_streams(corrupted):
+    with pytest.raises(ValueError):
+        decompress(corrupted)
+
+
+def test_interoperability_with_the_reference_implementation():
+    cramjam = pytest.importorskip("cramjam")
+    for data in samples():
+        assert bytes(cramjam.snappy.decompress_raw(compress(data))) == data
+        assert decompress(bytes(cramjam.snappy.compress_raw(data))) == data